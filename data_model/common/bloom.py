@@ -0,0 +1,86 @@
+# Local filters of known values
+# Author: Zex Li <top_zlynch@yahoo.com>
+import gzip
+import math
+import struct
+import ujson
+from hashlib import blake2b
+
+
+class BloomFilter(object):
+    """
+    Bloom filter over string values, persistable to disk
+
+    A hit means the value was probably added, with false positive
+    rate about `error_rate`, a miss means it was never added
+    """
+
+    # Hits are to be confirmed
+    exact = False
+
+    HEADER = struct.Struct('<QQQ')
+
+    def __init__(self, capacity=1000000, error_rate=1e-6):
+        """
+        Args:
+
+        capacity: Expected number of values
+        error_rate: Expected false positive rate at `capacity`
+        """
+        self.nbits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.nhashes = max(1, int(round(self.nbits / capacity * math.log(2))))
+        self.count = 0
+        self._bits = bytearray((self.nbits + 7) // 8)
+
+    def _positions(self, value):
+        digest = blake2b(str(value).encode(), digest_size=16).digest()
+        h1, h2 = struct.unpack('<QQ', digest)
+        return ((h1 + i * h2) % self.nbits for i in range(self.nhashes))
+
+    def add(self, value):
+        for pos in self._positions(value):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def update(self, values):
+        _ = [self.add(v) for v in values]
+
+    def __contains__(self, value):
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(value))
+
+    def __len__(self):
+        return self.count
+
+    def save(self, path):
+        with open(path, 'wb') as fd:
+            fd.write(BloomFilter.HEADER.pack(self.nbits, self.nhashes, self.count))
+            fd.write(self._bits)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as fd:
+            nbits, nhashes, count = cls.HEADER.unpack(fd.read(cls.HEADER.size))
+            obj = cls.__new__(cls)
+            obj.nbits, obj.nhashes, obj.count = nbits, nhashes, count
+            obj._bits = bytearray(fd.read())
+        return obj
+
+
+class KnownSet(set):
+    """
+    Exact set of known values, persistable to disk as gzipped
+    JSON lines, one value per line
+    """
+
+    exact = True
+
+    def save(self, path):
+        with gzip.open(path, 'wt', encoding='utf-8') as fd:
+            for value in self:
+                fd.write(ujson.dumps(value))
+                fd.write('\n')
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, 'rt', encoding='utf-8') as fd:
+            return cls(ujson.loads(line) for line in fd if line.strip())
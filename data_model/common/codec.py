@@ -0,0 +1,133 @@
+# Codec registry for fat fields
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Encoded blob layout:
+#   MAGIC | len(name) | name | payload
+# Values written by `json_zip` carry no header, they are recognized by
+# gzip magic and decoded as `gzip`
+import bz2
+import gzip
+import lzma
+import zlib
+import ujson
+from data_model.dynamodb.common.utils import simple_zip, simple_unzip
+
+
+MAGIC = b'\x00MZ'
+GZIP_MAGIC = b'\x1f\x8b'
+DEFAULT_CODEC = 'gzip'
+
+_codecs = {}
+# Codecs decoded only when the reader allows them, \sa decode
+_unsafe = set()
+
+
+def register_codec(name, encode, decode, safe=True):
+    """
+    Register codec `name`
+
+    Args:
+    name: Codec name, at most 255 bytes in ascii
+    encode: Function converts python object to bytes
+    decode: Function converts bytes to python object
+    safe: `False` if decoding may run code from the blob, such codec
+          is decoded only when allowed by the reader
+    """
+    if len(name.encode()) > 255:
+        raise ValueError("Codec name too long: {}".format(name))
+    _codecs[name] = (encode, decode)
+    if safe:
+        _unsafe.discard(name)
+    else:
+        _unsafe.add(name)
+
+
+def get_codec(name):
+    if name not in _codecs:
+        raise KeyError("Codec {} not registered".format(name))
+    return _codecs[name]
+
+
+def list_codecs():
+    return list(_codecs)
+
+
+def encode(data, codec=DEFAULT_CODEC):
+    """
+    Encode `data` with `codec`, prefixed by codec header
+
+    @return `bytes`, `None` for empty data
+    """
+    if not data:
+        return None
+    enc, _ = get_codec(codec)
+    if codec == 'gzip':
+        return enc(data)
+    name = codec.encode()
+    return b''.join((MAGIC, bytes((len(name),)), name, enc(data)))
+
+
+def decode(blob, allow=()):
+    """
+    Decode `blob` with codec named in its header
+
+    Args:
+    blob: Encoded bytes
+    allow: Names of unsafe codecs `blob` may be decoded with, blobs of other
+           unsafe codecs raise `ValueError`
+    """
+    if not blob:
+        return None
+    view = memoryview(blob)
+    if view[:2] == GZIP_MAGIC:
+        return _codecs['gzip'][1](view)
+    if view[:len(MAGIC)] != MAGIC:
+        raise ValueError("Unknown blob format")
+    offset = len(MAGIC) + 1
+    name = bytes(view[offset:offset+view[len(MAGIC)]]).decode()
+    if name in _unsafe and name not in allow:
+        raise ValueError("Codec {} not allowed".format(name))
+    return get_codec(name)[1](view[offset+len(name):])
+
+
+def codec_of(blob):
+    """
+    @return Name of codec `blob` encoded with
+    """
+    view = memoryview(blob)
+    if view[:2] == GZIP_MAGIC:
+        return 'gzip'
+    return bytes(view[len(MAGIC)+1:len(MAGIC)+1+view[len(MAGIC)]]).decode()
+
+
+class LazyBlob(object):
+    """
+    Encoded value waiting to be decoded on first access
+    """
+
+    __slots__ = ('raw', 'allow')
+
+    def __init__(self, raw, allow=()):
+        self.raw = raw
+        self.allow = allow
+
+    def decode(self):
+        return decode(self.raw, self.allow)
+
+    def __len__(self):
+        return len(self.raw)
+
+
+def _json_codec(compress, decompress):
+    return lambda data: compress(ujson.dumps(data).encode()), \
+           lambda raw: ujson.loads(decompress(raw))
+
+
+register_codec('gzip', *_json_codec(gzip.compress, gzip.decompress))
+for level in range(1, 10):
+    register_codec('zlib{}'.format(level), *_json_codec(\
+            lambda raw, level=level: zlib.compress(raw, level), zlib.decompress))
+register_codec('lzma', *_json_codec(lzma.compress, lzma.decompress))
+register_codec('bz2', *_json_codec(bz2.compress, bz2.decompress))
+register_codec('raw', *_json_codec(bytes, bytes))
+register_codec('pickle', simple_zip, lambda raw: simple_unzip(bytes(raw)), safe=False)
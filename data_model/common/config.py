@@ -1,19 +1,74 @@
 # Configure holder
 # Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Values are read from environment on first access, `dydb_endpoint` from
+# `DYDB_ENDPOINT`, known keys are converted to their type
 import os
 import string
 
+
+def to_bool(val):
+    return val.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
 class Config(object):
 
+    # Known keys and their types, others are strings
+    KEYS = {
+            'dydb_backend': str,
+            'dydb_endpoint': str,
+            'dydb_region': str,
+            'dydb_local_path': str,
+            'dydb_capacity_fraction': float,
+            'dydb_max_pool_connections': int,
+            'dydb_connect_timeout': float,
+            'dydb_read_timeout': float,
+            'dydb_keepalive': to_bool,
+            'dydb_max_attempts': int,
+            }
+
     def __init__(self):
         self.load_config()
 
     def load_config(self):
-        self.load_config_env()
+        """
+        Forget values resolved so far, they are read again on next access
+        """
+        self.__dict__.clear()
+        self._names = None
 
     def load_config_env(self):
-        {setattr(self, k.lower().lstrip(string.digits+string.punctuation), v) \
-                for k, v in os.environ.items() if k}
+        """
+        Resolve all environment variables at once
+        """
+        _ = [getattr(self, k, None) for k in self._env_names()]
+
+    def _env_names(self):
+        # Attribute names of environment variables, eg. `1_FOO` as `foo`
+        if self._names is None:
+            self._names = {k.lower().lstrip(string.digits+string.punctuation): k \
+                    for k in os.environ if k}
+        return self._names
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+
+        key = name.upper()
+        if key not in os.environ:
+            key = self._env_names().get(name)
+        if key is None or key not in os.environ:
+            raise AttributeError("{} not set".format(name.upper()))
+
+        val = os.environ[key]
+        conv = Config.KEYS.get(name)
+        if conv and val != '':
+            try:
+                val = conv(val)
+            except ValueError:
+                raise ValueError("{} expects {}, got {}".format(key, conv.__name__, val))
+        object.__setattr__(self, name, val)
+        return val
 
     def raise_on_not_set(self, name):
         if not hasattr(self, name):
@@ -11,6 +11,7 @@ class ProcessStage(Enum):
 @unique
 class GSI(Enum):
     SOURCE_UNIQUE = 'source_unique_index'
+    DATA_TYPE = 'data_type_index'
 
 
 @unique
@@ -20,7 +21,59 @@ class ItemID(Enum):
 @unique
 class ItemType(Enum):
     REPOSITORY = 'MARLENE_REPOSITORY'
-    
+
+
+class IndexSpec(object):
+    """
+    Key schema and projection of a table or a global secondary index
+
+    Args:
+    hash_key: Name of hash key
+    range_key: Name of range key, if any
+    projection: `ALL`, `KEYS_ONLY` or `INCLUDE`
+    include: Names of non-key attributes projected for `INCLUDE`
+    unique: If `True`, each hash key value matches at most one item
+    """
+
+    def __init__(self, hash_key, range_key=None, projection='ALL', include=(), unique=False):
+        self.hash_key = hash_key
+        self.range_key = range_key
+        self.projection = projection
+        self.include = tuple(include)
+        self.unique = unique
+
+    @property
+    def keys(self):
+        return tuple(k for k in (self.hash_key, self.range_key) if k)
+
+    def projects(self, fields, table_keys=()):
+        """
+        Whether all of `fields` are in the index, `None` for all attributes,
+        keys of the table are always projected
+        """
+        if self.projection == 'ALL':
+            return True
+        if fields is None:
+            return False
+        extra = self.include if self.projection == 'INCLUDE' else ()
+        return set(fields) <= set(self.keys) | set(table_keys) | set(extra)
+
+    def __repr__(self):
+        return '{}({}, {}, {})'.format(type(self).__name__, self.hash_key, self.range_key, self.projection)
+
+
+# Key schemas of each table, `None` for the table itself, `GSI` for its indexes,
+# indexes missing from the table description are skipped by the planner
+# \sa data_model.dynamodb.core.planner
+INDEXES = {
+    ItemType.REPOSITORY: {
+        None: IndexSpec(ItemID.REPOSITORY.value, unique=True),
+        GSI.SOURCE_UNIQUE: IndexSpec('source_unique', projection='INCLUDE', include=('data_type',), unique=True),
+        GSI.DATA_TYPE: IndexSpec('data_type', 'updated_ts'),
+    },
+}
+
 
 MAX_SLICE_SIZE = 390 * 1024 # in bytes
+MAX_ITEM_SIZE = 400 * 1024 # in bytes, of a whole item
 NAN = "nan"
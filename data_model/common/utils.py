@@ -1,9 +1,14 @@
 # Utilities go here
 # Author: Zex Li <top_zlynch@yahoo.com>
+import contextvars
 import ujson
 import gzip
 import pickle
-import sys
+import random
+from importlib import import_module
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import Empty, Full, Queue
+from threading import Lock, Thread
 
 
 def clean_items(self, items, item):
@@ -36,32 +41,244 @@ def json_unzip(data):
 
 def split_chunks(raw, max_chunk):
     """
-    Split raw bytes into chunks in place
+    Split raw bytes into chunks without copying
 
     Args:
     raw: Byte sequence
     max_chunk: Max size of each chunk
-    """
-    chunks = []
-    end = max_chunk-sys.getsizeof(b'')
 
-    while sys.getsizeof(raw) > max_chunk:
-        chunks.append(raw[:end])
-        raw = raw[end:]
-    if sys.getsizeof(raw) > 0:
-        chunks.append(raw)
-        raw = []
-    return chunks
+    @return List of `memoryview` over `raw`
+    """
+    view = memoryview(raw)
+    return [view[i:i+max_chunk] for i in range(0, len(view), max_chunk)]
 
 
 def rebuild_chunks(chunks):
     """
-    Rebuild raw bytes sequence from chunks in place
+    Rebuild raw bytes sequence from chunks into one preallocated buffer
 
     Args:
     chunks: List of chunks
+
+    @return `bytearray`
     """
-    raw = b''
-    while chunks:
-        raw += chunks.pop(0)
+    raw = bytearray(sum(map(len, chunks)))
+    view, offset = memoryview(raw), 0
+    for chunk in chunks:
+        view[offset:offset+len(chunk)] = chunk
+        offset += len(chunk)
     return raw
+
+
+def backoff_delay(attempt, base=0.05, cap=5.0):
+    """
+    Exponential backoff with full jitter
+
+    Args:
+    attempt: Number of attempts already made, starts from 0
+    base: Delay of the first attempt in seconds
+    cap: Max delay in seconds
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def iter_chunks(seq, size):
+    """
+    Split sequence into lists of at most `size` elements
+
+    Args:
+    seq: Sequence or iterable to split
+    size: Max size of each chunk
+    """
+    chunk = []
+    for x in seq:
+        chunk.append(x)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class LazyAttr(object):
+    """
+    Stand-in of attribute `name` of `module`, the module is imported on
+    first use, so importing heavy dependencies like boto3 is put off
+    until actually needed
+
+    Calls, attribute access and `isinstance` go to the attribute, eg.
+    \code
+        Key = LazyAttr('boto3.dynamodb.conditions', 'Key')
+        Key('source_unique').eq('P12395')
+    \endcode
+    """
+
+    __slots__ = ('_module', '_name', '_target')
+
+    def __init__(self, module, name):
+        self._module = module
+        self._name = name
+        self._target = None
+
+    def resolve(self):
+        if self._target is None:
+            self._target = getattr(import_module(self._module), self._name)
+        return self._target
+
+    def __call__(self, *args, **kwargs):
+        return (self._target or self.resolve())(*args, **kwargs)
+
+    def __instancecheck__(self, obj):
+        return isinstance(obj, self._target or self.resolve())
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+    def __repr__(self):
+        return '<lazy {}.{}>'.format(self._module, self._name)
+
+
+def get_executor(kind='thread', workers=None):
+    """
+    Get shared executor
+
+    Args:
+    kind: `thread` or `process`
+    workers: Max number of workers
+    """
+    name = 'executor:{}:{}'.format(kind, workers)
+    if not globals().get(name):
+        if kind == 'process':
+            from concurrent.futures import ProcessPoolExecutor as pool
+        else:
+            pool = ThreadPoolExecutor
+        globals()[name] = pool(workers)
+    return globals().get(name)
+
+
+class ContextThreadPool(ThreadPoolExecutor):
+    """
+    `ThreadPoolExecutor` running each task in a copy of the context it
+    is submitted in, context variables set by the caller apply to its tasks
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class ThreadCache(object):
+    """
+    Unbounded pool of reusable daemon threads, a task runs on an idle
+    thread if any, on a new one otherwise, threads idle for `idle` seconds exit
+
+    Tasks may block as long as they need, eg. producers of bounded queues,
+    without holding up others, threads live across calls so state kept per
+    thread, eg. sessions of `ConnectionPool`, is reused, each task runs in a
+    copy of the context it is submitted in
+
+    Args:
+    idle: Seconds an idle thread waits for a task, `IDLE` by default
+    """
+
+    IDLE = 300
+
+    def __init__(self, idle=None):
+        self.idle = idle or ThreadCache.IDLE
+        self._tasks = Queue()
+        self._lock = Lock()
+        # Idle threads not reserved by a task queued
+        self._free = 0
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Run `fn` with arguments on a cached thread
+
+        @return `Future` of the result
+        """
+        fut = Future()
+        with self._lock:
+            spawn = not self._free
+            if not spawn:
+                self._free -= 1
+            self._tasks.put((fut, contextvars.copy_context().run, (fn,) + args, kwargs))
+        if spawn:
+            Thread(target=self._run, daemon=True).start()
+        return fut
+
+    def _run(self):
+        while True:
+            try:
+                fut, fn, args, kwargs = self._tasks.get(timeout=self.idle)
+            except Empty:
+                with self._lock:
+                    # A task queued meanwhile counts on this thread
+                    if not self._tasks.empty():
+                        continue
+                    self._free -= 1
+                    return
+            if fut.set_running_or_notify_cancel():
+                try:
+                    fut.set_result(fn(*args, **kwargs))
+                except BaseException as ex:
+                    fut.set_exception(ex)
+            del fut, fn, args, kwargs
+            with self._lock:
+                self._free += 1
+
+
+def get_thread_cache():
+    """
+    Shared `ThreadCache`
+    """
+    if not globals().get('thread_cache'):
+        globals()['thread_cache'] = ThreadCache()
+    return globals().get('thread_cache')
+
+
+def prefetch(gen, depth=1):
+    """
+    Run generator in a thread of the shared `ThreadCache`, at most `depth`
+    values ahead of the consumer
+
+    Args:
+    gen: Generator to run
+    depth: Max number of values buffered
+
+    @return Generator
+    """
+    done = object()
+    que = Queue(max(1, depth))
+    stopped = []
+
+    def put(val):
+        while not stopped:
+            try:
+                que.put(val, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def worker():
+        try:
+            for val in gen:
+                if not put((val, None)):
+                    break
+            put((done, None))
+        except Exception as ex:
+            put((done, ex))
+        finally:
+            if hasattr(gen, 'close'):
+                gen.close()
+
+    get_thread_cache().submit(worker)
+    try:
+        while True:
+            val, ex = que.get()
+            if val is done:
+                if ex:
+                    raise ex
+                return
+            yield val
+    finally:
+        stopped.append(True)
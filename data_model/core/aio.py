@@ -0,0 +1,136 @@
+# Asyncio broker
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Runs blocking `TableBroker` calls in a bounded executor so they never
+# block the event loop
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from weakref import WeakKeyDictionary
+from data_model.dynamodb.core.broker import get_brk, TableBroker
+
+
+class AsyncTableBroker(object):
+
+    MAX_INFLIGHT = 16
+    name = 'atbbrk'
+
+    def __init__(self, table_type, max_inflight=None, brk=None):
+        """
+        Args:
+
+        table_type: Table name
+        max_inflight: Max number of requests in flight of each event loop,
+                `MAX_INFLIGHT` by default
+        brk: A `TableBroker` to wrap, the one shared with sync callers by
+                default, so cache, write-behind buffer and governor are shared
+        """
+        super(AsyncTableBroker, self).__init__()
+        self._max_inflight = max_inflight or AsyncTableBroker.MAX_INFLIGHT
+        if brk is None:
+            item_id = {v.value:k for k, v in TableBroker.ITEMID_TABLETYPE.items()}[table_type]
+            brk = get_brk(item_id)
+        self._brk = brk
+        self._table_name = self._brk._table_name
+        self._pool = ThreadPoolExecutor(self._max_inflight)
+        # Semaphores are bound to the loop they are first used in
+        self._sems = WeakKeyDictionary()
+
+    def _sem(self):
+        loop = asyncio.get_running_loop()
+        sem = self._sems.get(loop)
+        if sem is None:
+            sem = self._sems[loop] = asyncio.Semaphore(self._max_inflight)
+        return sem
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run blocking `fn` in executor, at most `max_inflight` at a time
+        in each event loop
+        """
+        async with self._sem():
+            return await asyncio.get_running_loop().run_in_executor(
+                    self._pool, partial(fn, *args, **kwargs))
+
+    async def uniq_put(self, item, **kwargs):
+        return await self.run(self._brk.uniq_put, item, **kwargs)
+
+    async def put(self, item, **kwargs):
+        return await self.run(self._brk.put, item, **kwargs)
+
+    async def batch_put(self, items, **kwargs):
+        return await self.run(self._brk.batch_put, list(items), **kwargs)
+
+    async def _get(self, key_dict, **kwargs):
+        return await self.run(self._brk._get, key_dict, **kwargs)
+
+    async def _query(self, cond=None, ind=None, **kwargs):
+        return await self.run(self._brk._query, cond, ind, **kwargs)
+
+    async def _scan(self, filter_expr=None, **kwargs):
+        return await self.run(self._brk._scan, filter_expr, **kwargs)
+
+    async def _update(self, key_dict, update_dict, **kwargs):
+        return await self.run(self._brk._update, key_dict, update_dict, **kwargs)
+
+    async def _delete(self, key_dict, **kwargs):
+        return await self.run(self._brk._delete, key_dict, **kwargs)
+
+    async def batch_delete(self, key_dicts, **kwargs):
+        return await self.run(self._brk.batch_delete, key_dicts, **kwargs)
+
+    async def _batch_get(self, keys, **kwargs):
+        return await self.run(self._brk._batch_get, keys, **kwargs)
+
+    async def item_exists(self, source_unique):
+        return await self.run(self._brk.item_exists, source_unique)
+
+    async def _iscan(self, filter_expr=None, **kwargs):
+        """
+        Async counterpart of `TableBroker._iscan`
+
+        @return Async generator
+        """
+        async for rsp in self.aiter(self._brk._iscan(filter_expr, **kwargs)):
+            yield rsp
+
+    async def _iquery(self, cond, ind=None, **kwargs):
+        """
+        Async counterpart of `TableBroker._iquery`
+
+        @return Async generator
+        """
+        async for rsp in self.aiter(self._brk._iquery(cond, ind, **kwargs)):
+            yield rsp
+
+    async def aiter(self, gen):
+        """
+        Drive blocking generator `gen` in executor page by page
+
+        @return Async generator
+        """
+        done = object()
+        try:
+            while True:
+                rsp = await self.run(next, gen, done)
+                if rsp is done:
+                    break
+                yield rsp
+        finally:
+            gen.close()
+
+
+def get_async_brk(item_id):
+    """
+    Async broker of table for `item_id`, wraps the broker of `get_brk`,
+    usable from any event loop
+    """
+    tbtype = TableBroker.ITEMID_TABLETYPE[item_id]
+    name = '{}:{}'.format(AsyncTableBroker.name, tbtype.value)
+    brk = get_brk(item_id)
+    abrk = globals().get(name)
+    if not abrk or abrk._brk is not brk:
+        if abrk:
+            abrk._pool.shutdown(wait=False)
+        globals()[name] = abrk = AsyncTableBroker(tbtype.value, brk=brk)
+    return abrk
@@ -3,17 +3,42 @@
 #
 #\sa https://boto3.readthedocs.io/en/latest/_modules/boto3/dynamodb/conditions.html
 #from abc import abstractmethod
+import time
 import ujson
-import boto3
-from boto3.dynamodb.conditions import Key, Attr
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from queue import Queue
 from data_model.dynamodb.common.config import get_config
 from data_model.dynamodb.common.shared import GSI, ItemID, ItemType
-from data_model.utils import get_boto3_service
+from data_model.dynamodb.common.utils import ContextThreadPool, LazyAttr, backoff_delay, get_thread_cache, \
+        iter_chunks
+from data_model.dynamodb.core.buffer import WriteBuffer
+from data_model.dynamodb.core.cache import ItemCache
+from data_model.dynamodb.core.governor import Governor, THROTTLE_ERRORS, consumed_capacity, error_code, \
+        unprocessed_count
+from data_model.dynamodb.core.metrics import get_metrics, item_bytes
+from data_model.dynamodb.core.pool import get_pool
+
+Key = LazyAttr('boto3.dynamodb.conditions', 'Key')
+Attr = LazyAttr('boto3.dynamodb.conditions', 'Attr')
+
+# Governors of `TableBroker.governed` blocks by table name, in effect for
+# calls of the block and tasks it submits, others keep the shared one
+GOVERNED = ContextVar('governed', default={})
 
 
 class TableBroker(object):
 
     CHUNKSIZE = 256
+    SEGMENT_BUFSIZE = 2
+    BATCH_GET_SIZE = 100
+    BATCH_GET_WORKERS = 8
+    UNIQ_WORKERS = 16
+    UNIQ_CHUNKSIZE = 1000
+    BATCH_WRITE_SIZE = 25
+    BATCH_WRITE_WORKERS = 4
+    MAX_RETRIES = 8
     name = 'tbbrk'
     
     ITEMID_TABLETYPE = {getattr(ItemID, x):getattr(ItemType, x) for x in ItemID.__members__}
@@ -23,7 +48,188 @@ class TableBroker(object):
         config = get_config()
 
         self._table_name = table_type
-        self._table = get_dydb().Table(self._table_name)
+        self._id_name = {v.value:k.value for k, v in TableBroker.ITEMID_TABLETYPE.items()}.get(table_type)
+        self.cache = None
+        self.buffer = None
+        self.governor = get_governor(table_type)
+        self.metrics = get_metrics()
+
+        fraction = getattr(config, 'dydb_capacity_fraction', None)
+        if fraction:
+            self.enable_governor(fraction=fraction)
+
+    @property
+    def _table(self):
+        """
+        Table of current thread, brokers are shared by threads
+        while boto3 resources are not
+        """
+        return get_table(self._table_name)
+
+    def enable_governor(self, fraction=None, rcu=None, wcu=None):
+        """
+        Pace calls at a fraction of table capacity, the governor is shared
+        by all brokers of the table in this process
+
+        Args:
+
+        fraction: Fraction of capacity to target, `Governor.FRACTION` by default
+        rcu: Read capacity units, provisioned capacity of table by default
+        wcu: Write capacity units, provisioned capacity of table by default
+        """
+        self.governor = self.new_governor(fraction, rcu, wcu)
+        globals()['{}:{}'.format(Governor.__name__, self._table_name)] = self.governor
+        return self.governor
+
+    def new_governor(self, fraction=None, rcu=None, wcu=None):
+        """
+        Governor of table capacity, reference to `enable_governor` for arguments
+        """
+        if rcu is None or wcu is None:
+            provisioned = self._table.provisioned_throughput or {}
+            rcu = rcu or provisioned.get('ReadCapacityUnits')
+            wcu = wcu or provisioned.get('WriteCapacityUnits')
+        return Governor(rcu, wcu, fraction)
+
+    @contextmanager
+    def governed(self, **kwargs):
+        """
+        Pace calls made within the block, by its thread or tasks it submits,
+        by a governor of their own, other calls keep the shared governor,
+        which is used if no argument given
+
+        Reference to `enable_governor` for arguments
+        """
+        if all(v is None for v in kwargs.values()):
+            yield self.current_governor()
+            return
+
+        gov = self.new_governor(**kwargs)
+        token = GOVERNED.set(dict(GOVERNED.get(), **{self._table_name: gov}))
+        try:
+            yield gov
+        finally:
+            GOVERNED.reset(token)
+
+    def current_governor(self):
+        """
+        Governor of calls in current context, that of the `governed` block
+        if within one, the shared one otherwise
+        """
+        return GOVERNED.get().get(self._table_name) or self.governor
+
+    def _call(self, kind, op, fn, count=1, **kwargs):
+        """
+        Call `fn` through governor, retry on throttling error
+
+        Args:
+
+        kind: `read` or `write`
+        op: Operation name to learn cost
+        fn: Function of table or client to call
+        count: Number of items in request
+        kwargs: Parameters of `fn`
+        """
+        gov = self.current_governor()
+        start = time.perf_counter() if self.metrics.enabled else None
+        units = gov.acquire(kind, op, count)
+        kwargs['ReturnConsumedCapacity'] = 'TOTAL'
+
+        for attempt in range(TableBroker.MAX_RETRIES + 1):
+            try:
+                rsp = fn(**kwargs)
+                consumed = consumed_capacity(rsp)
+                # Items left unprocessed are charged again when retried
+                gov.record(kind, op, count - unprocessed_count(rsp), units, consumed)
+                if start is not None:
+                    self._observe(op, start, rsp, consumed, attempt)
+                return rsp
+            except Exception as ex:
+                if error_code(ex) not in THROTTLE_ERRORS or \
+                        attempt == TableBroker.MAX_RETRIES:
+                    if start is not None:
+                        self.metrics.observe(op, time.perf_counter() - start, \
+                                calls=1, errors=1, retries=attempt)
+                    raise
+                gov.throttled(kind, units)
+                time.sleep(backoff_delay(attempt))
+                units = gov.acquire(kind, op, count)
+
+    def _observe(self, op, start, rsp, consumed, retries):
+        rsp = rsp or {}
+        if 'Items' in rsp:
+            items, pages = rsp['Items'], 1
+        elif 'Responses' in rsp:
+            items, pages = rsp['Responses'].get(self._table_name, []), 0
+        else:
+            items, pages = [rsp['Item']] if rsp.get('Item') else [], 0
+
+        self.metrics.observe(op, time.perf_counter() - start, calls=1,
+                items=len(items), bytes=item_bytes(items), pages=pages,
+                capacity=consumed or 0, retries=retries)
+
+    def enable_cache(self, **kwargs):
+        """
+        Enable read-through item cache
+
+        Args:
+
+        maxsize: Max number of entries
+        ttl: Seconds before an entry expires
+        max_bytes: Max estimated size of all entries
+        """
+        if not self.cache:
+            self.cache = ItemCache(**kwargs)
+        return self.cache
+
+    def disable_cache(self):
+        self.cache = None
+
+    def enable_write_behind(self, **kwargs):
+        """
+        Enable write-behind buffer, unconditional puts are buffered and
+        written in batches from a background thread, repeated puts of the
+        same item are coalesced, the last one wins
+
+        Updates of buffered items apply to the pending put, conditional
+        puts and deletes wait for pending puts of the same item
+
+        Args:
+
+        max_items: Flush once this many items are pending
+        max_age: Flush once the oldest pending put is this many seconds old
+        on_error: Callable receives a list of tuple of failed items and correspoinding error
+        workers: Max number of concurrent batches
+
+        Reference to `WriteBuffer`
+        """
+        if not self.buffer:
+            self.buffer = WriteBuffer(self, **kwargs)
+        return self.buffer
+
+    def disable_write_behind(self):
+        """
+        Write pending puts and put directly from now on
+
+        @return A list of tuple indicates failed items and correspoinding error
+        """
+        buffer, self.buffer = self.buffer, None
+        return buffer.close() if buffer else []
+
+    def flush(self):
+        """
+        Write pending puts of write-behind buffer now
+
+        @return A list of tuple indicates failed items and correspoinding error
+        """
+        return self.buffer.flush() if self.buffer else []
+
+    def invalidate(self, item):
+        """
+        Drop cache entries of `item` or key dict
+        """
+        if self.cache and item:
+            self.cache.invalidate(item.get(self._id_name))
 
     def __call__(self, **kwargs):
         return {k:getattr(self,k) for k in self.__slots__}
@@ -39,6 +245,78 @@ class TableBroker(object):
             return None
         return self.put(item)
 
+    def uniq_batch_put(self, items, known=None, **kwargs):
+        """
+        Insert items whose `source_unique` not exists
+
+        Items are consumed `UNIQ_CHUNKSIZE` at a time, candidates are first
+        filtered by `known`, those left to confirm are checked against
+        `source_unique_index` concurrently, survivors are written with
+        conditional puts so an existing item id is never overwritten
+
+        Hits of an exact `known` are skipped, hits of a `BloomFilter` may be
+        false positives and are checked against table, misses of a complete
+        `known` are written without checks, all are checked if `known` not given
+
+        A `source_unique` written by another process between the check, or the
+        snapshot `known` was taken, and the put is not detected
+
+        Args:
+
+        items: Iterable of `dict` objects represent records
+        known: A `BloomFilter` or `KnownSet` of existing `source_unique` values,
+                values found in table or written are added to it
+        complete: If `True`, by default, `known` holds all `source_unique` values
+                in table, if `False`, misses are checked against table too
+        workers: Max number of concurrent requests, `UNIQ_WORKERS` by default
+
+        @return A list of items written
+                A list of tuple indicates error items and correspoinding error
+        """
+        workers = kwargs.get('workers', TableBroker.UNIQ_WORKERS)
+        exact = getattr(known, 'exact', True)
+        complete = known is not None and kwargs.get('complete', True)
+        seen, written, err_items = set(), [], []
+
+        def check(item):
+            su = item['source_unique']
+            if complete and su not in known:
+                return False
+            return self.item_exists(su)
+
+        def write(item):
+            try:
+                self.put(item, cond=Attr(self._id_name).not_exists())
+                return True, None
+            except Exception as ex:
+                if error_code(ex) == 'ConditionalCheckFailedException':
+                    return False, None
+                return False, ex
+
+        def fresh(item):
+            su = item['source_unique']
+            if su in seen or (known is not None and exact and su in known):
+                return False
+            seen.add(su)
+            return True
+
+        pool = get_io_executor(workers) if workers > 1 else None
+        run = pool.map if pool else map
+        for chunk in iter_chunks(filter(fresh, items), TableBroker.UNIQ_CHUNKSIZE):
+            exists = list(run(check, chunk))
+            if known is not None:
+                _ = [known.add(item['source_unique']) for item, ex in zip(chunk, exists) if ex]
+            chunk = [item for item, ex in zip(chunk, exists) if not ex]
+
+            for item, (ok, ex) in zip(chunk, run(write, chunk)):
+                if ok:
+                    written.append(item)
+                    if known is not None:
+                        known.add(item['source_unique'])
+                elif ex:
+                    err_items.append((item, ex))
+        return written, err_items
+
     def put(self, item, **kwargs):
         """
         Put item into table
@@ -46,12 +324,118 @@ class TableBroker(object):
         Args:
 
         item: A `dict` object represents a record
+        cond: ComparisonCondition object as condition expression
+        direct: If `True`, write to table now even if write-behind enabled
+
+        Buffered if write-behind enabled, `cond` not given and `direct` not set,
+        see `enable_write_behind`
         """
-        return self._table.put_item(Item=item)
+        kw = {'Item': item}
+        cond = kwargs.get('cond')
+        if self.buffer:
+            if cond is None and not kwargs.get('direct'):
+                self.invalidate(item)
+                self.buffer.put(item)
+                return {}
+            self.buffer.flush([{self._id_name: item.get(self._id_name)}])
+        if cond is not None:
+            kw.update({'ConditionExpression': cond})
+        rsp = self._call('write', 'put', self._table.put_item, **kw)
+        self.invalidate(item)
+        return rsp
 
     def batch_put(self, items, **kwargs):
-        with self._table.batch_writer() as batch:
-            _ = [batch.put_item(Item=d) for d in items]
+        """
+        Put items into table in batches
+
+        Args:
+
+        items: Iterable of `dict` objects represent records
+        report: If `True`, return failures, by default, False, raise the first failure
+        workers: Max number of concurrent batches
+
+        Reference to `_batch_write`
+
+        @return A list of tuple indicates error items and correspoinding error if `report` set
+        """
+        if self.buffer:
+            items = map(self._unbuffered, items)
+        failed = self._batch_write(({'PutRequest': {'Item': d}} for d in items), **kwargs)
+        if kwargs.get('report'):
+            return [(req['PutRequest']['Item'], ex) for req, ex in failed]
+        if failed:
+            raise failed[0][1]
+
+    def _batch_write(self, requests, **kwargs):
+        """
+        Send write requests in batches of `BATCH_WRITE_SIZE` concurrently,
+        `UnprocessedItems` are retried with jittered backoff
+
+        Args:
+
+        requests: Iterable of `PutRequest` or `DeleteRequest` `dict`, eg.
+        \code
+            [
+                {'PutRequest': {'Item': {'id': 'ooooo', ...}}},
+                {'DeleteRequest': {'Key': {'id': 'xxxxx'}}},
+                ...
+            ]
+        \endcode
+        workers: Max number of concurrent batches, `BATCH_WRITE_WORKERS` by default
+        max_retries: Max number of retries for unprocessed items, `MAX_RETRIES` by default
+
+        @return A list of tuple indicates failed requests and correspoinding error
+        """
+        workers = kwargs.get('workers', TableBroker.BATCH_WRITE_WORKERS)
+        pending, failed = deque(), []
+
+        # Requests are consumed chunk by chunk, at most `workers` chunks in flight,
+        # a single worker writes in the calling thread
+        pool = get_io_executor(workers) if workers > 1 else None
+        for chunk in iter_chunks(requests, TableBroker.BATCH_WRITE_SIZE):
+            for req in chunk:
+                self.invalidate(req.get('PutRequest', {}).get('Item') or \
+                        req.get('DeleteRequest', {}).get('Key'))
+            if pool is None:
+                failed.extend(self._batch_write_chunk(chunk, **kwargs))
+                continue
+            pending.append(pool.submit(self._batch_write_chunk, chunk, **kwargs))
+            if len(pending) >= workers:
+                failed.extend(pending.popleft().result())
+        while pending:
+            failed.extend(pending.popleft().result())
+        return failed
+
+    def _batch_write_chunk(self, requests, **kwargs):
+        """
+        Write at most `BATCH_WRITE_SIZE` requests, retry until none left unprocessed
+
+        @return A list of tuple indicates failed requests and correspoinding error
+        """
+        max_retries = kwargs.get('max_retries', TableBroker.MAX_RETRIES)
+
+        for attempt in range(max_retries + 1):
+            if attempt and self.metrics.enabled:
+                # Resending unprocessed items, throttle retries counted in `_call`
+                self.metrics.observe('batch_write', retries=1)
+            try:
+                rsp = self._call('write', 'batch_write', self._table.meta.client.batch_write_item, \
+                        len(requests), RequestItems={self._table_name: requests})
+            except Exception as ex:
+                return [(req, ex) for req in requests]
+
+            # Readers of the items written may have cached them in the meantime
+            for req in requests:
+                self.invalidate(req.get('PutRequest', {}).get('Item') or \
+                        req.get('DeleteRequest', {}).get('Key'))
+            requests = rsp.get('UnprocessedItems', {}).get(self._table_name)
+            if not requests:
+                return []
+            if attempt < max_retries:
+                time.sleep(backoff_delay(attempt))
+
+        ex = RuntimeError("Unprocessed after {} retries".format(max_retries))
+        return [(req, ex) for req in requests]
 
     def _get(self, key_dict, **kwargs):
         """
@@ -62,8 +446,25 @@ class TableBroker(object):
         key_dict: `dict` contains record identifier
         \code
         \endcode
+
+        Served from cache if enabled, pending puts of write-behind buffer
+        are served first
         """
-        return self._table.get_item(Key=key_dict)
+        if self.buffer:
+            item = self.buffer.get(key_dict)
+            if item is not None:
+                return {'Item': item}
+        if not self.cache:
+            return self._call('read', 'get', self._table.get_item, Key=key_dict)
+
+        iid = key_dict.get(self._id_name)
+        rsp = self.cache.get('item', iid)
+        if rsp is None:
+            token = self.cache.token()
+            rsp = self._call('read', 'get', self._table.get_item, Key=key_dict)
+            if rsp.get('Item'):
+                self.cache.set('item', iid, rsp, token)
+        return rsp
 
     def _query(self, cond, ind=None, **kwargs):
         """
@@ -74,6 +475,7 @@ class TableBroker(object):
         chunksize: Max number of items to return
         filter_expr: A ComparisonCondition object as filter expression
         esk: ExclusiveStartKey
+        fields: List of attribute names to return, all by default
         """
         if not cond and not ind:
             return None
@@ -81,6 +483,7 @@ class TableBroker(object):
         filter_expr = kwargs.get('filter_expr')
         chunksize = kwargs.get('chunksize', TableBroker.CHUNKSIZE)
         esk = kwargs.get('esk')
+        fields = kwargs.get('fields')
 
         kw = {
             'KeyConditionExpression':cond,
@@ -93,7 +496,9 @@ class TableBroker(object):
             kw.update({'ExclusiveStartKey': esk})
         if filter_expr:
             kw.update({'FilterExpression': filter_expr})
-        return self._table.query(**kw)
+        if fields:
+            kw.update(projection(fields))
+        return self._call('read', 'query', self._table.query, **kw)
 
     def _delete(self, key_dict, **kwargs):
         """
@@ -102,10 +507,18 @@ class TableBroker(object):
         key_dict: List of key dicts, eg.
         \code
         \endcode
+        return_values: `ALL_OLD` to return the item deleted in `Attributes`
         """
         if not key_dict:
             return None
-        return self._table.delete_item(Key=key_dict)
+        if self.buffer:
+            self.buffer.discard(key_dict)
+        kw = {'Key': key_dict}
+        if kwargs.get('return_values'):
+            kw.update({'ReturnValues': kwargs['return_values']})
+        rsp = self._call('write', 'delete', self._table.delete_item, **kw)
+        self.invalidate(key_dict)
+        return rsp
 
     def batch_delete(self, key_dicts, **kwargs):
         """
@@ -118,11 +531,21 @@ class TableBroker(object):
                 ...
             ]
         \endcode
+        report: If `True`, return failures, by default, False, raise the first failure
+
+        Reference to `_batch_write`
+
+        @return A list of tuple indicates error keys and correspoinding error if `report` set
         """
         if not key_dicts:
             return None
-        with self._table.batch_writer() as batch:
-            _ = [batch.delete_item(Key=item) for item in key_dicts]
+        if self.buffer:
+            key_dicts = map(self._unbuffered, key_dicts)
+        failed = self._batch_write(({'DeleteRequest': {'Key': k}} for k in key_dicts), **kwargs)
+        if kwargs.get('report'):
+            return [(req['DeleteRequest']['Key'], ex) for req, ex in failed]
+        if failed:
+            raise failed[0][1]
 
     def _update(self, key_dict, update_dict, **kwargs):
         """
@@ -136,24 +559,44 @@ class TableBroker(object):
         \code
                 {'name': 'human-1', 'location': 'mars'}
         \endcode
+        remove: List of attribute names to remove
+        return_values: `ReturnValues` of `update_item`, `ALL_NEW` by default
+        cond: ComparisonCondition object as condition expression, met by
+                pending puts of write-behind buffer
         """
-        expr, cnt = 'SET ', 0
+        remove = kwargs.get('remove') or []
+        if self.buffer:
+            item = self.buffer.update(key_dict, update_dict, remove)
+            if item is not None:
+                self.invalidate(key_dict)
+                return {'Attributes': dict(item)} if kwargs.get('return_values', 'ALL_NEW') == 'ALL_NEW' else {}
+
         name_dict, value_dict = {}, {}
 
-        for k, v in update_dict.items():
+        for cnt, (k, v) in enumerate(update_dict.items()):
             name_dict.update({'#k{}'.format(cnt): k})
             value_dict.update({':v{}'.format(cnt): v})
-            cnt += 1
 
-        expr += ', '.join(['{}={}'.format(k, v) for k, v in zip(name_dict, value_dict)])
+        expr = 'SET ' + ', '.join(['{}={}'.format(k, v) for k, v in zip(name_dict, value_dict)])
+        if remove:
+            rm_dict = {'#r{}'.format(cnt): k for cnt, k in enumerate(remove)}
+            expr = ' '.join((expr if update_dict else '', 'REMOVE ' + ', '.join(rm_dict))).strip()
+            name_dict.update(rm_dict)
 
-        return self._table.update_item(
-                Key=key_dict,
-                UpdateExpression=expr,
-                ExpressionAttributeNames=name_dict,
-                ExpressionAttributeValues=value_dict,
-                ReturnValues="ALL_NEW",
-                )
+        kw = {
+                'Key': key_dict,
+                'UpdateExpression': expr,
+                'ExpressionAttributeNames': name_dict,
+                'ReturnValues': kwargs.get('return_values', 'ALL_NEW'),
+                }
+        if value_dict:
+            kw.update({'ExpressionAttributeValues': value_dict})
+        if kwargs.get('cond') is not None:
+            kw.update({'ConditionExpression': kwargs['cond']})
+
+        rsp = self._call('write', 'update', self._table.update_item, **kw)
+        self.invalidate(key_dict)
+        return rsp
 
     def _scan(self, filter_expr=None, **kwargs):
         """
@@ -163,9 +606,15 @@ class TableBroker(object):
         filter_expr: ComparisonCondition object defined in [https://boto3.readthedocs.io/en/latest/_modules/boto3/dynamodb/conditions.html]
         chunksize: Max number of results to scan, Table.CHUNKSIZE by default
         esk: ExclusiveStartKey
+        segment: Segment to scan in a parallel scan
+        total_segments: Total number of segments in a parallel scan
+        fields: List of attribute names to return, all by default
         """
         chunksize = kwargs.get('chunksize', TableBroker.CHUNKSIZE)
         esk = kwargs.get('esk')
+        segment = kwargs.get('segment')
+        total_segments = kwargs.get('total_segments')
+        fields = kwargs.get('fields')
 
         kw = {'Limit': chunksize}
 
@@ -173,8 +622,12 @@ class TableBroker(object):
             kw.update({'FilterExpression': filter_expr})
         if esk:
             kw.update({'ExclusiveStartKey': esk})
+        if total_segments:
+            kw.update({'Segment': segment, 'TotalSegments': total_segments})
+        if fields:
+            kw.update(projection(fields))
 
-        return self._table.scan(**kw)
+        return self._call('read', 'scan', self._table.scan, **kw)
 
     def _iscan(self, filter_expr=None, chunksize=1000, esk=None, **kwargs):
         """
@@ -187,43 +640,167 @@ class TableBroker(object):
         filter_expr: ComparisonCondition object defined in [https://boto3.readthedocs.io/en/latest/_modules/boto3/dynamodb/conditions.html]
         chunksize: Max number of items to get for each scan
         esk: Exclusive start key
+        segments: Number of segments to scan in parallel, by default 1
+        ordered: If `True`, yield pages segment by segment,
+                By default, False, yield pages as soon as any segment returns
+        fields: List of attribute names to return, all by default
+        checkpoint: A `Checkpoint` to resume from and record progress to,
+                `esk` and `segments` are taken from it
+
+        @return Generator
+        """
+        checkpoint = kwargs.get('checkpoint')
+        segments = checkpoint.segments if checkpoint else kwargs.get('segments') or 1
+        fields = kwargs.get('fields')
+        if segments > 1:
+            pages = self._piscan(filter_expr, chunksize, segments, \
+                    kwargs.get('ordered', False), fields=fields, checkpoint=checkpoint)
+        elif checkpoint:
+            if checkpoint.done(0):
+                return
+            pages = ((0, rsp) for rsp in self._iscan_segment(filter_expr, chunksize, \
+                    esk=checkpoint.esk(0), fields=fields))
+        else:
+            yield from self._iscan_segment(filter_expr, chunksize, esk=esk, fields=fields)
+            return
+
+        if not checkpoint:
+            yield from (rsp for _, rsp in pages)
+            return
+        yield from checkpoint.track((segment, rsp.get('LastEvaluatedKey'), rsp) \
+                for segment, rsp in pages)
+
+    def _iscan_segment(self, filter_expr, chunksize, segment=None, total_segments=None, **kwargs):
+        """
+        Scan one segment of a parallel scan chunk by chunk, or the whole
+        table if no segment given
+
+        Args:
+        esk: Exclusive start key
+        Reference to `_scan`
 
         @return Generator
         """
-        if not esk:
-            rsp = self._scan(filter_expr, chunksize=chunksize)
-            if not rsp:
-                return None
+        kw = {'chunksize': chunksize, 'segment': segment, 'total_segments': total_segments}
+        kw.update(kwargs)
+        rsp = self._scan(filter_expr, **kw)
 
         while 'LastEvaluatedKey' in rsp:
             yield rsp
-            esk = rsp['LastEvaluatedKey']
-            rsp = self._scan(filter_expr, chunksize=chunksize, esk=esk)
+            kw['esk'] = rsp['LastEvaluatedKey']
+            rsp = self._scan(filter_expr, **kw)
         yield rsp
 
-    def _iquery(self, cond, ind, filter_expr=None, chunksize=1000, esk=None, **kwargs):
+    def _piscan(self, filter_expr, chunksize, segments, ordered=False, **kwargs):
+        """
+        Scan table with `segments` workers, each walks one segment
+
+        Pages are buffered in bounded queues, at most `SEGMENT_BUFSIZE`
+        pages per segment, a worker blocks once its share is full
+
+        Args:
+
+        filter_expr: ComparisonCondition object defined in [https://boto3.readthedocs.io/en/latest/_modules/boto3/dynamodb/conditions.html]
+        chunksize: Max number of items to get for each scan
+        segments: Total number of segments
+        ordered: If `True`, yield all pages of segment 0 first, then segment 1 and so on
+        fields: List of attribute names to return, all by default
+        checkpoint: A `Checkpoint` to resume segments from, finished segments are skipped
+
+        @return Generator of tuples of segment and page
+        """
+        checkpoint = kwargs.pop('checkpoint', None)
+        done = object()
+        bufsize = TableBroker.SEGMENT_BUFSIZE
+        if ordered:
+            queues = [Queue(bufsize) for _ in range(segments)]
+        else:
+            queues = [Queue(bufsize * segments)] * segments
+        stopped = []
+
+        def worker(segment):
+            que = queues[segment]
+            try:
+                if checkpoint and checkpoint.done(segment):
+                    que.put(done)
+                    return
+                esk = checkpoint.esk(segment) if checkpoint else None
+                for rsp in self._iscan_segment(filter_expr, chunksize, segment, segments, \
+                        esk=esk, **kwargs):
+                    if stopped:
+                        break
+                    que.put((segment, rsp))
+                que.put(done)
+            except Exception as ex:
+                que.put(ex)
+
+        # Segment workers run on cached threads, sessions of earlier scans are reused
+        pool = get_thread_cache()
+        _ = [pool.submit(worker, i) for i in range(segments)]
+
+        try:
+            if ordered:
+                for que in queues:
+                    yield from self._drain(que, done, 1)
+            else:
+                yield from self._drain(queues[0], done, segments)
+        finally:
+            # Unblock workers waiting on full queues when consumer quits early
+            stopped.append(True)
+            for que in set(queues):
+                while not que.empty():
+                    que.get_nowait()
+
+    @staticmethod
+    def _drain(que, done, remain):
+        """
+        Yield pages from `que` until `remain` workers have finished
+        """
+        while remain:
+            rsp = que.get()
+            if rsp is done:
+                remain -= 1
+            elif isinstance(rsp, Exception):
+                raise rsp
+            else:
+                yield rsp
+
+    def _iquery(self, cond, ind=None, filter_expr=None, chunksize=1000, esk=None, **kwargs):
         """
         Query table chunk by chunk
 
-        Resume last scan by parsing previous `esk`
+        Resume last query by parsing previous `esk`
 
         Args:
 
+        cond: Key condition for query
+        ind: Index name, the table by default
         filter_expr: ComparisonCondition object defined in [https://boto3.readthedocs.io/en/latest/_modules/boto3/dynamodb/conditions.html]
         chunksize: Max number of items to get for each scan
         esk: Exclusive start key
+        fields: List of attribute names to return, all by default
+        checkpoint: A `Checkpoint` to resume from and record progress to, `esk` is taken from it
 
         @return Generator
         """
-        if not esk:
-            rsp = self._query(cond, ind, filter_expr=filter_expr, chunksize=chunksize)
-            if not rsp:
-                return None
+        fields = kwargs.get('fields')
+        checkpoint = kwargs.get('checkpoint')
+        if checkpoint:
+            if checkpoint.done(0):
+                return
+            kw = dict(kwargs, checkpoint=None, esk=checkpoint.esk(0))
+            pages = self._iquery(cond, ind, filter_expr, chunksize, **kw)
+            yield from checkpoint.track((0, rsp.get('LastEvaluatedKey'), rsp) for rsp in pages)
+            return
+
+        rsp = self._query(cond, ind, filter_expr=filter_expr, chunksize=chunksize, esk=esk, fields=fields)
+        if not rsp:
+            return None
 
         while 'LastEvaluatedKey' in rsp:
             yield rsp
             esk = rsp['LastEvaluatedKey']
-            rsp = self._query(cond, ind, filter_expr=filter_expr, chunksize=chunksize, esk=esk)
+            rsp = self._query(cond, ind, filter_expr=filter_expr, chunksize=chunksize, esk=esk, fields=fields)
         yield rsp
 
     def item_exists(self, source_unique):
@@ -234,7 +811,11 @@ class TableBroker(object):
 
         source_unique: A `string` represents the `source_unique` value
         """
-        rsp = self._table.query(Key("source_unique").eq(source_unique), GSI.SOURCE_UNIQUE)
+        rsp = self._call('read', 'query', self._table.query,
+                KeyConditionExpression=Key("source_unique").eq(source_unique),
+                IndexName=GSI.SOURCE_UNIQUE.value,
+                Limit=1,
+                )
         return True if rsp['Items'] else False
 
 
@@ -242,29 +823,175 @@ class TableBroker(object):
         """
         Get items by given `keys`
 
+        Keys are sent in groups of `BATCH_GET_SIZE` concurrently,
+        `UnprocessedKeys` are retried with jittered backoff,
+        items are returned in the order of `keys`, pending puts of
+        write-behind buffer are served first
+
         Args:
         keys: List of `dict` contains `npl_id` for each
+        consist_read: Whether to perform strongly consistent read
+        workers: Max number of concurrent requests, `BATCH_GET_WORKERS` by default
+        max_retries: Max number of retries for unprocessed keys, `MAX_RETRIES` by default
+        fields: List of attribute names to return, all by default
+
+        @return Response in `batch_get_item` format, keys still unprocessed
+                after all retries are left in `UnprocessedKeys`
         """
         if not keys:
             return None
 
-        kw = {"Keys": keys}
+        workers = kwargs.get('workers', TableBroker.BATCH_GET_WORKERS)
+        found, unprocessed = {}, []
+        todo = keys
+        if self.buffer:
+            fields = kwargs.get('fields')
+            for key in keys:
+                item = self.buffer.get(key)
+                if item is not None:
+                    found[self._key_of(key, key)] = {k: v for k, v in item.items() \
+                            if not fields or k in fields or k in key}
+            todo = [key for key in keys if self._key_of(key, key) not in found]
+        chunks = list(iter_chunks(todo, TableBroker.BATCH_GET_SIZE))
+
+        if len(chunks) <= 1 or workers <= 1:
+            results = [self._batch_get_chunk(c, **kwargs) for c in chunks]
+        else:
+            # At most `workers` chunks in flight on the shared executor
+            results, pool = [], get_io_executor(workers)
+            for part in iter_chunks(chunks, workers):
+                results.extend(pool.map(lambda c: self._batch_get_chunk(c, **kwargs), part))
+
+        for items, left in results:
+            found.update({self._key_of(item, keys[0]): item for item in items})
+            unprocessed.extend(left)
+
+        items = [found[k] for k in map(lambda key: self._key_of(key, key), keys) if k in found]
+        rsp = {'Responses': {self._table_name: items}}
+        if unprocessed:
+            rsp['UnprocessedKeys'] = {self._table_name: {'Keys': unprocessed}}
+        return rsp
+
+    def _batch_get_chunk(self, keys, **kwargs):
+        """
+        Get at most `BATCH_GET_SIZE` items, retry until no key left unprocessed
+
+        @return A list of items found
+                A list of keys still unprocessed
+        """
+        max_retries = kwargs.get('max_retries', TableBroker.MAX_RETRIES)
         consist_read = kwargs.get('consist_read')
+        fields = kwargs.get('fields')
+        items = []
+
+        for attempt in range(max_retries + 1):
+            if attempt and self.metrics.enabled:
+                # Resending unprocessed keys, throttle retries counted in `_call`
+                self.metrics.observe('batch_get', retries=1)
+            kw = {"Keys": keys}
+            if consist_read is not None:
+                kw.update({'ConsistentRead': consist_read})
+            if fields:
+                kw.update(projection(set(fields) | set(keys[0])))
+
+            kw = {'RequestItems': {self._table_name: kw}}
+            rsp = self._call('read', 'batch_get', self._table.meta.client.batch_get_item, len(keys), **kw)
+            items.extend(rsp.get('Responses', {}).get(self._table_name, []))
+
+            keys = rsp.get('UnprocessedKeys', {}).get(self._table_name, {}).get('Keys')
+            if not keys:
+                return items, []
+            if attempt < max_retries:
+                time.sleep(backoff_delay(attempt))
+        return items, keys
+
+    def _unbuffered(self, item):
+        """
+        Drop pending put of `item` or key dict, about to be written otherwise
+        """
+        self.buffer.discard(item)
+        return item
+
+    @staticmethod
+    def _key_of(item, key_dict):
+        """
+        Build hashable key of `item` with attribute names in `key_dict`
+        """
+        return tuple((k, item.get(k)) for k in sorted(key_dict))
 
-        if consist_read is not None:
-            kw.update({'ConsistentRead': consist_read})
 
-        kw = {'RequestItems': {self._table_name: kw}}
-        return self._table.meta.client.batch_get_item(**kw)
+def projection(fields):
+    """
+    Build projection expression for given attribute names
+
+    Args:
+    fields: List of attribute names
+    """
+    names = {'#p{}'.format(i): f for i, f in enumerate(fields)}
+    return {
+            'ProjectionExpression': ', '.join(names),
+            'ExpressionAttributeNames': names,
+            }
 
 
 def get_dydb():
+    """
+    DynamoDB resource of current thread from the connection pool,
+    set `DYDB_ENDPOINT` to connect to a local stand-in, eg. DynamoDB Local
+
+    Set `DYDB_BACKEND=local` to use the embedded store in this process,
+    it is shared by all threads, as is any resource assigned to `dydb`
+
+    \sa data_model.dynamodb.core.pool
+    \sa data_model.dynamodb.core.local
+    """
     if not globals().get('dydb'):
-        globals()['dydb'] = get_boto3_service('dynamodb')
+        config = get_config()
+        if getattr(config, 'dydb_backend', None) != 'local':
+            return get_pool().resource()
+        from data_model.dynamodb.core.local import get_local_resource
+        hash_keys = {v.value:k.value for k, v in TableBroker.ITEMID_TABLETYPE.items()}
+        globals()['dydb'] = get_local_resource(hash_keys, getattr(config, 'dydb_local_path', None))
     return globals().get('dydb')
 
 
+def get_table(table_name):
+    """
+    Table of `table_name` for current thread
+    """
+    dydb = get_dydb()
+    if dydb is globals().get('dydb'):
+        return dydb.Table(table_name)
+    return get_pool().table(table_name)
+
+
+def get_governor(table_name):
+    """
+    Governor shared by brokers of `table_name`, unlimited until enabled
+    """
+    name = '{}:{}'.format(Governor.__name__, table_name)
+    if not globals().get(name):
+        globals()[name] = Governor()
+    return globals().get(name)
+
+
+def get_io_executor(workers):
+    """
+    Executor of concurrent requests shared by all brokers, one per number
+    of `workers`, its threads live across calls so the session and
+    connections each one holds in the pool are reused
+    """
+    name = 'executor:io:{}'.format(workers)
+    if not globals().get(name):
+        globals()[name] = ContextThreadPool(workers, thread_name_prefix='dydb-io')
+    return globals().get(name)
+
+
 def get_brk(item_id):
+    """
+    Broker of table for `item_id`, shared by all threads, requests of each
+    thread go through its own connections in the pool
+    """
     tbtype = TableBroker.ITEMID_TABLETYPE[item_id]
     name = '{}:{}'.format(TableBroker.name, tbtype.value)
     if not globals().get(name):
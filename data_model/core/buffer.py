@@ -0,0 +1,225 @@
+# Write-behind buffer
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Puts are kept in memory by item id, a later put of the same id replaces
+# the pending one, a background thread writes them in batches when the
+# buffer fills up or its oldest put gets old enough
+import atexit
+import time
+from collections import OrderedDict
+from threading import Condition, Lock, RLock, Thread
+from data_model.dynamodb.common.utils import LazyAttr, iter_chunks
+
+Binary = LazyAttr('boto3.dynamodb.types', 'Binary')
+
+
+class WriteBuffer(object):
+    """
+    Write-behind buffer of puts for a `TableBroker`
+
+    Pending puts are served to `_get` and `_batch_get` of the broker,
+    queries and scans see them only after they are flushed
+
+    Args:
+    brk: `TableBroker` to write through
+    max_items: Flush once this many items are pending, `MAX_ITEMS` by default
+    max_age: Flush once the oldest pending put is this many seconds old,
+            `MAX_AGE` by default
+    on_error: Callable receives a list of tuple of failed items and
+            correspoinding error, failures are kept in `failed` if not given
+    workers: Max number of concurrent batches, `TableBroker.BATCH_WRITE_WORKERS` by default
+    """
+
+    MAX_ITEMS = 500
+    MAX_AGE = 1.0
+    # Puts block once this many times `max_items` are pending
+    BACKLOG = 4
+
+    def __init__(self, brk, **kwargs):
+        self.brk = brk
+        self.max_items = kwargs.get('max_items') or WriteBuffer.MAX_ITEMS
+        self.max_age = kwargs.get('max_age') or WriteBuffer.MAX_AGE
+        self.on_error = kwargs.get('on_error')
+        self.workers = kwargs.get('workers')
+        self.failed = []
+        self.written = 0
+        self.coalesced = 0
+        self.flushes = 0
+
+        # Maps item id to tuple of item and time of the first pending put
+        self._pending = OrderedDict()
+        self._inflight = {}
+        self._lock = Lock()
+        self._cond = Condition(self._lock)
+        # Held while writing, one flush at a time
+        self._flush_lock = RLock()
+        self._closed = False
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def put(self, item):
+        iid = item[self.brk._id_name]
+        with self._cond:
+            while len(self._pending) >= self.max_items * WriteBuffer.BACKLOG and not self._closed:
+                self._cond.wait()
+            entry = self._pending.get(iid)
+            if entry is not None:
+                self.coalesced += 1
+            # Replaced in place, age counts from the first pending put
+            self._pending[iid] = (item, entry[1] if entry else time.monotonic())
+            # The flusher waits for the first put to time its age
+            if len(self._pending) == 1 or len(self._pending) >= self.max_items:
+                self._cond.notify_all()
+        if self._closed:
+            self.flush()
+
+    def get(self, key_dict):
+        """
+        Pending item of `key_dict` as read back from table, `None` if not buffered
+        """
+        iid = key_dict.get(self.brk._id_name)
+        with self._lock:
+            entry = self._pending.get(iid) or self._inflight.get(iid)
+        if entry is None:
+            return None
+        return {k: Binary(bytes(v)) if isinstance(v, (bytes, bytearray, memoryview)) else v \
+                for k, v in entry[0].items()}
+
+    def update(self, key_dict, update_dict, remove=()):
+        """
+        Apply an update to the pending item of `key_dict`
+
+        @return The updated item, `None` if not buffered, the update goes
+                to table then, after any write of the item in flight lands
+        """
+        iid = key_dict.get(self.brk._id_name)
+        with self._lock:
+            entry = self._pending.get(iid)
+            if entry is not None:
+                item = dict(entry[0], **update_dict)
+                _ = [item.pop(k, None) for k in remove]
+                self._pending[iid] = (item, entry[1])
+                self.coalesced += 1
+                return item
+            busy = iid in self._inflight
+        if busy:
+            with self._flush_lock:
+                pass
+        return None
+
+    def discard(self, key_dict):
+        """
+        Drop the pending put of `key_dict`, eg. before it is deleted or
+        written otherwise, wait for any write of it in flight
+        """
+        iid = key_dict.get(self.brk._id_name)
+        with self._cond:
+            self._pending.pop(iid, None)
+            busy = iid in self._inflight
+            self._cond.notify_all()
+        if busy:
+            with self._flush_lock:
+                pass
+
+    def flush(self, keys=None):
+        """
+        Write pending puts now
+
+        Args:
+        keys: List of key dicts to write, all by default
+
+        @return A list of tuple indicates failed items and correspoinding error
+        """
+        with self._flush_lock:
+            with self._cond:
+                if keys is None:
+                    batch, self._pending = self._pending, OrderedDict()
+                else:
+                    ids = [k.get(self.brk._id_name) for k in keys]
+                    batch = OrderedDict((i, self._pending.pop(i)) for i in ids if i in self._pending)
+                self._inflight = batch
+                self._cond.notify_all()
+            if not batch:
+                return []
+
+            start = time.perf_counter()
+            try:
+                failed = self._write([{'PutRequest': {'Item': item}} for item, _ in batch.values()])
+            except Exception as ex:
+                failed = [({'PutRequest': {'Item': item}}, ex) for item, _ in batch.values()]
+            finally:
+                with self._lock:
+                    self._inflight = {}
+
+        failed = [(req['PutRequest']['Item'], ex) for req, ex in failed]
+        self.flushes += 1
+        self.written += len(batch) - len(failed)
+        if self.brk.metrics.enabled:
+            self.brk.metrics.observe('write_behind', time.perf_counter() - start, \
+                    items=len(batch), errors=len(failed))
+        if failed:
+            self._report(failed)
+        return failed
+
+    def _write(self, requests):
+        if not self._closed:
+            try:
+                kw = {'workers': self.workers} if self.workers else {}
+                return self.brk._batch_write(requests, **kw)
+            except RuntimeError:
+                # Thread pools take no more work once interpreter shutdown starts,
+                # puts are idempotent, write them all again serially
+                pass
+        return [x for chunk in iter_chunks(requests, self.brk.BATCH_WRITE_SIZE) \
+                for x in self.brk._batch_write_chunk(chunk)]
+
+    def _report(self, failed):
+        if self.on_error is None:
+            self.failed.extend(failed)
+            return
+        try:
+            self.on_error(failed)
+        except Exception as ex:
+            self.failed.extend((item, ex) for item, _ in failed)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if len(self._pending) >= self.max_items:
+                        break
+                    timeout = None
+                    if self._pending:
+                        _, first = next(iter(self._pending.values()))
+                        timeout = first + self.max_age - time.monotonic()
+                        if timeout <= 0:
+                            break
+                    self._cond.wait(timeout)
+                if self._closed:
+                    return
+            self.flush()
+
+    def close(self):
+        """
+        Stop the flusher and write all pending puts
+
+        @return A list of tuple indicates failed items and correspoinding error
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        atexit.unregister(self.close)
+        return self.flush()
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {
+                'pending': pending,
+                'written': self.written,
+                'coalesced': self.coalesced,
+                'failed': len(self.failed),
+                'flushes': self.flushes,
+                }
@@ -0,0 +1,155 @@
+# In-process item cache
+# Author: Zex Li <top_zlynch@yahoo.com>
+import sys
+import time
+from collections import OrderedDict
+from copy import deepcopy
+from threading import Lock
+
+
+class ItemCache(object):
+    """
+    LRU cache with TTL and total byte size bound
+
+    Keys are `(kind, item id)` tuples, so raw items and built objects
+    of the same id are invalidated together
+
+    Values are deep copied in and out, callers never share them with the cache
+
+    Readers take a `token` before reading the table and pass it to `set`,
+    a value read before the latest `invalidate` of its id is not cached
+    """
+
+    MAXSIZE = 4096
+    TTL = 60
+    MAX_BYTES = 64 * 1024 * 1024
+    KINDS = ('item', 'obj')
+    # Number of recent invalidations remembered for `set` to check tokens against
+    MAX_INVALIDATIONS = 65536
+
+    def __init__(self, maxsize=None, ttl=None, max_bytes=None):
+        """
+        Args:
+
+        maxsize: Max number of entries, `MAXSIZE` by default
+        ttl: Seconds before an entry expires, `TTL` by default
+        max_bytes: Max estimated size of all entries, `MAX_BYTES` by default
+        """
+        self.maxsize = maxsize or ItemCache.MAXSIZE
+        self.ttl = ttl or ItemCache.TTL
+        self.max_bytes = max_bytes or ItemCache.MAX_BYTES
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0
+        # Invalidation sequence, and the last one of each id recently invalidated,
+        # ids forgotten were invalidated no later than `_floor`
+        self._seq = 0
+        self._floor = 0
+        self._invalidated = OrderedDict()
+
+    def token(self):
+        """
+        Token to pass to `set` for a value about to be read
+        """
+        with self._lock:
+            return self._seq
+
+    def get(self, kind, iid):
+        """
+        Get entry of `kind` for `iid`, `None` if missing or expired
+        """
+        key = (kind, iid)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, expire = entry
+            if expire < time.monotonic():
+                self._pop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return deepcopy(value)
+
+    def set(self, kind, iid, value, token=None):
+        """
+        Cache `value` of `kind` for `iid`
+
+        Args:
+        token: Value of `token` taken before `value` was read, `value` is
+                dropped if `iid` is invalidated after that, never dropped by default
+        """
+        if iid is None:
+            return
+        key = (kind, iid)
+        size = sizeof(value)
+        if size > self.max_bytes:
+            return
+        value = deepcopy(value)
+        with self._lock:
+            if token is not None and self._invalidated.get(iid, self._floor) > token:
+                self.rejected += 1
+                return
+            self._pop(key)
+            self._entries[key] = (value, size, time.monotonic() + self.ttl)
+            self.nbytes += size
+            while len(self._entries) > self.maxsize or self.nbytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, iid):
+        """
+        Drop all entries of `iid`
+        """
+        with self._lock:
+            _ = [self._pop((kind, iid)) for kind in ItemCache.KINDS]
+            self._seq += 1
+            self._invalidated.pop(iid, None)
+            self._invalidated[iid] = self._seq
+            while len(self._invalidated) > ItemCache.MAX_INVALIDATIONS:
+                _, self._floor = self._invalidated.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            self._seq += 1
+            self._floor = self._seq
+            self._invalidated.clear()
+
+    def stats(self):
+        return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'rejected': self.rejected,
+                'size': len(self._entries),
+                'bytes': self.nbytes,
+                }
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self.nbytes -= entry[1]
+
+
+def sizeof(value):
+    """
+    Estimate memory size of `value` in bytes, containers and
+    objects with `__slots__` are walked recursively
+    """
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(k) + sizeof(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(map(sizeof, value))
+    slots = getattr(type(value), '__slots__', None)
+    if slots and not isinstance(value, (str, bytes)):
+        return sys.getsizeof(value) + sum(sizeof(getattr(value, k, None)) \
+                for cls in type(value).__mro__ for k in getattr(cls, '__slots__', ()))
+    return sys.getsizeof(value)
@@ -0,0 +1,156 @@
+# Scan and query checkpoint
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Progress of a long running scan or query, `LastEvaluatedKey` of the
+# last page consumed for each segment, kept in a local JSON file
+import base64
+import os
+import time
+import ujson
+from data_model.dynamodb.common.utils import LazyAttr
+
+TypeSerializer = LazyAttr('boto3.dynamodb.types', 'TypeSerializer')
+TypeDeserializer = LazyAttr('boto3.dynamodb.types', 'TypeDeserializer')
+
+
+def dump_key(key):
+    """
+    Serialize key `dict` into JSON compatible typed values, binary in base64
+    """
+    if key is None:
+        return None
+    ser = TypeSerializer()
+    val = {k: ser.serialize(v) for k, v in key.items()}
+    for typed in val.values():
+        if 'B' in typed:
+            typed['B'] = base64.b64encode(bytes(typed['B'])).decode()
+    return val
+
+
+def load_key(val):
+    if val is None:
+        return None
+    des = TypeDeserializer()
+    return {k: des.deserialize({'B': base64.b64decode(v['B'])} if 'B' in v else v) \
+            for k, v in val.items()}
+
+
+class Checkpoint(object):
+    """
+    Per segment progress of a scan or query
+
+    A page counts as consumed once the consumer asks for the next one,
+    so after a crash the page being processed is delivered again on
+    resume, pages are delivered at least once
+
+    The access path planned is recorded with progress, a checkpoint
+    resumes only the same path, index, key condition and filter
+
+    Args:
+    path: Checkpoint file
+    table: Table name
+    segments: Total number of segments, 1 for query or serial scan
+    interval: Min seconds between two writes, `INTERVAL` by default,
+            0 to write after every page
+    """
+
+    INTERVAL = 30
+
+    def __init__(self, path, table, segments=1, interval=None):
+        self.path = path
+        self.table = table
+        self.segments = segments
+        self.interval = Checkpoint.INTERVAL if interval is None else interval
+        self.state = {str(i): {'esk': None, 'done': False} for i in range(segments)}
+        # Access path of the scan or query, as `Plan.signature`
+        self.plan = None
+        self._saved_at = 0
+
+    @classmethod
+    def open(cls, path, table, segments=None, interval=None):
+        """
+        Load checkpoint from `path`, or start a new one if not exists
+
+        Args:
+        segments: Total number of segments, taken from the file if not given
+        """
+        if not os.path.isfile(path):
+            return cls(path, table, segments or 1, interval)
+
+        with open(path) as fd:
+            val = ujson.load(fd)
+        if val['table'] != table:
+            raise ValueError("Checkpoint {} belongs to table {}".format(path, val['table']))
+        if segments and segments != val['segments']:
+            raise ValueError("Checkpoint {} has {} segments, {} given".format(\
+                    path, val['segments'], segments))
+
+        cp = cls(path, table, val['segments'], interval)
+        cp.state = val['state']
+        cp.plan = val.get('plan')
+        return cp
+
+    def bind(self, plan):
+        """
+        Record access path of `plan`, or check it against the one recorded
+
+        @raise `ValueError` if `plan` differs from the path recorded
+        """
+        sig = plan.signature()
+        if self.plan is None:
+            self.plan = sig
+        elif self.plan != sig:
+            raise ValueError("Checkpoint {} was taken on {}, not {}".format(self.path, self.plan, sig))
+
+    def esk(self, segment):
+        """
+        Key to resume `segment` from, `None` to start over
+        """
+        return load_key(self.state[str(segment)]['esk'])
+
+    def done(self, segment):
+        return self.state[str(segment)]['done']
+
+    @property
+    def finished(self):
+        return all(s['done'] for s in self.state.values())
+
+    def advance(self, segment, esk):
+        """
+        Record a page of `segment` consumed, `esk` is its `LastEvaluatedKey`,
+        `None` if it is the last page
+        """
+        self.state[str(segment)] = {'esk': dump_key(esk), 'done': esk is None}
+        if time.time() - self._saved_at >= self.interval:
+            self.save()
+
+    def save(self):
+        """
+        Write checkpoint, file replaced atomically
+        """
+        tmp = '{}.tmp'.format(self.path)
+        with open(tmp, 'w') as fd:
+            ujson.dump({
+                'table': self.table,
+                'segments': self.segments,
+                'plan': self.plan,
+                'updated_ts': int(time.time()),
+                'state': self.state,
+                }, fd)
+        os.replace(tmp, self.path)
+        self._saved_at = time.time()
+
+    def track(self, pages):
+        """
+        Yield values in `pages` and advance on consumption, saved at last
+        even when the consumer quits early
+
+        Args:
+        pages: Iterable of tuples of segment, `LastEvaluatedKey` and value to yield
+        """
+        try:
+            for segment, esk, val in pages:
+                yield val
+                self.advance(segment, esk)
+        finally:
+            self.save()
@@ -0,0 +1,219 @@
+# Table export
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Stream scan pages into sharded, compressed files with a manifest,
+# one page in memory per segment at a time
+#
+# Formats:
+#   ndjson      One JSON object per line for each record
+#   columnar    One JSON object per line for each page, values grouped by column,
+#               eg. {"rows": 2, "columns": {"repository_id": ["a", "b"], ...}}
+import base64
+import bz2
+import gzip
+import lzma
+import os
+import time
+import ujson
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from data_model.dynamodb.common.utils import LazyAttr
+from data_model.dynamodb.core.broker import get_brk, TableBroker
+
+Binary = LazyAttr('boto3.dynamodb.types', 'Binary')
+Attr = LazyAttr('boto3.dynamodb.conditions', 'Attr')
+
+FORMATS = ('ndjson', 'columnar')
+
+OPENERS = {
+        'gzip': (gzip.open, '.gz'),
+        'bz2': (bz2.open, '.bz2'),
+        'lzma': (lzma.open, '.xz'),
+        None: (open, ''),
+        }
+
+SHARD_ROWS = 100000
+MANIFEST = 'manifest.json'
+# Row attribute of raw exports listing names of binary attributes
+BINARY = '_binary'
+
+
+def raw_row(item):
+    """
+    Row of raw export of `item`, names of binary attributes, written in
+    base64, are listed in `BINARY`
+    """
+    row = plain(item)
+    row[BINARY] = [k for k, v in item.items() if isinstance(v, (Binary, bytes, bytearray, memoryview))]
+    return row
+
+
+def plain(val):
+    """
+    Convert attribute value into JSON compatible value, binary in base64
+    """
+    if isinstance(val, Decimal):
+        return int(val) if val == val.to_integral_value() else float(val)
+    if isinstance(val, Binary):
+        val = val.value
+    if isinstance(val, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(val)).decode()
+    if isinstance(val, dict):
+        return {k: plain(v) for k, v in val.items()}
+    if isinstance(val, (list, tuple, set, frozenset)):
+        return [plain(v) for v in val]
+    return val
+
+
+class ShardWriter(object):
+    """
+    Write rows of one segment into shards of at most `shard_rows` rows
+    """
+
+    def __init__(self, path, segment, fmt, compress, shard_rows, id_name):
+        self.path = path
+        self.segment = segment
+        self.fmt = fmt
+        self.opener, self.suffix = OPENERS[compress]
+        self.shard_rows = shard_rows
+        self.id_name = id_name
+        self.shards = []
+        self._fd = None
+
+    def _open(self):
+        name = 'part-{:04d}-{:05d}.{}{}'.format(self.segment, len(self.shards), \
+                'ndjson' if self.fmt == 'ndjson' else 'cols.ndjson', self.suffix)
+        self._fd = self.opener(os.path.join(self.path, name), 'wt')
+        self.shards.append({'file': name, 'segment': self.segment, 'rows': 0, \
+                'min_key': None, 'max_key': None})
+
+    def write(self, rows):
+        """
+        Write `rows`, a list of `dict`, split across shards as they fill up
+        """
+        while rows:
+            if self._fd is None or self.shards[-1]['rows'] >= self.shard_rows:
+                self.close()
+                self._open()
+            shard = self.shards[-1]
+            part, rows = rows[:self.shard_rows - shard['rows']], rows[self.shard_rows - shard['rows']:]
+
+            if self.fmt == 'ndjson':
+                self._fd.writelines(ujson.dumps(row) + '\n' for row in part)
+            else:
+                names = list(dict.fromkeys(k for row in part for k in row))
+                self._fd.write(ujson.dumps({
+                    'rows': len(part),
+                    'columns': {k: [row.get(k) for row in part] for k in names},
+                    }) + '\n')
+
+            keys = [row[self.id_name] for row in part if row.get(self.id_name) is not None]
+            if keys:
+                lo, hi = min(keys), max(keys)
+                shard['min_key'] = lo if shard['min_key'] is None else min(lo, shard['min_key'])
+                shard['max_key'] = hi if shard['max_key'] is None else max(hi, shard['max_key'])
+            shard['rows'] += len(part)
+
+    def close(self):
+        if self._fd is not None:
+            self._fd.close()
+            self._fd = None
+            shard = self.shards[-1]
+            shard['bytes'] = os.path.getsize(os.path.join(self.path, shard['file']))
+
+
+def export_table(cls, path, **kwargs):
+    """
+    Export records of table `cls` under directory `path`
+
+    Args:
+    cls: `Table` subclass
+    path: Output directory, created if not exists
+    format: `ndjson` or `columnar`, `ndjson` by default
+    raw: If `True`, write items as scanned, binary attributes, eg. encoded fat
+            fields, in base64 and listed in `BINARY` of the row, slices of
+            oversized fat fields joined back in, by default False, decode
+            through `batch_build`
+    segments: Number of segments to scan and write in parallel, by default 1
+    shard_rows: Max number of rows per file, `SHARD_ROWS` by default
+    compress: `gzip`, `bz2`, `lzma` or `None`, `gzip` by default
+    chunksize: Max number of items to get for each scan
+    filter_expr: ComparisonCondition object to filter records
+    fields: List of attribute names to export, all by default
+
+    Slice items are exported with the records they belong to, never on
+    their own, records with slices missing are counted in `errors` and
+    not written
+
+    @return `dict` of manifest, also written to `MANIFEST` under `path`,
+            `sliced` counts records written with slices joined
+    """
+    fmt = kwargs.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        raise ValueError("Unknown export format {}".format(fmt))
+    raw = kwargs.get('raw', False)
+    segments = kwargs.get('segments') or 1
+    shard_rows = kwargs.get('shard_rows', SHARD_ROWS)
+    compress = kwargs.get('compress', 'gzip')
+    chunksize = kwargs.get('chunksize', 1000)
+    fields = kwargs.get('fields')
+    filter_expr = Attr('slice_of').not_exists()
+    if kwargs.get('filter_expr') is not None:
+        filter_expr = filter_expr & kwargs['filter_expr']
+
+    brk = get_brk(cls.ID)
+    decode = {'lazy': False}
+    scan = {'fields': fields}
+    if fields:
+        cls.project_kwargs(scan, decode)
+    os.makedirs(path, exist_ok=True)
+    start = time.time()
+
+    def export_segment(segment):
+        writer = ShardWriter(path, segment, fmt, compress, shard_rows, cls.ID.value)
+        errors, sliced = 0, 0
+        try:
+            for rsp in brk._iscan_segment(filter_expr, chunksize, \
+                    segment if segments > 1 else None, segments if segments > 1 else None, **scan):
+                if raw:
+                    items = rsp['Items']
+                    errs = cls.join_slices(items, scan['fields'])
+                    rows = [raw_row(item) for item in items if id(item) not in errs]
+                    errors += len(errs)
+                    sliced += sum(1 for item in items if item.get(cls.SLICES) and id(item) not in errs)
+                else:
+                    objs, err_items = cls.batch_build(rsp['Items'], **decode)
+                    rows = [plain(obj()) for obj in objs]
+                    errors += len(err_items)
+                writer.write(rows)
+        finally:
+            writer.close()
+        return writer.shards, errors, sliced
+
+    with ThreadPoolExecutor(segments) as pool:
+        results = list(pool.map(export_segment, range(segments)))
+
+    shards = [shard for s, _, _ in results for shard in s]
+    keys = [s for s in shards if s['min_key'] is not None]
+    manifest = {
+            'table': TableBroker.ITEMID_TABLETYPE[cls.ID].value,
+            'format': fmt,
+            'raw': raw,
+            'compress': compress,
+            'fields': fields,
+            'segments': segments,
+            'created_ts': int(start),
+            'elapsed': time.time() - start,
+            'rows': sum(s['rows'] for s in shards),
+            'errors': sum(e for _, e, _ in results),
+            'sliced': sum(n for _, _, n in results),
+            'min_key': min(s['min_key'] for s in keys) if keys else None,
+            'max_key': max(s['max_key'] for s in keys) if keys else None,
+            'shards': shards,
+            }
+
+    tmp = os.path.join(path, MANIFEST + '.tmp')
+    with open(tmp, 'w') as fd:
+        fd.write(ujson.dumps(manifest, indent=2))
+    os.replace(tmp, os.path.join(path, MANIFEST))
+    return manifest
@@ -0,0 +1,181 @@
+# Capacity governor
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Paces broker calls with token buckets sized to a fraction of table
+# capacity, learns the cost of each operation from `ConsumedCapacity`
+# and backs off on throttling
+import time
+from threading import Lock
+
+
+THROTTLE_ERRORS = (
+        'ProvisionedThroughputExceededException',
+        'ThrottlingException',
+        'RequestLimitExceeded',
+        )
+
+
+class TokenBucket(object):
+    """
+    Token bucket allows debt, a caller takes its tokens first and
+    sleeps until the bucket is refilled
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        Args:
+
+        rate: Tokens refilled per second
+        burst: Max number of tokens, `rate` by default
+        """
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.stamp = time.monotonic()
+        self._lock = Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def acquire(self, units):
+        with self._lock:
+            self._refill()
+            self.tokens -= units
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+    def charge(self, units):
+        """
+        Take extra tokens, or give back if `units` negative, without waiting
+        """
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.burst, self.tokens - units)
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill()
+            self.rate = rate
+
+
+class Governor(object):
+    """
+    Pace read and write calls of one table
+
+    Each operation starts with cost estimated from consumed capacity
+    of previous calls, estimated cost is reconciled when actual cost
+    is known
+    """
+
+    FRACTION = 0.5
+    MIN_SCALE = 0.05
+    RECOVERY = 0.01
+    DECAY = 0.2
+
+    def __init__(self, rcu=None, wcu=None, fraction=None):
+        """
+        Args:
+
+        rcu: Read capacity units of table, unlimited if not set
+        wcu: Write capacity units of table, unlimited if not set
+        fraction: Fraction of capacity to target, `FRACTION` by default
+        """
+        self.fraction = fraction or Governor.FRACTION
+        self.capacity = {'read': rcu, 'write': wcu}
+        self.scale = {'read': 1.0, 'write': 1.0}
+        self.buckets = {k: TokenBucket(v * self.fraction) if v else None \
+                for k, v in self.capacity.items()}
+        self.cost = {}
+        self.throttles = 0
+        self._lock = Lock()
+
+    def rate(self, kind):
+        bucket = self.buckets[kind]
+        return bucket.rate if bucket else None
+
+    def estimate(self, op, count=1):
+        return self.cost.get(op, 1.0) * count
+
+    def acquire(self, kind, op, count=1):
+        """
+        Wait for capacity of `count` items of `op`
+
+        @return Estimated capacity units taken
+        """
+        units = self.estimate(op, count)
+        bucket = self.buckets[kind]
+        if bucket:
+            bucket.acquire(units)
+        return units
+
+    def record(self, kind, op, count, units, consumed):
+        """
+        Learn actual cost of `op` and settle difference with estimated `units`
+        """
+        with self._lock:
+            if consumed is not None and count:
+                cost = self.cost.get(op)
+                per_item = consumed / count
+                self.cost[op] = per_item if cost is None else \
+                        cost + Governor.DECAY * (per_item - cost)
+            scale = min(1.0, self.scale[kind] + Governor.RECOVERY)
+            changed = scale != self.scale[kind]
+            self.scale[kind] = scale
+
+        bucket = self.buckets[kind]
+        if bucket:
+            if consumed is not None:
+                bucket.charge(consumed - units)
+            if changed:
+                bucket.set_rate(self.capacity[kind] * self.fraction * scale)
+
+    def throttled(self, kind, units=0):
+        """
+        Halve the rate of `kind` on throttling error, and give back `units`
+        taken for the call throttled as it consumed no capacity
+        """
+        with self._lock:
+            self.throttles += 1
+            self.scale[kind] = max(Governor.MIN_SCALE, self.scale[kind] / 2)
+            scale = self.scale[kind]
+
+        bucket = self.buckets[kind]
+        if bucket:
+            bucket.set_rate(self.capacity[kind] * self.fraction * scale)
+            if units:
+                bucket.charge(-units)
+
+
+def error_code(ex):
+    """
+    Error code of a botocore `ClientError`, `None` for other errors,
+    checked by attribute so botocore is not imported
+    """
+    rsp = getattr(ex, 'response', None)
+    return rsp.get('Error', {}).get('Code') if isinstance(rsp, dict) else None
+
+
+def unprocessed_count(rsp):
+    """
+    Number of items left in `UnprocessedItems` or `UnprocessedKeys` of response
+    """
+    if not rsp:
+        return 0
+    items = sum(len(v) for v in (rsp.get('UnprocessedItems') or {}).values())
+    keys = sum(len(v.get('Keys', ())) for v in (rsp.get('UnprocessedKeys') or {}).values())
+    return items + keys
+
+
+def consumed_capacity(rsp):
+    """
+    Sum up `ConsumedCapacity` in response, `None` if not returned
+    """
+    cap = rsp.get('ConsumedCapacity') if rsp else None
+    if cap is None:
+        return None
+    if isinstance(cap, dict):
+        cap = [cap]
+    return sum(float(c.get('CapacityUnits', 0)) for c in cap)
@@ -0,0 +1,346 @@
+# Bulk loader
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Load records from NDJSON files or directories written by `Table.export`,
+# lines are parsed and encoded in a worker pool, encoded items are fed
+# to concurrent `TableBroker.batch_put` writers
+import base64
+import bz2
+import contextvars
+import gzip
+import lzma
+import os
+import time
+import ujson
+import uuid
+from collections import deque
+from decimal import Decimal
+from queue import Queue
+from threading import Event, Lock, Thread
+from data_model.dynamodb.common.bloom import KnownSet
+from data_model.dynamodb.common.utils import get_executor, iter_chunks
+from data_model.dynamodb.core.broker import get_brk
+from data_model.dynamodb.core.export import BINARY, MANIFEST
+from data_model.dynamodb.core.governor import TokenBucket
+
+CHUNKSIZE = 500
+WRITERS = 4
+REPORT_INTERVAL = 10
+# Max number of error samples kept in stats
+MAX_ERRORS = 100
+
+OPENERS = {
+        '.gz': gzip.open,
+        '.bz2': bz2.open,
+        '.xz': lzma.open,
+        }
+
+
+def open_text(path):
+    return OPENERS.get(os.path.splitext(path)[1], open)(path, 'rt')
+
+
+def iter_sources(paths, chunksize=CHUNKSIZE):
+    """
+    Read lines of given files chunk by chunk, directories are read
+    through their export manifest
+
+    @return Generator of tuples of `raw`, `columnar` and a list of lines
+    """
+    for path in paths:
+        raw, columnar, files = False, False, [path]
+        if os.path.isdir(path):
+            with open(os.path.join(path, MANIFEST)) as fd:
+                manifest = ujson.load(fd)
+            raw, columnar = manifest['raw'], manifest['format'] == 'columnar'
+            files = [os.path.join(path, s['file']) for s in manifest['shards']]
+
+        for name in files:
+            with open_text(name) as fd:
+                for lines in iter_chunks((line for line in fd if line.strip()), chunksize):
+                    yield raw, columnar, lines
+
+
+def attr_value(val):
+    """
+    Convert JSON value into attribute value, floats are not accepted by boto3
+    """
+    if isinstance(val, float):
+        return Decimal(str(val))
+    if isinstance(val, dict):
+        return {k: attr_value(v) for k, v in val.items()}
+    if isinstance(val, list):
+        return [attr_value(v) for v in val]
+    return val
+
+
+def parse_chunk(cls, lines, raw=False, columnar=False):
+    """
+    Parse and encode lines into items, runs in parse workers
+
+    Args:
+    cls: `Table` subclass
+    lines: List of JSON lines
+    raw: If `True`, lines are items as scanned, fat fields encoded in base64
+    columnar: If `True`, each line is a block of columns
+
+    @return A list of tuple of record item and its slice items
+            A list of tuple indicates error rows and correspoinding error
+    """
+    encoded, err_items = [], []
+    for line in lines:
+        try:
+            val = ujson.loads(line)
+            rows = [dict(zip(val['columns'], r)) for r in zip(*val['columns'].values())] \
+                    if columnar else [val]
+        except Exception as ex:
+            err_items.append((line, ex))
+            continue
+
+        for row in rows:
+            try:
+                row = {k: v if k in cls._fat_fields else attr_value(v) for k, v in row.items()}
+                if not row.get(cls.ID.value):
+                    raise AttributeError("Invalid record without item id")
+                if raw:
+                    item, slice_items = raw_item(cls, row)
+                else:
+                    item, slice_items, _ = cls(row).to_items()
+                encoded.append((item, slice_items))
+            except Exception as ex:
+                err_items.append((row, ex))
+    return encoded, err_items
+
+
+def raw_item(cls, row):
+    """
+    Restore item exported in raw mode, binary attributes listed in `BINARY`
+    of the row are decoded from base64, fat fields if not listed as exports
+    before the list was kept, fat fields sliced when exported are split into
+    slices again
+
+    @return The record item
+            A list of slice items
+    """
+    binary = row.pop(BINARY, None)
+    for k in (cls._fat_fields if binary is None else binary):
+        if isinstance(row.get(k), str):
+            row[k] = base64.b64decode(row[k])
+
+    slices = row.get(cls.SLICES) or {}
+    slice_items, version = [], uuid.uuid4().hex[:8]
+    for f in cls._fat_fields:
+        if isinstance(row.get(f), bytes):
+            if f in slices:
+                slices[f], chunks = cls.split_field(row[cls.ID.value], f, row.pop(f), version)
+                slice_items.extend(chunks)
+        elif f in slices:
+            raise AttributeError("Slices of {} not in raw export".format(f))
+    return row, slice_items
+
+
+class LoadStats(object):
+
+    def __init__(self):
+        self.start = time.time()
+        self.read = 0
+        self.written = 0
+        self.skipped = 0
+        self.failed = 0
+        self.errors = []
+        self._lock = Lock()
+
+    def add(self, **kwargs):
+        with self._lock:
+            for k, v in kwargs.items():
+                setattr(self, k, getattr(self, k) + v)
+
+    def error(self, failed):
+        """
+        Count failures, keep the first `MAX_ERRORS` samples
+
+        Args:
+        failed: List of tuple of row or item and error
+        """
+        with self._lock:
+            self.failed += len(failed)
+            self.errors.extend((str(row)[:200], repr(ex)) for row, ex in \
+                    failed[:MAX_ERRORS - len(self.errors)])
+
+    def __call__(self):
+        elapsed = time.time() - self.start
+        return {
+                'read': self.read,
+                'written': self.written,
+                'skipped': self.skipped,
+                'failed': self.failed,
+                'elapsed': elapsed,
+                'rate': self.written / elapsed if elapsed else 0,
+                'errors': list(self.errors),
+                }
+
+
+def print_progress(stats):
+    print('++ [load] read {read} written {written} skipped {skipped} failed {failed} '\
+            '{rate:.1f}/s'.format(**stats))
+
+
+def bulk_load(cls, paths, **kwargs):
+    """
+    Load records of table `cls` from files
+
+    Args:
+    cls: `Table` subclass
+    paths: List of NDJSON files, optionally compressed, or directories
+            written by `Table.export`
+    parse_pool: `process` or `thread` to parse in, `process` by default, `None` to parse serially
+    parse_workers: Max number of parse workers, number of CPUs by default
+    chunksize: Number of lines per parse task, `CHUNKSIZE` by default
+    writers: Number of concurrent `batch_put` writers, `WRITERS` by default
+    rate: Max number of items written per second, unlimited by default
+    capacity_fraction: Pace writes at a fraction of table capacity during the call,
+            reference to `TableBroker.governed`
+    uniq: If `True`, skip records whose `source_unique` exists in table or
+            appears earlier in input, reference to `TableBroker.uniq_batch_put`,
+            slices of oversized fat fields are written after their records
+    known: A `BloomFilter` or `KnownSet` of all existing `source_unique` values for `uniq`,
+            values missing from it are not looked up in table
+    progress: Callable receives stats every `report_interval` seconds,
+            `True` to print progress
+    report_interval: Seconds between progress reports, `REPORT_INTERVAL` by default
+
+    @return `dict` of stats, read, written, skipped, failed, elapsed, rate and error samples
+    """
+    brk = get_brk(cls.ID)
+    if kwargs.get('capacity_fraction'):
+        with brk.governed(fraction=kwargs.pop('capacity_fraction')):
+            return bulk_load(cls, paths, **kwargs)
+
+    pool = kwargs.get('parse_pool', 'process')
+    workers = kwargs.get('parse_workers') or os.cpu_count() or 1
+    chunksize = kwargs.get('chunksize', CHUNKSIZE)
+    writers = kwargs.get('writers', WRITERS)
+    rate = kwargs.get('rate')
+    uniq = kwargs.get('uniq', False)
+    known = kwargs.get('known')
+    progress = kwargs.get('progress')
+    interval = kwargs.get('report_interval', REPORT_INTERVAL)
+
+    # Values of a `known` given are all in table, those of this load only otherwise
+    complete = known is not None
+    if uniq and known is None:
+        known = KnownSet()
+    if progress is True:
+        progress = print_progress
+
+    bucket = TokenBucket(rate) if rate else None
+    stats = LoadStats()
+    que = Queue(writers * 2)
+    stopped = Event()
+
+    # `source_unique` values taken by writers of this load
+    claimed, claim_lock = set(), Lock()
+
+    def claim(encoded):
+        """
+        Records of `source_unique` not known or taken by other writers, the
+        first one of each value wins
+        """
+        fresh = []
+        with claim_lock:
+            for item, slices in encoded:
+                su = item.get('source_unique')
+                # Hits of a `BloomFilter` are confirmed by `uniq_batch_put`
+                if su in claimed or (getattr(known, 'exact', True) and su in known):
+                    continue
+                claimed.add(su)
+                fresh.append((item, slices))
+        stats.add(skipped=len(encoded) - len(fresh))
+        return fresh
+
+    def write(encoded):
+        if bucket:
+            bucket.acquire(len(encoded))
+        if not uniq:
+            # Records are written only after all their slices are
+            records = {item[cls.ID.value]: item for item, _ in encoded}
+            slices = [x for _, s in encoded for x in s]
+            failed = brk.batch_put(slices, report=True, workers=1) if slices else []
+            failed = [(records.pop(item['slice_of']), ex) for item, ex in failed if item['slice_of'] in records]
+            err_items = brk.batch_put(list(records.values()), report=True, workers=1)
+            failed.extend(err_items)
+            stats.add(written=len(records) - len(err_items))
+            stats.error(failed)
+            return
+
+        # Uniqueness is settled by writing records first, slices follow for
+        # records written only, those of duplicates are never written
+        encoded = claim(encoded)
+        slices_of = {item[cls.ID.value]: slices for item, slices in encoded}
+        written, failed = brk.uniq_batch_put([item for item, _ in encoded], known=known, \
+                complete=complete, workers=writers)
+        stats.add(skipped=len(encoded) - len(written) - len(failed))
+
+        records = {item[cls.ID.value]: item for item in written}
+        slices = [x for iid in records for x in slices_of[iid]]
+        err_slices = brk.batch_put(slices, report=True, workers=1) if slices else []
+        broken = {}
+        for item, ex in err_slices:
+            broken.setdefault(item['slice_of'], ex)
+        if broken:
+            # Records and slices written by this load only, none of others
+            brk.batch_delete([{cls.ID.value: x[cls.ID.value]} for iid in broken \
+                    for x in [records[iid]] + slices_of[iid]], report=True, workers=1)
+            failed.extend((records.pop(iid), ex) for iid, ex in broken.items())
+        stats.add(written=len(records))
+        stats.error(failed)
+
+    def writer():
+        while True:
+            encoded = que.get()
+            if encoded is None:
+                return
+            try:
+                write(encoded)
+            except Exception as ex:
+                stats.error([(item, ex) for item, _ in encoded])
+
+    def reporter():
+        while not stopped.wait(interval):
+            progress(stats())
+
+    # Writers run in the context of the call, eg. its `governed` block
+    threads = [Thread(target=contextvars.copy_context().run, args=(writer,), daemon=True) \
+            for _ in range(writers)]
+    if progress:
+        threads.append(Thread(target=reporter, daemon=True))
+    _ = [t.start() for t in threads]
+
+    def parsed():
+        chunks = iter_sources(paths, chunksize)
+        if not pool:
+            yield from (parse_chunk(cls, lines, raw, columnar) for raw, columnar, lines in chunks)
+            return
+        # At most twice as many chunks in flight as workers
+        executor, pending = get_executor(pool, workers), deque()
+        for raw, columnar, lines in chunks:
+            pending.append(executor.submit(parse_chunk, cls, lines, raw, columnar))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    try:
+        for encoded, err_items in parsed():
+            stats.add(read=len(encoded) + len(err_items))
+            stats.error(err_items)
+            if encoded:
+                que.put(encoded)
+    finally:
+        _ = [que.put(None) for _ in range(writers)]
+        _ = [t.join() for t in threads[:writers]]
+        stopped.set()
+
+    if progress:
+        progress(stats())
+    return stats()
@@ -0,0 +1,485 @@
+# Embedded local table store
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# In-memory stand-in for the DynamoDB resource, serves the `Table` calls
+# `TableBroker` makes, so tables run unchanged for local development,
+# CI and edge deployments
+#
+# Select it with `DYDB_BACKEND=local`, set `DYDB_LOCAL_PATH` to load
+# the store from a file at start and dump it back at exit
+#
+#\sa https://boto3.readthedocs.io/en/latest/_modules/boto3/dynamodb/conditions.html
+import atexit
+import os
+import zlib
+from bisect import bisect_right, insort
+from threading import RLock
+from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import AttributeBase
+from boto3.dynamodb.types import Binary
+from data_model.dynamodb.common.shared import INDEXES
+from data_model.dynamodb.common.utils import simple_unzip, simple_zip
+from data_model.dynamodb.core.metrics import item_bytes
+from data_model.dynamodb.core.planner import key_eq
+
+
+# Operators of conditions served, as built by `Key` and `Attr`
+OPERATORS = frozenset((
+        'AND', 'OR', 'NOT', 'attribute_exists', 'attribute_not_exists', 'attribute_type',
+        '=', '<>', '<', '<=', '>', '>=', 'BETWEEN', 'IN', 'begins_with', 'contains',
+        ))
+
+
+def validate(cond, op):
+    """
+    Reject condition `cond` of call `op` with operators not served,
+    as DynamoDB rejects invalid expressions, before any item is read
+
+    @raise `ClientError` of `ValidationException`
+    """
+    expr = cond.get_expression()
+    if expr['operator'] not in OPERATORS:
+        raise validation_error(op, "Operator {} not supported".format(expr['operator']))
+    for val in expr['values']:
+        if hasattr(val, 'get_expression') and val.get_expression()['operator'] != 'size':
+            validate(val, op)
+
+
+def operand(val, item):
+    """
+    Value of an operand of condition against `item`, attribute names and
+    `size()` resolved
+    """
+    # `Size` is an attribute with expression
+    if hasattr(val, 'get_expression'):
+        found = operand(val.get_expression()['values'][0], item)
+        return None if found is None else len(found.value if isinstance(found, Binary) else found)
+    if isinstance(val, AttributeBase):
+        return item.get(val.name)
+    return val
+
+
+def evaluate(cond, item):
+    """
+    Evaluate a `Key` or `Attr` condition against `item`, reference to
+    `validate` for operators served
+
+    Args:
+    cond: ConditionBase object, as built by `Key` and `Attr`
+    item: A `dict` item
+    """
+    expr = cond.get_expression()
+    op, values = expr['operator'], expr['values']
+
+    if op == 'AND':
+        return all(evaluate(c, item) for c in values)
+    if op == 'OR':
+        return any(evaluate(c, item) for c in values)
+    if op == 'NOT':
+        return not evaluate(values[0], item)
+    if op == 'attribute_exists':
+        return values[0].name in item
+    if op == 'attribute_not_exists':
+        return values[0].name not in item
+
+    val = operand(values[0], item)
+    args = [operand(v, item) for v in values[1:]]
+    if op == 'attribute_type':
+        return type_of(val) == args[0]
+    if val is None:
+        return op == '<>'
+
+    try:
+        if op == '=':
+            return val == args[0]
+        if op == '<>':
+            return val != args[0]
+        if op == '<':
+            return val < args[0]
+        if op == '<=':
+            return val <= args[0]
+        if op == '>':
+            return val > args[0]
+        if op == '>=':
+            return val >= args[0]
+        if op == 'BETWEEN':
+            return args[0] <= val <= args[1]
+        if op == 'IN':
+            return val in args[0]
+        if op == 'begins_with':
+            return val.startswith(args[0])
+        if op == 'contains':
+            return args[0] in val
+    except (TypeError, AttributeError):
+        # Values of different types never match, as in DynamoDB
+        return False
+    raise validation_error('Query', "Operator {} not supported".format(op))
+
+
+def type_of(val):
+    """
+    DynamoDB type descriptor of `val`
+    """
+    if isinstance(val, str):
+        return 'S'
+    if isinstance(val, bool):
+        return 'BOOL'
+    if isinstance(val, (int, float)) or type(val).__name__ == 'Decimal':
+        return 'N'
+    if isinstance(val, (Binary, bytes, bytearray)):
+        return 'B'
+    if isinstance(val, dict):
+        return 'M'
+    if isinstance(val, list):
+        return 'L'
+    if val is None:
+        return 'NULL'
+    return 'SS' if isinstance(val, set) else None
+
+
+def projected(item, kwargs):
+    """
+    Copy of `item` with attributes in `ProjectionExpression` only
+    """
+    if 'ProjectionExpression' not in kwargs:
+        return dict(item)
+    names = kwargs.get('ExpressionAttributeNames', {})
+    fields = (names.get(f.strip(), f.strip()) for f in kwargs['ProjectionExpression'].split(','))
+    return {f: item[f] for f in fields if f in item}
+
+
+def stored(item):
+    """
+    Copy of `item` as read back by boto3, binary attributes wrapped in `Binary`
+    """
+    return {k: Binary(bytes(v)) if isinstance(v, (bytes, bytearray, memoryview)) else v \
+            for k, v in item.items()}
+
+
+def validation_error(op, message):
+    return ClientError({'Error': {
+        'Code': 'ValidationException',
+        'Message': message,
+        }}, op)
+
+
+def condition_failed(op):
+    return ClientError({'Error': {
+        'Code': 'ConditionalCheckFailedException',
+        'Message': 'The conditional request failed',
+        }}, op)
+
+
+class LocalClient(object):
+    """
+    Batch operations of `meta.client`, never leaves anything unprocessed
+    """
+
+    def __init__(self, resource):
+        self.resource = resource
+
+    def batch_get_item(self, RequestItems, **kwargs):
+        rsp = {}
+        for name, req in RequestItems.items():
+            table = self.resource.Table(name)
+            rsp[name] = [projected(item, req) for item in \
+                    map(table.lookup, req['Keys']) if item is not None]
+        return {'Responses': rsp, 'UnprocessedKeys': {}}
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        for name, reqs in RequestItems.items():
+            table = self.resource.Table(name)
+            for req in reqs:
+                if 'PutRequest' in req:
+                    table.put_item(Item=req['PutRequest']['Item'])
+                else:
+                    table.delete_item(Key=req['DeleteRequest']['Key'])
+        return {'UnprocessedItems': {}}
+
+
+class LocalMeta(object):
+
+    def __init__(self, client):
+        self.client = client
+
+
+class LocalTable(object):
+    """
+    Items kept in a `dict` by hash key with a sorted list of keys, pages
+    are served in key order, `LastEvaluatedKey` resumes after the last
+    key evaluated
+
+    Queries on attributes other than the hash key, eg. `source_unique_index`,
+    are served by a secondary index built on first query and kept up to
+    date by writes afterwards, queries naming an index the table does not
+    describe are rejected
+    """
+
+    def __init__(self, name, hash_key, resource):
+        self.name = name
+        self.hash_key = hash_key
+        self.meta = LocalMeta(resource.client)
+        self.provisioned_throughput = None
+        self.index_names = resource.index_names(name)
+        self._items = {}
+        self._keys = []
+        self._indexes = {}
+        self._lock = RLock()
+
+    def __getstate__(self):
+        return {'name': self.name, 'hash_key': self.hash_key, 'items': self._items}
+
+    @property
+    def global_secondary_indexes(self):
+        return [{'IndexName': n} for n in self.index_names] or None
+
+    @property
+    def item_count(self):
+        return len(self._items)
+
+    @property
+    def table_size_bytes(self):
+        """
+        Estimated, as `item_bytes` counts
+        """
+        with self._lock:
+            return item_bytes(self._items.values())
+
+    def lookup(self, key):
+        return self._items.get(key[self.hash_key])
+
+    def _index(self, name):
+        """
+        Secondary index of attribute `name`, maps values to sorted keys
+        """
+        index = self._indexes.get(name)
+        if index is None:
+            index = {}
+            for k in self._keys:
+                val = self._items[k].get(name)
+                if val is not None:
+                    index.setdefault(val, []).append(k)
+            self._indexes[name] = index
+        return index
+
+    def _store(self, key, item):
+        old = self._items.get(key)
+        if old is None:
+            insort(self._keys, key)
+        for name, index in self._indexes.items():
+            prev, val = (old or {}).get(name), (item or {}).get(name)
+            if prev == val and old is not None and item is not None:
+                continue
+            if prev is not None:
+                index[prev].remove(key)
+                if not index[prev]:
+                    del index[prev]
+            if val is not None:
+                insort(index.setdefault(val, []), key)
+
+        if item is None:
+            del self._items[key]
+            del self._keys[bisect_right(self._keys, key) - 1]
+        else:
+            self._items[key] = item
+
+    def put_item(self, Item, **kwargs):
+        key = Item[self.hash_key]
+        cond = kwargs.get('ConditionExpression')
+        if cond is not None:
+            validate(cond, 'PutItem')
+        with self._lock:
+            if cond is not None and not evaluate(cond, self._items.get(key, {})):
+                raise condition_failed('PutItem')
+            self._store(key, stored(Item))
+        return {}
+
+    def get_item(self, Key, **kwargs):
+        item = self.lookup(Key)
+        return {'Item': projected(item, kwargs)} if item is not None else {}
+
+    def delete_item(self, Key, **kwargs):
+        key = Key[self.hash_key]
+        cond = kwargs.get('ConditionExpression')
+        if cond is not None:
+            validate(cond, 'DeleteItem')
+        with self._lock:
+            item = self._items.get(key)
+            if cond is not None and not evaluate(cond, item or {}):
+                raise condition_failed('DeleteItem')
+            if item is not None:
+                self._store(key, None)
+        if kwargs.get('ReturnValues') == 'ALL_OLD' and item:
+            return {'Attributes': dict(item)}
+        return {}
+
+    def update_item(self, Key, UpdateExpression, **kwargs):
+        """
+        Apply `SET` and `REMOVE` clauses, as built by `TableBroker._update`
+        """
+        names = kwargs.get('ExpressionAttributeNames', {})
+        values = kwargs.get('ExpressionAttributeValues', {})
+        cond = kwargs.get('ConditionExpression')
+        key = Key[self.hash_key]
+        set_part, _, remove_part = UpdateExpression.partition('REMOVE')
+        set_part = set_part.strip()
+        if set_part and not set_part.startswith('SET'):
+            raise validation_error('UpdateItem', "Update expression {} not supported".format(UpdateExpression))
+        if cond is not None:
+            validate(cond, 'UpdateItem')
+
+        with self._lock:
+            old = self._items.get(key)
+            if cond is not None and not evaluate(cond, old or {}):
+                raise condition_failed('UpdateItem')
+            item = dict(old or Key)
+            for pair in filter(None, map(str.strip, set_part[3:].split(','))):
+                k, v = map(str.strip, pair.split('='))
+                item[names.get(k, k)] = values[v]
+            for k in filter(None, map(str.strip, remove_part.split(','))):
+                item.pop(names.get(k, k), None)
+            item = stored(item)
+            self._store(key, item)
+
+        ret = kwargs.get('ReturnValues', 'NONE')
+        if ret == 'ALL_NEW':
+            return {'Attributes': dict(item)}
+        if ret == 'ALL_OLD' and old:
+            return {'Attributes': dict(old)}
+        return {}
+
+    def query(self, KeyConditionExpression, **kwargs):
+        found = key_eq(KeyConditionExpression)
+        if not found:
+            raise validation_error('Query', 'Query key condition requires an equality')
+        name, val = found
+        validate(KeyConditionExpression, 'Query')
+        ind = kwargs.get('IndexName')
+        if ind and ind not in self.index_names:
+            raise validation_error('Query', 'The table does not have the specified index: {}'.format(ind))
+        if kwargs.get('FilterExpression') is not None:
+            validate(kwargs['FilterExpression'], 'Query')
+
+        with self._lock:
+            if name == self.hash_key:
+                keys = [val] if val in self._items else []
+            else:
+                keys = list(self._index(name).get(val, ()))
+        return self._page(keys, KeyConditionExpression, kwargs)
+
+    def scan(self, **kwargs):
+        if kwargs.get('FilterExpression') is not None:
+            validate(kwargs['FilterExpression'], 'Scan')
+        with self._lock:
+            keys = list(self._keys)
+        total = kwargs.get('TotalSegments')
+        if total:
+            seg = kwargs['Segment']
+            keys = [k for k in keys if zlib.crc32(str(k).encode()) % total == seg]
+        return self._page(keys, None, kwargs)
+
+    def _page(self, keys, cond, kwargs):
+        """
+        One page of items of sorted `keys`, `Limit` counts items evaluated
+        before `FilterExpression` applies, as DynamoDB does
+        """
+        esk = kwargs.get('ExclusiveStartKey')
+        start = bisect_right(keys, esk[self.hash_key]) if esk else 0
+        limit = kwargs.get('Limit') or len(keys)
+        filter_expr = kwargs.get('FilterExpression')
+        page = keys[start:start+limit]
+
+        items, scanned = [], 0
+        for key in page:
+            item = self._items.get(key)
+            if item is None:
+                continue
+            scanned += 1
+            if cond is not None and not evaluate(cond, item):
+                continue
+            if filter_expr is None or evaluate(filter_expr, item):
+                items.append(projected(item, kwargs))
+
+        rsp = {'Items': items, 'Count': len(items), 'ScannedCount': scanned}
+        if start + limit < len(keys):
+            rsp['LastEvaluatedKey'] = {self.hash_key: page[-1]}
+            if cond is not None:
+                name, val = key_eq(cond)
+                rsp['LastEvaluatedKey'].setdefault(name, val)
+        return rsp
+
+
+class LocalResource(object):
+    """
+    Stand-in of the DynamoDB resource
+
+    Args:
+    hash_keys: `dict` maps table names to hash key names
+    path: File to load tables from and dump tables to
+    indexes: `dict` maps table names to names of global secondary indexes,
+            those registered in `shared.INDEXES` by default
+    """
+
+    def __init__(self, hash_keys, path=None, indexes=None):
+        self.hash_keys = hash_keys
+        self.path = path
+        self.indexes = indexes
+        self.client = LocalClient(self)
+        self.tables = {}
+        self._lock = RLock()
+        if path and os.path.isfile(path):
+            self.load(path)
+
+    def Table(self, name):
+        table = self.tables.get(name)
+        if table is None:
+            with self._lock:
+                if name not in self.tables:
+                    if name not in self.hash_keys:
+                        raise ClientError({'Error': {'Code': 'ResourceNotFoundException', \
+                                'Message': 'Table {} not found'.format(name)}}, 'DescribeTable')
+                    self.tables[name] = LocalTable(name, self.hash_keys[name], self)
+                table = self.tables[name]
+        return table
+
+    def index_names(self, name):
+        """
+        Names of global secondary indexes of table `name`
+        """
+        if self.indexes is not None:
+            return list(self.indexes.get(name, ()))
+        registered = {t.value: specs for t, specs in INDEXES.items()}.get(name, {})
+        return [gsi.value for gsi in registered if gsi is not None]
+
+    def dump(self, path=None):
+        """
+        Write all tables to `path`, replaced atomically
+        """
+        path = path or self.path
+        tmp = '{}.tmp'.format(path)
+        with self._lock:
+            data = {name: t.__getstate__() for name, t in self.tables.items()}
+        with open(tmp, 'wb') as fd:
+            fd.write(simple_zip(data) or b'')
+        os.replace(tmp, path)
+
+    def load(self, path=None):
+        with open(path or self.path, 'rb') as fd:
+            data = simple_unzip(fd.read()) or {}
+        for name, state in data.items():
+            table = LocalTable(name, state['hash_key'], self)
+            for key, item in state['items'].items():
+                table._store(key, item)
+            self.tables[name] = table
+
+
+def get_local_resource(hash_keys, path=None):
+    """
+    Local store shared in this process, dumped at exit if `path` given
+    """
+    if not globals().get('local_resource'):
+        resource = LocalResource(hash_keys, path)
+        if path:
+            atexit.register(resource.dump)
+        globals()['local_resource'] = resource
+    return globals().get('local_resource')
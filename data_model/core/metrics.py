@@ -0,0 +1,202 @@
+# Broker and table instrumentation
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Disabled by default, callers check `enabled` before taking any timing,
+# so nothing but an attribute lookup is paid when off
+import os
+import time
+import ujson
+from bisect import bisect_left
+from functools import wraps
+from threading import Lock, Thread
+from data_model.dynamodb.common.utils import LazyAttr
+
+Binary = LazyAttr('boto3.dynamodb.types', 'Binary')
+
+
+class Histogram(object):
+
+    BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+    def __init__(self, buckets=None):
+        self.buckets = buckets or Histogram.BUCKETS
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def __call__(self):
+        cum, buckets = 0, []
+        for le, cnt in zip(self.buckets + (float('inf'),), self.counts):
+            cum += cnt
+            buckets.append((le, cum))
+        return {'buckets': buckets, 'sum': self.sum, 'count': self.count}
+
+
+class Metrics(object):
+    """
+    Per operation latency histograms and counters
+
+    Counters: calls, errors, items, bytes, pages, capacity, retries
+    """
+
+    COUNTERS = ('calls', 'errors', 'items', 'bytes', 'pages', 'capacity', 'retries')
+    PREFIX = 'data_model'
+
+    def __init__(self):
+        self.enabled = False
+        self._ops = {}
+        self._hooks = []
+        self._lock = Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def add_hook(self, fn):
+        """
+        Call `fn(op, latency, counters)` on each observation
+        """
+        self._hooks.append(fn)
+
+    def remove_hook(self, fn):
+        self._hooks.remove(fn)
+
+    def observe(self, op, latency=None, **counters):
+        """
+        Record one observation of `op`
+
+        Args:
+        op: Operation name
+        latency: Seconds spent, if any
+        counters: Values to add to counters in `COUNTERS`
+        """
+        with self._lock:
+            stat = self._ops.get(op)
+            if stat is None:
+                stat = self._ops[op] = {'latency': Histogram()}
+                stat.update({k: 0 for k in Metrics.COUNTERS})
+            if latency is not None:
+                stat['latency'].observe(latency)
+            for k, v in counters.items():
+                stat[k] += v
+        for fn in self._hooks:
+            fn(op, latency, counters)
+
+    def reset(self):
+        with self._lock:
+            self._ops.clear()
+
+    def snapshot(self):
+        """
+        @return `dict` of all operations and their metrics
+        """
+        with self._lock:
+            return {op: {k: v() if isinstance(v, Histogram) else v \
+                    for k, v in stat.items()} for op, stat in self._ops.items()}
+
+    def to_prometheus(self):
+        """
+        @return Metrics in Prometheus text exposition format
+        """
+        name = '{}_op'.format(Metrics.PREFIX)
+        lines = ['# TYPE {}_latency_seconds histogram'.format(name)]
+        snap = self.snapshot()
+
+        for op, stat in snap.items():
+            hist = stat['latency']
+            for le, cnt in hist['buckets']:
+                le = '+Inf' if le == float('inf') else repr(le)
+                lines.append('{}_latency_seconds_bucket{{op="{}",le="{}"}} {}'.format(name, op, le, cnt))
+            lines.append('{}_latency_seconds_sum{{op="{}"}} {}'.format(name, op, hist['sum']))
+            lines.append('{}_latency_seconds_count{{op="{}"}} {}'.format(name, op, hist['count']))
+
+        for k in Metrics.COUNTERS:
+            lines.append('# TYPE {}_{}_total counter'.format(name, k))
+            lines.extend('{}_{}_total{{op="{}"}} {}'.format(name, k, op, stat[k]) \
+                    for op, stat in snap.items())
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path, format='prometheus'):
+        """
+        Write snapshot to `path` atomically
+
+        Args:
+        path: Output file path
+        format: `prometheus` or `json`
+        """
+        if format == 'json':
+            data = ujson.dumps({'ts': time.time(), 'ops': self.snapshot()})
+        else:
+            data = self.to_prometheus()
+        tmp = '{}.tmp'.format(path)
+        with open(tmp, 'w') as fd:
+            fd.write(data)
+        os.replace(tmp, path)
+
+    def start_exporter(self, path, interval=15, format='prometheus'):
+        """
+        Export to `path` every `interval` seconds in a daemon thread,
+        enables metrics
+        """
+        self.enable()
+
+        def run():
+            while self.enabled:
+                time.sleep(interval)
+                self.export(path, format)
+
+        thread = Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+
+def item_bytes(items):
+    """
+    Estimate payload size of items by their string and binary values
+    """
+    size = 0
+    for item in items:
+        for k, v in item.items():
+            size += len(k)
+            if isinstance(v, Binary):
+                size += len(v.value)
+            elif isinstance(v, (str, bytes, bytearray)):
+                size += len(v)
+            else:
+                size += 8
+    return size
+
+
+def timed(op):
+    """
+    Record latency of decorated function as `op` when metrics enabled
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            metrics = get_metrics()
+            if not metrics.enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                metrics.observe(op, errors=1)
+                raise
+            finally:
+                metrics.observe(op, time.perf_counter() - start, calls=1)
+        return wrapper
+    return decorator
+
+
+def get_metrics():
+    if not globals().get('metrics'):
+        globals()['metrics'] = Metrics()
+    return globals().get('metrics')
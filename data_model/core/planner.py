@@ -0,0 +1,424 @@
+# Query planner
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Route reads of a table to the cheapest access path by the key schemas
+# registered in `shared.INDEXES`
+#
+# Paths:
+#   get     Primary key lookup, a query of the key if filtered
+#   query   Query on the table or a global secondary index, followed by
+#           `batch_get` if the index does not project attributes needed
+#   scan    Full table scan with filter expression
+#
+# Cost is estimated in read capacity units of eventually consistent reads,
+# half a unit per 4KB read, from item count and size in table description,
+# refreshed every `STATS_TTL` seconds
+#
+#\sa https://docs.aws.amazon.com/amazondynamodb/latest/developerguide/ProvisionedThroughput.html
+import math
+import time
+from data_model.dynamodb.common.shared import INDEXES
+from data_model.dynamodb.common.utils import LazyAttr
+from data_model.dynamodb.core.broker import get_brk, TableBroker
+from data_model.dynamodb.core.governor import error_code
+
+Key = LazyAttr('boto3.dynamodb.conditions', 'Key')
+Attr = LazyAttr('boto3.dynamodb.conditions', 'Attr')
+AttributeBase = LazyAttr('boto3.dynamodb.conditions', 'AttributeBase')
+
+READ_UNIT = 4096
+# Approximate size of an index entry with keys only, in bytes
+KEY_BYTES = 100
+STATS_TTL = 3600
+# Seconds before a description failed is tried again
+STATS_RETRY = 60
+
+
+def key_eq(cond):
+    """
+    Find the equality condition of a key condition
+
+    @return Attribute name and value, `None` if not found
+    """
+    expr = cond.get_expression()
+    if expr['operator'] == '=':
+        return expr['values'][0].name, expr['values'][1]
+    if expr['operator'] == 'AND':
+        for c in expr['values']:
+            found = key_eq(c)
+            if found:
+                return found
+    return None
+
+
+def attr_names(cond):
+    """
+    Names of attributes referred by condition `cond`
+    """
+    names = set()
+    for val in cond.get_expression()['values']:
+        if isinstance(val, AttributeBase):
+            names.add(val.name)
+        elif hasattr(val, 'get_expression'):
+            names |= attr_names(val)
+    return names
+
+
+def describe(cond):
+    """
+    Readable form of condition `cond`, eg. `data_type = 'MARLENE_REPOSITORY'`
+    """
+    if cond is None:
+        return None
+    expr = cond.get_expression()
+    values = [describe(v) if hasattr(v, 'get_expression') else \
+            v.name if isinstance(v, AttributeBase) else repr(v) for v in expr['values']]
+    text = expr['format'].format(*values, operator=expr['operator'])
+    return '({})'.format(text) if expr['operator'] in ('AND', 'OR') else text
+
+
+def read_units(size):
+    """
+    Read units of reading `size` bytes in one request
+    """
+    return max(1, math.ceil(size / READ_UNIT)) * 0.5
+
+
+def cached_stats(brk):
+    """
+    Stats of `table_stats` if cached and fresh, the table is never described
+
+    @return Tuple as `table_stats` returns, `None` if not cached
+    """
+    cached = globals().get('stats:{}'.format(brk._table_name))
+    if cached and time.time() < cached[0]:
+        return cached[1:]
+    return None
+
+
+def table_stats(brk):
+    """
+    Item count, average item size and names of indexes in table description,
+    cached for `STATS_TTL` seconds
+
+    A table not found has no indexes, a description failed otherwise, eg.
+    denied to the role, leaves all unknown, tried again after `STATS_RETRY`
+    seconds
+
+    @return Tuple of item count, average item size in bytes and `set` of index
+            names, each `None` if unknown
+    """
+    cached = cached_stats(brk)
+    if cached:
+        return cached
+
+    name = 'stats:{}'.format(brk._table_name)
+    count, avg, names, ttl = None, None, None, STATS_TTL
+    try:
+        table = brk._table
+        count = table.item_count
+        avg = table.table_size_bytes / count if count else 0
+        names = {x['IndexName'] for x in table.global_secondary_indexes or ()}
+    except Exception as ex:
+        count, avg = None, None
+        if error_code(ex) == 'ResourceNotFoundException':
+            names = set()
+        else:
+            ttl = STATS_RETRY
+
+    globals()[name] = (time.time() + ttl, count, avg, names)
+    return count, avg, names
+
+
+class Plan(object):
+    """
+    Access path chosen for a call
+
+    Attributes:
+    op: Name of the call planned, eg. `iscan`
+    path: `get`, `query` or `scan`
+    key: Key `dict` for `get`
+    index: Index name for `query`, `None` for the table
+    cond: Key condition for `query`
+    filter_expr: Filter expression
+    fetch: If `True`, items are fetched by `batch_get` after `query`
+    cost: Estimated read units, `None` if table size unknown
+    alternatives: List of tuples of other paths considered and their estimated cost
+    notes: List of remarks on the choice
+    """
+
+    def __init__(self, op, path, **kwargs):
+        self.op = op
+        self.path = path
+        self.table = kwargs.get('table')
+        self.key = kwargs.get('key')
+        self.index = kwargs.get('index')
+        self.cond = kwargs.get('cond')
+        self.filter_expr = kwargs.get('filter_expr')
+        self.fetch = kwargs.get('fetch', False)
+        self.cost = kwargs.get('cost')
+        self.alternatives = []
+        self.notes = []
+
+    def pages(self, brk, **kwargs):
+        """
+        Pages of the `query` or `scan` planned
+
+        Args:
+        brk: `TableBroker` of the table
+        chunksize: Max number of items to get for each request
+        esk: Exclusive start key
+        fields: List of attribute names to return, all by default
+        segments: Number of segments to scan in parallel, scan only
+        ordered: If `True`, yield pages segment by segment, scan only
+        checkpoint: A `Checkpoint` to resume from and record progress to
+
+        Reference to `TableBroker._iquery` and `TableBroker._iscan`
+
+        @return Generator of responses
+        """
+        if self.path == 'query':
+            kw = {k: v for k, v in kwargs.items() if k not in ('segments', 'ordered')}
+            return brk._iquery(self.cond, self.index, filter_expr=self.filter_expr, **kw)
+        if self.path == 'scan':
+            return brk._iscan(filter_expr=self.filter_expr, **kwargs)
+        raise ValueError("Plan of path {} has no pages".format(self.path))
+
+    def signature(self):
+        """
+        Path, index, key condition and filter of the plan, as recorded by `Checkpoint`
+        """
+        return {
+                'path': self.path,
+                'index': self.index,
+                'cond': describe(self.cond),
+                'filter_expr': describe(self.filter_expr),
+                }
+
+    def __call__(self):
+        return {
+                'op': self.op,
+                'table': self.table,
+                'path': self.path,
+                'key': self.key,
+                'index': self.index,
+                'cond': describe(self.cond),
+                'filter_expr': describe(self.filter_expr),
+                'fetch': self.fetch,
+                'cost': self.cost,
+                'alternatives': [{'path': p, 'cost': c} for p, c in self.alternatives],
+                'notes': list(self.notes),
+                }
+
+    def __str__(self):
+        def units(cost):
+            return 'unknown' if cost is None else '{:.1f} RCU'.format(cost)
+
+        path = self.path
+        if self.path == 'query':
+            path = 'query {}'.format(self.index or 'table')
+        lines = ['{} on {}: {}'.format(self.op, self.table, path)]
+        if self.key:
+            lines.append('  key: {}'.format(self.key))
+        if self.cond is not None:
+            lines.append('  key condition: {}'.format(describe(self.cond)))
+        if self.filter_expr is not None:
+            lines.append('  filter: {}'.format(describe(self.filter_expr)))
+        if self.fetch:
+            lines.append('  fetch: batch_get')
+        lines.append('  estimated cost: {}'.format(units(self.cost)))
+        lines.extend('  vs {}: {}'.format(p, units(c)) for p, c in self.alternatives)
+        lines.extend('  note: {}'.format(n) for n in self.notes)
+        return '\n'.join(lines)
+
+
+class Planner(object):
+    """
+    Plan calls of table `cls`
+
+    Args:
+    cls: `Table` subclass
+    """
+
+    def __init__(self, cls):
+        self.cls = cls
+        self.brk = get_brk(cls.ID)
+        self.table = TableBroker.ITEMID_TABLETYPE[cls.ID]
+        self.specs = INDEXES.get(self.table, {})
+        self._stats = None
+
+    @property
+    def stats(self):
+        # Described on first need, keyed reads plan without
+        if self._stats is None:
+            self._stats = table_stats(self.brk)
+        return self._stats
+
+    @property
+    def count(self):
+        return self.stats[0]
+
+    @property
+    def avg(self):
+        return self.stats[1]
+
+    @property
+    def names(self):
+        return self.stats[2]
+
+    def available(self, gsi):
+        """
+        Whether index `gsi` exists, the table itself always does, indexes
+        registered are taken as existing if the table description is unknown
+        """
+        return gsi is None or self.names is None or gsi.value in self.names
+
+    def find_index(self, attr):
+        """
+        Index of hash key `attr`, the table first, then unique indexes
+
+        @return Tuple of `GSI` and `IndexSpec`, `None` if not found
+        """
+        found = [(gsi, spec) for gsi, spec in self.specs.items() \
+                if spec.hash_key == attr and self.available(gsi)]
+        found.sort(key=lambda x: (x[0] is not None, not x[1].unique, x[1].projection != 'ALL'))
+        return found[0] if found else None
+
+    def get_cost(self, keys=1):
+        if self.avg is None:
+            return None
+        return keys * read_units(self.avg)
+
+    def query_cost(self, spec, fetch):
+        if self.count is None:
+            return None
+        matches = 1 if spec.unique else self.count
+        entry = self.avg if spec.projection == 'ALL' else KEY_BYTES
+        cost = read_units(matches * entry)
+        if fetch:
+            cost += self.get_cost(matches)
+        return cost
+
+    def scan_cost(self):
+        if self.count is None:
+            return None
+        return read_units(self.count * self.avg)
+
+    def plan(self, op, **kwargs):
+        """
+        Plan `op` for its call arguments
+
+        Args:
+        op: `rebuild`, `iquery`, `iscan` or `delete`
+        id: Item identifier, planned as `get`, as a query of the key if `filter_expr` given
+        source_unique: `source_unique` value
+        cond: Key condition for query
+        ind: Index name for query, found by the hash key of `cond` if not given
+        filter_expr: ComparisonCondition object as filter expression
+        fields: List of attribute names needed, all by default
+        segments: Number of segments requested for scan
+        path: `query` or `scan` to take regardless of cost, eg. as recorded
+                by a checkpoint resumed, the cheaper one by default
+
+        @return `Plan`
+        """
+        cls = self.cls
+        id_name = cls.ID.value
+        filter_expr = kwargs.get('filter_expr')
+        fields = kwargs.get('fields')
+        common = {'table': self.table.value}
+
+        iid = kwargs.get('id')
+        if iid and self._stats is None:
+            # Keyed reads never describe the table, costed by stats cached if any
+            self._stats = cached_stats(self.brk) or (None, None, None)
+        if iid and filter_expr is not None:
+            # A get takes no filter, a query of the key reads as much and filters
+            plan = Plan(op, 'query', cond=Key(id_name).eq(iid), filter_expr=filter_expr, \
+                    cost=self.get_cost(), **common)
+            plan.notes.append('filtered, query of key instead of get')
+            return plan
+        if iid:
+            return Plan(op, 'get', key={id_name: iid}, cost=self.get_cost(), **common)
+
+        cond, ind = kwargs.get('cond'), kwargs.get('ind')
+        if cond is not None:
+            spec = None
+            if ind is None:
+                attr = (key_eq(cond) or (None,))[0]
+                found = self.find_index(attr)
+                if not found:
+                    raise ValueError("No index with hash key {} on {}".format(attr, self.table.value))
+                gsi, spec = found
+                ind = gsi.value if gsi else None
+            else:
+                if self.names is not None and ind not in self.names:
+                    raise ValueError("No index {} on {}".format(ind, self.table.value))
+                spec = {g.value if g else None: s for g, s in self.specs.items()}.get(ind)
+            fetch = spec is not None and not spec.projects(fields, (id_name,))
+            plan = Plan(op, 'query', index=ind, cond=cond, filter_expr=filter_expr, fetch=fetch, \
+                    cost=self.query_cost(spec, fetch) if spec else None, **common)
+            if ind and spec is None:
+                plan.notes.append('index {} not registered'.format(ind))
+            return plan
+
+        # Candidate queries by an attribute value, the fallback scan filters on it
+        source_unique = kwargs.get('source_unique')
+        typed = kwargs.get('typed', op != 'rebuild')
+        if source_unique:
+            attr, val = 'source_unique', source_unique
+        elif typed:
+            attr, val = 'data_type', cls.DT.value
+        else:
+            return Plan(op, 'scan', filter_expr=filter_expr, cost=self.scan_cost(), **common)
+
+        scan_filter = Attr(attr).eq(val) & filter_expr if filter_expr is not None else Attr(attr).eq(val)
+        scan = Plan(op, 'scan', filter_expr=scan_filter, cost=self.scan_cost(), **common)
+        if typed and attr != 'data_type':
+            # Checked by the query of the value instead if not projected
+            scan.filter_expr = Attr('data_type').eq(cls.DT.value) & scan.filter_expr
+
+        found = self.find_index(attr)
+        if not found:
+            scan.notes.append('no index on {}'.format(attr))
+            return scan
+        gsi, spec = found
+
+        query_filter = filter_expr
+        if typed and attr != 'data_type':
+            type_filter = Attr('data_type').eq(cls.DT.value)
+            if spec.projects(['data_type'], (id_name,)):
+                query_filter = type_filter & filter_expr if filter_expr is not None else type_filter
+        if query_filter is not None and not spec.projects(attr_names(query_filter), (id_name,)):
+            scan.notes.append('filter attributes not projected in {}'.format(gsi.value))
+            return scan
+
+        fetch = not spec.projects(fields, (id_name,))
+        query = Plan(op, 'query', index=gsi.value if gsi else None, cond=Key(attr).eq(val), \
+                filter_expr=query_filter, fetch=fetch, cost=self.query_cost(spec, fetch), **common)
+        if typed and attr != 'data_type' and query_filter is filter_expr:
+            query.notes.append('data_type not projected in {}, not filtered'.format(gsi.value))
+
+        if kwargs.get('path') in ('query', 'scan'):
+            chosen = query if kwargs['path'] == 'query' else scan
+            chosen.notes.append('{} requested'.format(chosen.path))
+            return chosen
+
+        if (kwargs.get('segments') or 1) > 1:
+            scan.notes.append('parallel scan requested')
+            scan.alternatives.append(('query {}'.format(query.index), query.cost))
+            return scan
+
+        # A query reads no more than the items it matches, unless fetched one by one
+        if query.cost is not None and scan.cost is not None and query.cost > scan.cost:
+            scan.alternatives.append(('query {}'.format(query.index), query.cost))
+            return scan
+        query.alternatives.append(('scan', scan.cost))
+        return query
+
+
+def plan(cls, op, **kwargs):
+    """
+    Plan `op` of table `cls`, reference to `Planner.plan`
+    """
+    return Planner(cls).plan(op, **kwargs)
@@ -0,0 +1,102 @@
+# DynamoDB connection pool
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# boto3 sessions and resources are not thread safe, each thread gets its
+# own session, resource and table objects, built with a shared botocore
+# `Config` for connection pool size, timeouts and keep-alive
+#
+# Settings, from environment through `get_config`:
+#   DYDB_ENDPOINT                 Endpoint URL, eg. DynamoDB Local
+#   DYDB_REGION                   Region name, boto3 default if not set
+#   DYDB_MAX_POOL_CONNECTIONS     Max HTTP connections of each thread, `MAX_POOL_CONNECTIONS` by default
+#   DYDB_CONNECT_TIMEOUT          Seconds, `CONNECT_TIMEOUT` by default
+#   DYDB_READ_TIMEOUT             Seconds, `READ_TIMEOUT` by default
+#   DYDB_KEEPALIVE                `1` to enable TCP keep-alive
+#   DYDB_MAX_ATTEMPTS             Max attempts of botocore retry, `MAX_ATTEMPTS` by default
+from threading import local
+from data_model.dynamodb.common.config import get_config
+
+
+class ConnectionPool(object):
+    """
+    Per thread session, resource and tables of DynamoDB
+
+    Args:
+    endpoint: Endpoint URL
+    region: Region name
+    max_pool_connections: Max HTTP connections of each thread
+    connect_timeout: Seconds to wait for connection
+    read_timeout: Seconds to wait for response
+    keepalive: If `True`, enable TCP keep-alive
+    max_attempts: Max attempts of botocore retry
+    """
+
+    MAX_POOL_CONNECTIONS = 10
+    CONNECT_TIMEOUT = 5
+    READ_TIMEOUT = 30
+    MAX_ATTEMPTS = 3
+
+    def __init__(self, **kwargs):
+        # Imported on first broker call rather than at import
+        from botocore.config import Config as BotoConfig
+
+        self.endpoint = kwargs.get('endpoint')
+        self.region = kwargs.get('region')
+        self.config = BotoConfig(
+                max_pool_connections=kwargs.get('max_pool_connections') or ConnectionPool.MAX_POOL_CONNECTIONS,
+                connect_timeout=kwargs.get('connect_timeout') or ConnectionPool.CONNECT_TIMEOUT,
+                read_timeout=kwargs.get('read_timeout') or ConnectionPool.READ_TIMEOUT,
+                tcp_keepalive=bool(kwargs.get('keepalive')),
+                retries={'max_attempts': kwargs.get('max_attempts') or ConnectionPool.MAX_ATTEMPTS},
+                )
+        self._local = local()
+
+    def session(self):
+        if not hasattr(self._local, 'session'):
+            import boto3.session
+            self._local.session = boto3.session.Session(region_name=self.region)
+        return self._local.session
+
+    def resource(self):
+        """
+        DynamoDB resource of current thread
+        """
+        if not hasattr(self._local, 'resource'):
+            self._local.resource = self.session().resource('dynamodb', \
+                    endpoint_url=self.endpoint, config=self.config)
+            self._local.tables = {}
+        return self._local.resource
+
+    def client(self):
+        """
+        DynamoDB client of current thread
+        """
+        return self.resource().meta.client
+
+    def table(self, name):
+        """
+        Table of current thread
+        """
+        resource = self.resource()
+        table = self._local.tables.get(name)
+        if table is None:
+            table = self._local.tables[name] = resource.Table(name)
+        return table
+
+
+def get_pool():
+    """
+    Connection pool shared in this process, configured by `get_config`
+    """
+    if not globals().get('pool'):
+        config = get_config()
+        globals()['pool'] = ConnectionPool(
+                endpoint=getattr(config, 'dydb_endpoint', None),
+                region=getattr(config, 'dydb_region', None),
+                max_pool_connections=getattr(config, 'dydb_max_pool_connections', None),
+                connect_timeout=getattr(config, 'dydb_connect_timeout', None),
+                read_timeout=getattr(config, 'dydb_read_timeout', None),
+                keepalive=getattr(config, 'dydb_keepalive', False),
+                max_attempts=getattr(config, 'dydb_max_attempts', None),
+                )
+    return globals().get('pool')
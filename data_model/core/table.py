@@ -3,21 +3,104 @@
 #
 #\sa https://boto3.readthedocs.io/en/latest/_modules/boto3/dynamodb/conditions.html
 #from abc import abstractmethod
+import os
+import pickle
+import time
 import ujson
 import uuid
+from collections import deque
 from copy import deepcopy
 from datetime import datetime
-from boto3.dynamodb.conditions import Key, Attr
-from boto3.dynamodb.types import Binary, Decimal
-from data_model.dynamodb.common.shared import GSI, NAN, ItemID, ProcessStage
-from data_model.dynamodb.common.utils import json_unzip, json_zip
+from decimal import Decimal
+from hashlib import blake2b
+from itertools import chain
+from data_model.dynamodb.common.shared import GSI, NAN, MAX_ITEM_SIZE, MAX_SLICE_SIZE, ItemID, ProcessStage
+from data_model.dynamodb.common.codec import LazyBlob, decode, encode
+from data_model.dynamodb.common.utils import LazyAttr, get_executor, get_thread_cache, iter_chunks, \
+        prefetch, split_chunks
 from data_model.dynamodb.common.config import get_config
 from data_model.dynamodb.core.broker import get_brk, TableBroker
+from data_model.dynamodb.core.checkpoint import Checkpoint
+from data_model.dynamodb.core.export import export_table
+from data_model.dynamodb.core.loader import bulk_load
+from data_model.dynamodb.core.metrics import get_metrics, timed
+from data_model.dynamodb.core.planner import plan
 
+Key = LazyAttr('boto3.dynamodb.conditions', 'Key')
+Attr = LazyAttr('boto3.dynamodb.conditions', 'Attr')
+Binary = LazyAttr('boto3.dynamodb.types', 'Binary')
+# asyncio is only loaded by async methods
+get_async_brk = LazyAttr('data_model.dynamodb.core.aio', 'get_async_brk')
 
-class Table(object):
+
+class TableState(object):
+    """
+    Per object book-keeping, kept out of `Table.__slots__` so it never
+    shows up as a record field
+    """
+
+    __slots__ = (
+            "_slices",
+            "_partial",
+            "_dirty",
+            "_snapshot",
+            "_sizes",
+    )
+
+
+class LazyFields(object):
+    """
+    Mixin of lazily built objects, decodes `LazyBlob` fat fields on first
+    access and memoizes, objects built eagerly never pay for the lookup
+
+    Reference to `Table.lazy_class`
+    """
+
+    __slots__ = ()
+
+    def __getattribute__(self, name):
+        val = object.__getattribute__(self, name)
+        if type(val) is LazyBlob:
+            val = val.decode()
+            object.__setattr__(self, name, val)
+            snapshot = self.peek('_snapshot')
+            if snapshot is not None and isinstance(val, MUTABLE):
+                snapshot[name] = fingerprint(val)
+        return val
+
+    def __reduce_ex__(self, protocol):
+        # Pickled as the table class with fat fields decoded
+        missing = object()
+        state = {k: getattr(self, k, missing) for k in TableState.__slots__ + tuple(self.fields())}
+        return restore, (type(self).__mro__[2], {k: v for k, v in state.items() if v is not missing})
+
+
+# Types of values changeable in place, fingerprinted to find changes on save
+MUTABLE = (dict, list, set, bytearray)
+
+
+def fingerprint(val):
+    """
+    Digest of `val`, compared on save to find values changed in place
+    """
+    return blake2b(pickle.dumps(val, protocol=5), digest_size=16).digest()
+
+
+def restore(cls, state):
+    """
+    Object of `cls` with attributes in `state`, as pickled by `LazyFields`
+    """
+    obj = cls.__new__(cls)
+    _ = [object.__setattr__(obj, k, v) for k, v in state.items()]
+    return obj
+
+
+class Table(TableState):
 
     SLICE_DELIM = '_'
+    SLICES = '_slices'
+    # Bytes of an item kept for keys, timestamps and slice manifest
+    ITEM_HEADROOM = 1024
 
     __slots__ = [
             "data_status",
@@ -32,6 +115,24 @@ class Table(object):
     ]
 
     _fat_fields = ()
+    # Codec for fat fields, override per field in `_field_codecs`
+    # \sa data_model.dynamodb.common.codec
+    _codec = 'gzip'
+    _field_codecs = {}
+
+    # Decode pages with `DECODE_POOL` workers, `thread` or `process`,
+    # pages smaller than `DECODE_THRESHOLD` are decoded serially
+    DECODE_POOL = None
+    DECODE_WORKERS = os.cpu_count() or 1
+    DECODE_THRESHOLD = 64
+
+    # Number of pages `iquery` fetches ahead of the consumer
+    PREFETCH = 1
+
+    # Encode objects in `batch_save` with `ENCODE_POOL` workers
+    ENCODE_POOL = 'thread'
+    ENCODE_WORKERS = os.cpu_count() or 1
+    SAVE_CHUNKSIZE = 1000
 
     @classmethod
     def init_dict(cls):
@@ -51,7 +152,124 @@ class Table(object):
     def __str__(self):
         return ujson.dumps(self())
 
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        dirty = self.peek('_dirty')
+        if dirty is not None and name[0] != '_':
+            dirty.add(name)
+
+    def __delattr__(self, name):
+        object.__delattr__(self, name)
+        dirty = self.peek('_dirty')
+        if dirty is not None and name[0] != '_':
+            dirty.add(name)
+
+    def __copy__(self):
+        obj = type(self).__new__(type(self))
+        missing = object()
+        for k in TableState.__slots__ + tuple(self.fields()):
+            val = self.peek(k, missing)
+            if val is not missing:
+                object.__setattr__(obj, k, val)
+        if obj.peek('_dirty') is not None:
+            obj._dirty = set(obj._dirty)
+        if obj.peek('_snapshot') is not None:
+            obj._snapshot = dict(obj._snapshot)
+        return obj
+
+    def __deepcopy__(self, memo):
+        obj = type(self).__new__(type(self))
+        missing = object()
+        for k in TableState.__slots__ + tuple(self.fields()):
+            val = self.peek(k, missing)
+            if val is not missing:
+                object.__setattr__(obj, k, deepcopy(val, memo))
+        return obj
+
+    @classmethod
+    def lazy_class(cls):
+        """
+        Subclass of `cls` objects built with `lazy` are of, reference to `LazyFields`
+        """
+        lazy = cls.__dict__.get('_lazy_class')
+        if lazy is None:
+            lazy = type(cls.__name__, (LazyFields, cls), {'__slots__': (), \
+                    '__module__': cls.__module__, '__qualname__': cls.__qualname__})
+            # No slots added, record fields are looked up by `__slots__` of the class
+            lazy.__slots__ = cls.__slots__
+            cls._lazy_class = lazy
+        return lazy
+
+    def mark_dirty(self, *names):
+        """
+        Mark fields as modified, values changed in place are also
+        found by `changed_in_place` on save
+        """
+        if self._dirty is not None:
+            self._dirty.update(names)
+
+    def take_snapshot(self):
+        """
+        Fingerprint mutable values of fields as built or saved, fat fields
+        not decoded yet are fingerprinted on first access
+        """
+        snapshot = {}
+        for k in self.fields():
+            val = self.peek(k)
+            if isinstance(val, MUTABLE):
+                snapshot[k] = fingerprint(val)
+        self._snapshot = snapshot
+
+    def record_sizes(self, item, names=None):
+        """
+        Keep encoded sizes of fat fields in record `item` as stored, those
+        in `names` only if given, saves size the record by them instead of
+        encoding unchanged fields again
+        """
+        sizes = {} if names is None or self._sizes is None else self._sizes
+        for ff in type(self)._fat_fields:
+            if names is not None and ff not in names:
+                continue
+            val = item.get(ff)
+            if isinstance(val, Binary):
+                val = val.value
+            if isinstance(val, (bytes, bytearray)):
+                sizes[ff] = len(val)
+            else:
+                sizes.pop(ff, None)
+        self._sizes = sizes
+
+    def changed_in_place(self):
+        """
+        Names of fields whose mutable values changed since `take_snapshot`
+        """
+        return {k for k, digest in (self.peek('_snapshot') or {}).items() \
+                if fingerprint(self.peek(k)) != digest}
+
+    def peek(self, name, default=None):
+        """
+        Get attribute without decoding lazy fat field
+        """
+        try:
+            return object.__getattribute__(self, name)
+        except AttributeError:
+            return default
+
+    def fields(self):
+        """
+        Names of all record fields, through the class hierarchy
+        """
+        return list(dict.fromkeys(k for c in reversed(type(self).__mro__) \
+                if issubclass(c, Table) for k in c.__dict__.get('__slots__', ())))
+
     def __init__(self, init_dict=None):
+        # Modified fields, `None` for objects never saved
+        self._dirty = None
+        self._snapshot = None
+        # Encoded sizes of fat fields kept in the record
+        self._sizes = None
+        self._slices = init_dict.get(Table.SLICES) if init_dict else None
+        self._partial = False
         if init_dict:
             _ = [setattr(self, k, init_dict.get(k, None)) for k in Table.__slots__]
             self._init_items(init_dict)
@@ -59,6 +277,7 @@ class Table(object):
             self.initialize_default()
 
     @classmethod
+    @timed('table.rebuild')
     def rebuild(cls, **kwargs):
         """
         Rebuild objects by attributes
@@ -67,8 +286,106 @@ class Table(object):
         source_unique: A `string` indicates `source_unique` value for query
         id: A `string` indecates item identifier
         filter_expr: ComparisonCondition object defined in [https://boto3.readthedocs.io/en/latest/_modules/boto3/dynamodb/conditions.html]
+        fields: List of attribute names to fetch, build partial objects if given
+
+        Items are read by primary key, index query or scan, whichever the
+        planner finds cheapest, see `explain`
+
+        Objects rebuilt by `id` are served from cache if enabled,
+        see `enable_cache`
         """
         brk = get_brk(cls.ID)
+        fields = kwargs.pop('fields', None)
+        iid = kwargs.get('id') if brk.cache and len(kwargs) == 1 and not fields else None
+        if iid:
+            obj = brk.cache.get('obj', iid)
+            if obj is not None:
+                return [obj], []
+            token = brk.cache.token()
+
+        p = plan(cls, 'rebuild', fields=fields, **kwargs)
+        if p.path == 'get':
+            items = [p.key]
+        else:
+            query_fields = [cls.ID.value] if p.fetch else (cls.projected(fields) if fields else None)
+            items = [item for rsp in p.pages(brk, chunksize=TableBroker.CHUNKSIZE, \
+                    fields=query_fields) for item in rsp['Items']]
+        if not items:
+            return [], []
+
+        if p.path == 'get' or p.fetch:
+            objs, err_items = cls.batch_get(items, fields=fields)
+        else:
+            objs, err_items = cls.batch_build(items, fields=cls.projected(fields) if fields else None)
+
+        if iid and len(objs) == 1:
+            # Cached decoded, hits never decode again
+            obj = deepcopy(objs[0])
+            _ = [getattr(obj, f) for f in cls._fat_fields if obj.peek(f) is not None]
+            brk.cache.set('obj', iid, obj, token)
+        return objs, err_items
+
+    @classmethod
+    def enable_cache(cls, **kwargs):
+        """
+        Enable read-through cache for `rebuild(id=...)` and `TableBroker._get`
+
+        Built objects are cached with fat fields decoded, hits return
+        deep copies, modifying them never changes the cache
+
+        Reference to `ItemCache`
+        """
+        return get_brk(cls.ID).enable_cache(**kwargs)
+
+    @classmethod
+    def enable_write_behind(cls, **kwargs):
+        """
+        Buffer `save` of new objects and `save(full=True)` in memory, repeated
+        saves of one record are written once, in batches from a background thread
+
+        Saves of objects rebuilt from table update the pending put of the
+        record if any, and go to table directly otherwise
+
+        Reference to `TableBroker.enable_write_behind`
+        """
+        return get_brk(cls.ID).enable_write_behind(**kwargs)
+
+    @classmethod
+    def flush(cls):
+        """
+        Write buffered saves now, reference to `TableBroker.flush`
+
+        @return A list of tuple indicates failed items and correspoinding error
+        """
+        return get_brk(cls.ID).flush()
+
+    @classmethod
+    def cache_stats(cls):
+        """
+        @return `dict` of cache counters, `None` if cache not enabled
+        """
+        cache = get_brk(cls.ID).cache
+        return cache.stats() if cache else None
+
+    @classmethod
+    async def arebuild(cls, **kwargs):
+        """
+        Async counterpart of `rebuild`
+        """
+        abrk = get_async_brk(cls.ID)
+        cls.rebuild_cond(kwargs)
+
+        rsp = await abrk._query(**kwargs)
+        items = rsp.get('Items')
+        if not items:
+            return [], []
+        return await cls.abatch_get(items)
+
+    @classmethod
+    def rebuild_cond(cls, kwargs):
+        """
+        Convert `source_unique` or `id` in `kwargs` to query condition
+        """
         source_unique = kwargs.pop('source_unique', None)
 
         if source_unique:
@@ -79,25 +396,149 @@ class Table(object):
         if iid:
             kwargs['cond'] = Key(cls.ID.value).eq(iid)
 
-        #cls.filter_data_type(kwargs)
-        rsp = brk._query(**kwargs)
-        items = rsp.get('Items')
-        if not items:
-            return [], []
-        return cls.batch_get(items)
+    @classmethod
+    def explain(cls, op='iscan', **kwargs):
+        """
+        Plan of a call without running it
+
+        Args:
+        op: `rebuild`, `iquery`, `iscan` or `delete`
+        kwargs: Arguments of the call, eg. `source_unique`, `cond`, `filter_expr`
+
+        \code
+            print(Repository.explain('rebuild', source_unique='x'))
+            rebuild on MARLENE_REPOSITORY: query source_unique_index
+              key condition: source_unique = 'x'
+              fetch: batch_get
+              estimated cost: 1.0 RCU
+              vs scan: 120.5 RCU
+        \endcode
+
+        Reference to `planner.Planner.plan`
+
+        @return `Plan`, call it for a `dict`
+        """
+        if op not in ('rebuild', 'iquery', 'iscan', 'delete'):
+            raise ValueError("Unknown operation {}".format(op))
+        if op == 'delete':
+            if kwargs.get('cond') is not None:
+                cls.filter_data_type(kwargs)
+            kwargs['fields'] = [cls.ID.value, Table.SLICES]
+        elif kwargs.get('fields'):
+            kwargs['fields'] = cls.projected(kwargs['fields'])
+        return plan(cls, op, **kwargs)
 
     @classmethod
     def iscan(cls, **kwargs):
+        """
+        Scan chunk by chunk
+
+        Args:
+
+        filter_expr: ComparisonCondition object defined in [https://boto3.readthedocs.io/en/latest/_modules/boto3/dynamodb/conditions.html]
+        chunksize: Max number of items to get for each scan
+        segments: Number of segments to scan in parallel, by default 1
+        ordered: If `True`, yield pages segment by segment, by default False
+        lazy: If `True`, by default, fat fields are decoded on first access,
+                if `False`, decoded as pages are built, in `DECODE_POOL` if set
+        fields: List of attribute names to fetch, build partial objects if given
+        resume_from: Checkpoint file, progress is recorded to it, a scan given
+                an existing one continues where that one stopped, by the segments
+                and access path recorded, filter must be the same
+        checkpoint_interval: Min seconds between checkpoint writes
+
+        Records are queried on `GSI.DATA_TYPE` instead of scanned if the
+        table has the index and one segment is requested, see `explain`
+
+        Reference to `Broker._iscan`
+
+        @return Generator of `batch_build` results
+        """
         brk = get_brk(cls.ID)
+        checkpoint = cls.checkpoint_kwargs(kwargs)
+        if checkpoint:
+            # Resumed by the segments and path recorded
+            kwargs['segments'] = checkpoint.segments
+
+        decode = cls.pop_decode_kwargs(kwargs, lazy=True)
+        cls.project_kwargs(kwargs, decode)
+        p = plan(cls, 'iscan', filter_expr=kwargs.pop('filter_expr', None), \
+                fields=kwargs.get('fields'), segments=kwargs.get('segments'), \
+                path=(checkpoint.plan or {}).get('path') if checkpoint else None)
+        if checkpoint:
+            checkpoint.bind(p)
+        if p.fetch:
+            kwargs['fields'] = [cls.ID.value]
+
+        metrics = get_metrics()
+        for chunk in p.pages(brk, **kwargs):
+            if p.fetch:
+                objs, err_items = cls.batch_get(chunk['Items'], **decode)
+            else:
+                objs, err_items = cls.batch_build(chunk['Items'], **decode)
+            if metrics.enabled:
+                metrics.observe('table.iscan', pages=1, items=len(objs), errors=len(err_items))
+            yield objs, err_items
+
+    @classmethod
+    async def aiscan(cls, **kwargs):
+        """
+        Async counterpart of `iscan`, pages are built in executor
+
+        @return Async generator of `batch_build` results
+        """
+        abrk = get_async_brk(cls.ID)
+        cls.filter_data_type(kwargs)
+        decode = cls.pop_decode_kwargs(kwargs, lazy=True)
+        cls.project_kwargs(kwargs, decode)
 
+        async for chunk in abrk._iscan(**kwargs):
+            yield await abrk.run(cls.batch_build, chunk['Items'], **decode)
+
+    @classmethod
+    def export(cls, path, **kwargs):
+        """
+        Stream records into sharded, compressed files under `path`,
+        with a manifest of row counts and key ranges
+
+        Args:
+
+        path: Output directory
+        format: `ndjson` or `columnar`, `ndjson` by default
+        raw: If `True`, skip decoding, write items as scanned
+        segments: Number of segments to scan and write in parallel, by default 1
+        filter_expr: ComparisonCondition object defined in [https://boto3.readthedocs.io/en/latest/_modules/boto3/dynamodb/conditions.html]
+
+        Reference to `export.export_table`
+
+        @return `dict` of manifest
+        """
         filter_expr = kwargs.pop('filter_expr', None)
         if filter_expr:
             filter_expr = Attr('data_type').eq(cls.DT.value) & filter_expr
         else:
             filter_expr = Attr('data_type').eq(cls.DT.value)
+        return export_table(cls, path, filter_expr=filter_expr, **kwargs)
 
-        for chunk in brk._iscan(filter_expr=filter_expr, **kwargs):
-            yield cls.batch_build(chunk['Items'])
+    @classmethod
+    def bulk_load(cls, paths, **kwargs):
+        """
+        Load records from NDJSON files or `export` directories, parsed and
+        encoded in a process pool, written by concurrent batch writers
+
+        Args:
+
+        paths: List of files or directories
+        writers: Number of concurrent `batch_put` writers
+        rate: Max number of items written per second
+        uniq: If `True`, skip records whose `source_unique` already exists
+        progress: Callable receives stats periodically, `True` to print progress
+
+        Reference to `loader.bulk_load`
+
+        @return `dict` of stats
+        """
+        return bulk_load(cls, paths, **kwargs)
 
     @classmethod
     def iquery(cls, **kwargs):
@@ -106,96 +547,411 @@ class Table(object):
 
         Args:
 
-        verbose: If `True`, perform further `batch_get` for details,
+        verbose: If `True`, build objects, items are fetched by further `batch_get`
+                unless the index projects the fields needed,
                 By default, False, return raw items in query results
-        cond: Condition for query
-        ind: Index name for query
+        lazy: If `True`, by default, fat fields are decoded on first access,
+                if `False`, decoded as pages are built, in `DECODE_POOL` if set
+        fields: List of attribute names to fetch, build partial objects if given
+        prefetch: Number of pages to query and `batch_get` ahead of the consumer,
+                `PREFETCH` by default, 0 to disable
+        cond: Condition for query, records of `DT` by default
+        ind: Index name for query, found by the hash key of `cond` if not given
+        filter_expr: ComparisonCondition object as filter expression
+        resume_from: Checkpoint file, progress is recorded to it, a query given
+                an existing one continues where that one stopped, by the access
+                path recorded, key condition and filter must be the same
+        checkpoint_interval: Min seconds between checkpoint writes
 
         Reference to `Broker._query`
         """
         brk = get_brk(cls.ID)
         verbose = kwargs.pop('verbose', False)
+        depth = kwargs.pop('prefetch', cls.PREFETCH)
+        decode = cls.pop_decode_kwargs(kwargs, lazy=True)
+
+        # Pages run ahead of the consumer, progress is tracked here
+        checkpoint = cls.checkpoint_kwargs(kwargs)
+        kwargs.pop('checkpoint', None)
+        if checkpoint:
+            if checkpoint.done(0):
+                return
+            kwargs['esk'] = checkpoint.esk(0)
+
+        if kwargs.get('fields'):
+            kwargs['fields'] = cls.projected(kwargs['fields'])
+        p = plan(cls, 'iquery', cond=kwargs.pop('cond', None), ind=kwargs.pop('ind', None), \
+                filter_expr=kwargs.pop('filter_expr', None), fields=kwargs.get('fields'), \
+                path=(checkpoint.plan or {}).get('path') if checkpoint else None)
+        if checkpoint:
+            checkpoint.bind(p)
+        if verbose:
+            # Only keys needed from query if fetched, fields apply to `batch_get`
+            decode['fields'] = kwargs.pop('fields', None)
+            kwargs['fields'] = [cls.ID.value] if p.fetch else decode['fields']
+            build = cls.batch_get if p.fetch else cls.batch_build
+
+        def pages():
+            chunks = p.pages(brk, **kwargs)
+            if depth:
+                chunks = prefetch(chunks, depth)
+
+            if not verbose:
+                for chunk in chunks:
+                    yield 0, chunk.get('LastEvaluatedKey'), chunk['Items']
+            elif not depth:
+                for chunk in chunks:
+                    yield 0, chunk.get('LastEvaluatedKey'), build(chunk['Items'], **decode)
+            else:
+                # Keep at most `depth` builds in flight while next pages are queried
+                pool, pending = get_thread_cache(), deque()
+                for chunk in chunks:
+                    pending.append((chunk.get('LastEvaluatedKey'), \
+                            pool.submit(build, chunk['Items'], **decode)))
+                    if len(pending) > depth:
+                        esk, fut = pending.popleft()
+                        yield 0, esk, fut.result()
+                while pending:
+                    esk, fut = pending.popleft()
+                    yield 0, esk, fut.result()
+
+        metrics = get_metrics()
+        results = checkpoint.track(pages()) if checkpoint else (page for _, _, page in pages())
+        for page in results:
+            if metrics.enabled:
+                metrics.observe('table.iquery', pages=1, items=len(page[0] if verbose else page))
+            yield page
+
+    @classmethod
+    async def aiquery(cls, **kwargs):
+        """
+        Async counterpart of `iquery`
+
+        @return Async generator
+        """
+        abrk = get_async_brk(cls.ID)
+        verbose = kwargs.pop('verbose', False)
+        decode = cls.pop_decode_kwargs(kwargs, lazy=True)
+
+        p = plan(cls, 'iquery', cond=kwargs.pop('cond', None), ind=kwargs.pop('ind', None), \
+                filter_expr=kwargs.pop('filter_expr', None))
 
-        if kwargs.get('cond') is None:
-            kwargs['cond'] = Key('data_type').eq(cls.DT)
+        if verbose:
+            decode['fields'] = kwargs.pop('fields', None)
+            kwargs['fields'] = [cls.ID.value]
+        elif kwargs.get('fields'):
+            kwargs['fields'] = cls.projected(kwargs['fields'])
 
-        for chunk in brk._iquery(**kwargs):
+        if p.path == 'query':
+            chunks = abrk._iquery(p.cond, p.index, filter_expr=p.filter_expr, **kwargs)
+        else:
+            chunks = abrk._iscan(filter_expr=p.filter_expr, **kwargs)
+        async for chunk in chunks:
             if verbose:
-                yield cls.batch_get(chunk['Items'])
+                yield await cls.abatch_get(chunk['Items'], **decode)
             else:
                 yield chunk['Items']
 
     @classmethod
+    def checkpoint_kwargs(cls, kwargs):
+        """
+        Replace `resume_from` in `kwargs` with `Checkpoint` of the file
+
+        @return `Checkpoint`, `None` if not given
+        """
+        path = kwargs.pop('resume_from', None)
+        interval = kwargs.pop('checkpoint_interval', None)
+        if path:
+            kwargs['checkpoint'] = Checkpoint.open(path, \
+                    TableBroker.ITEMID_TABLETYPE[cls.ID].value, kwargs.get('segments'), interval)
+        return kwargs.get('checkpoint')
+
+    @classmethod
+    @timed('table.batch_get')
     def batch_get(cls, items, **kwargs):
         """
         Batch build object from given `dict` items
         Args:
 
         items: List of `dict` contains information to rebuild objects
+        fields: List of attribute names to fetch, build partial objects if given
 
         @return A list of `Table` objects
                 A list of tuple indicates error items and correspoinding error
         """
+        decode = cls.pop_decode_kwargs(kwargs)
+        cls.project_kwargs(kwargs, decode)
         keys = cls.extract_key(items)
-        rsp = get_brk(cls.ID)._batch_get(keys)
+        rsp = get_brk(cls.ID)._batch_get(keys, **kwargs)
 
         if not rsp:
             return [], []
+        unprocessed = cls.unprocessed(rsp)
         items = rsp.get('Responses', {}).get(TableBroker.ITEMID_TABLETYPE[cls.ID].value)
         if not items:
+            return [], unprocessed
+        objs, err_items = cls.batch_build(items, **decode)
+        return objs, err_items + unprocessed
+
+    @classmethod
+    async def abatch_get(cls, items, **kwargs):
+        """
+        Async counterpart of `batch_get`, objects are built in executor
+        """
+        abrk = get_async_brk(cls.ID)
+        decode = cls.pop_decode_kwargs(kwargs)
+        cls.project_kwargs(kwargs, decode)
+        keys = cls.extract_key(items)
+        rsp = await abrk._batch_get(keys, **kwargs)
+
+        if not rsp:
             return [], []
-        return cls.batch_build(items)
+        unprocessed = cls.unprocessed(rsp)
+        items = rsp.get('Responses', {}).get(TableBroker.ITEMID_TABLETYPE[cls.ID].value)
+        if not items:
+            return [], unprocessed
+        objs, err_items = await abrk.run(cls.batch_build, items, **decode)
+        return objs, err_items + unprocessed
 
     @classmethod
-    def batch_build(cls, items):
+    def unprocessed(cls, rsp):
+        """
+        Keys left in `UnprocessedKeys` of a `_batch_get` response after all retries
+
+        @return A list of tuple indicates unprocessed keys and correspoinding error
+        """
+        keys = rsp.get('UnprocessedKeys', {}).get(TableBroker.ITEMID_TABLETYPE[cls.ID].value, {}).get('Keys')
+        if not keys:
+            return []
+        ex = RuntimeError("Unprocessed after retries")
+        return [(key, ex) for key in keys]
+
+    @classmethod
+    @timed('table.batch_build')
+    def batch_build(cls, items, **kwargs):
         """
         Batch build object from given `dict` items
         Args:
 
         items: List of `dict` contains information to rebuild objects
+        decode_pool: `thread` or `process` to decode in parallel, `DECODE_POOL` by default
+        decode_workers: Max number of decode workers, `DECODE_WORKERS` by default
+        lazy: If `True`, fat fields are decoded on first access, by default False
+        fields: List of attribute names in items, build partial objects if given
 
         @return A list of `Table` objects
                 A list of tuple indicates error items and correspoinding error
         """
         objs = []
         err_items = []
+        items = list(items)
+        errs = cls.join_slices(items, kwargs.get('fields'))
+        todo = [item for item in items if item and id(item) not in errs]
+
+        lazy = kwargs.get('lazy', False)
+        fields = kwargs.get('fields')
+        pool = kwargs.get('decode_pool', cls.DECODE_POOL)
+        if pool and not lazy and len(todo) >= cls.DECODE_THRESHOLD:
+            workers = kwargs.get('decode_workers') or cls.DECODE_WORKERS
+            size = -(-len(todo) // workers)
+            chunks = [todo[i:i+size] for i in range(0, len(todo), size)]
+            results = get_executor(pool, workers).map(build_chunk, [cls] * len(chunks), chunks, \
+                    [lazy] * len(chunks), [fields] * len(chunks))
+            results = chain.from_iterable(results)
+        else:
+            results = iter(build_chunk(cls, todo, lazy, fields))
+
         # Group items by item identifier
         for item in items:
-            try:
-                if not item:
-                    continue
-                obj = cls.foreach_item(item)
-                if obj:
-                    objs.append(obj)
-            except Exception as ex:
+            if not item:
+                continue
+            if id(item) in errs:
+                err_items.append((item, errs[id(item)]))
+                continue
+            obj, ex = next(results)
+            if ex:
                 err_items.append((item, ex))
+            elif obj:
+                objs.append(obj)
         return objs, err_items
 
     @classmethod
-    def foreach_item(cls, item):
+    def foreach_item(cls, item, lazy=False, fields=None):
+        """
+        Build object from `item`
+
+        Args:
+        item: A `dict` item, as returned by query or scan
+        lazy: If `True`, keep fat fields encoded until first access
+        fields: List of attribute names projected in `item`, if given, build
+                partial object with attributes missing in `item` left unset
+        """
         def unzip(obj, f):
-            val = getattr(obj, f, None)
+            val = obj.peek(f)
             if val and isinstance(val, Binary):
-                setattr(obj, f, json_unzip(val.value))
+                # Unsafe codecs decoded only if configured for the field
+                allow = (cls.codec_for(f),)
+                setattr(obj, f, LazyBlob(val.value, allow) if lazy else decode(val.value, allow))
 
         def convert(obj, f):
-            val = getattr(obj, f, None)
+            val = obj.peek(f)
             if val and isinstance(val, Decimal):
                 setattr(obj, f, int(str(val)))
 
         gid = item.get(cls.ID.value)
         if not gid:
             raise AttributeError("Invalid record without item id")
+
+        errs = cls.join_slices([item], fields)
+        if errs:
+            raise errs[id(item)]
        
-        obj = cls(item)
+        obj = cls.lazy_class()(item) if lazy else cls(item)
+        obj.record_sizes(item)
+        if fields:
+            _ = [delattr(obj, f) for f in obj.fields() if f not in item and obj.peek(f, obj) is not obj]
+            obj._partial = True
+
+        metrics = get_metrics()
+        start = time.perf_counter() if metrics.enabled else None
         if getattr(cls, '_fat_fields', None):
             list(map(lambda f:unzip(obj, f), cls._fat_fields))
         else:
             list(map(lambda f:unzip(obj, f), obj.__slots__))
+        if start is not None:
+            metrics.observe('table.decode', time.perf_counter() - start, items=1)
 
-        list(map(lambda f:convert(obj, f), obj().keys()))
+        list(map(lambda f:convert(obj, f), obj.fields()))
+        obj.take_snapshot()
+        obj._dirty = set()
         return obj
 
+    @classmethod
+    def projected(cls, fields):
+        """
+        Attribute names to fetch for `fields`, item id and slice manifest
+        are always included as building objects requires them
+        """
+        extra = [cls.ID.value]
+        if set(fields) & set(cls._fat_fields):
+            extra.append(Table.SLICES)
+        return list(dict.fromkeys(list(fields) + extra))
+
+    @classmethod
+    def project_kwargs(cls, kwargs, decode):
+        """
+        Expand `fields` in `kwargs` for both broker request and object build
+        """
+        if kwargs.get('fields'):
+            kwargs['fields'] = decode['fields'] = cls.projected(kwargs['fields'])
+
+    @staticmethod
+    def pop_decode_kwargs(kwargs, lazy=False):
+        """
+        Pop decode arguments from `kwargs`, `lazy` unless given
+        """
+        decode = {k: kwargs.pop(k) for k in ('decode_pool', 'decode_workers', 'lazy') if k in kwargs}
+        decode.setdefault('lazy', lazy)
+        return decode
+
+    @classmethod
+    def codec_for(cls, field):
+        return cls._field_codecs.get(field, cls._codec)
+
+    @classmethod
+    def slice_id(cls, iid, field, index, version=None):
+        parts = (iid, field, version, str(index)) if version else (iid, field, str(index))
+        return cls.SLICE_DELIM.join(parts)
+
+    @classmethod
+    def slice_keys(cls, iid, slices, fields=None):
+        """
+        Key dicts of slices in manifest `slices` of item `iid`
+
+        Manifest maps field name to slice count, total size and version of
+        the save writes them, manifests written before versioning have no
+        version
+
+        Args:
+        iid: Item identifier
+        slices: `_slices` manifest of the item
+        fields: Names of fat fields, all in manifest by default
+        """
+        return [{cls.ID.value: cls.slice_id(iid, f, i, *entry[2:3])} \
+                for f, entry in (slices or {}).items() if fields is None or f in fields \
+                for i in range(int(entry[0]))]
+
+    @classmethod
+    def split_field(cls, iid, field, raw, version):
+        """
+        Split encoded value `raw` of fat field into slices by `MAX_SLICE_SIZE`
+
+        @return Manifest entry of the field
+                A list of slice items
+        """
+        chunks = split_chunks(raw, MAX_SLICE_SIZE)
+        slice_items = [{
+            cls.ID.value: cls.slice_id(iid, field, i, version),
+            'slice_of': iid,
+            'data': bytes(chunk),
+            } for i, chunk in enumerate(chunks)]
+        return [len(chunks), len(raw), version], slice_items
+
+    @classmethod
+    def join_slices(cls, items, fields=None):
+        """
+        Fetch slices of oversized fat fields and put the reassembled
+        bytes back into each item, in place
+
+        All slices of given items are fetched in one `_batch_get`,
+        each field is copied into a single preallocated buffer
+
+        Args:
+        items: List of `dict` items, as returned by query or scan
+        fields: List of attribute names projected, all by default
+
+        @return `dict` maps `id(item)` to error for items with slices missing
+                or not matching their manifest
+        """
+        pending = []
+        for item in items:
+            slices = item.get(cls.SLICES) if item else None
+            if not slices:
+                continue
+            pending.extend((item, f) for f in slices \
+                    if f not in item and (not fields or f in fields))
+
+        if not pending:
+            return {}
+
+        keys = [k for item, f in pending for k in cls.slice_keys(item[cls.ID.value], item[cls.SLICES], [f])]
+        rsp = get_brk(cls.ID)._batch_get(keys) or {}
+        found = {x[cls.ID.value]: x['data'] for x in rsp.get('Responses', {}).get(\
+                TableBroker.ITEMID_TABLETYPE[cls.ID].value, [])}
+
+        errs = {}
+        for item, f in pending:
+            if id(item) in errs:
+                continue
+            try:
+                size = int(item[cls.SLICES][f][1])
+                buf = bytearray(size)
+                view, offset = memoryview(buf), 0
+                for key in cls.slice_keys(item[cls.ID.value], item[cls.SLICES], [f]):
+                    sid = key[cls.ID.value]
+                    if sid not in found:
+                        raise AttributeError("Slice {} missing".format(sid))
+                    chunk = found[sid]
+                    chunk = chunk.value if isinstance(chunk, Binary) else chunk
+                    view[offset:offset+len(chunk)] = chunk
+                    offset += len(chunk)
+                if offset != size:
+                    raise ValueError("Slices of {} sum to {} bytes, {} expected".format(f, offset, size))
+                item[f] = Binary(buf)
+            except Exception as ex:
+                errs[id(item)] = ex
+        return errs
+
     @classmethod
     def delete(cls, **kwargs):
         """
@@ -204,37 +960,120 @@ class Table(object):
         Args:
 
         id: 
+        source_unique: A `string` indicates `source_unique` value
+        cond: Key condition for query
+        ind: Index name for query
+        filter_expr: ComparisonCondition object as filter expression
         batch: Wether perform batch delete, by default `True`
-        Reference to `Broker._delete` and `Broker.batch_delete`
+        Reference to `Broker._delete` and `bulk_delete`
+
+        Keys are read by index query or scan, whichever the planner finds
+        cheapest, see `explain`, slices of fat fields are deleted with records
 
-        Notes:
-        - Either `id` must be provided
+        @return `dict` of `bulk_delete` stats if `batch` set
         """
         brk = get_brk(cls.ID)
         batch = kwargs.pop('batch', True)
 
         iid = kwargs.pop('id', None)
         if iid:
-            brk._delete(iid)
+            key = {cls.ID.value: iid}
+            # Slices of a pending put are in table already
+            pending = brk.buffer.get(key) if brk.buffer else None
+            old = brk._delete(key, return_values='ALL_OLD').get('Attributes')
+            stale = {x[cls.ID.value]: x for item in (pending, old) if item \
+                    for x in cls.slice_keys(iid, item.get(Table.SLICES))}
+            if stale:
+                brk.batch_delete(list(stale.values()))
             return
 
-        filter_expr = kwargs.pop('filter_expr', None)
-        source_unique = kwargs.pop('source_unique', None)
-        if source_unique:
-            kwargs['cond'] = Key('source_unique').eq(source_unique)
-            kwargs['ind'] = GSI.SOURCE_UNIQUE.value
+        if not batch:
+            return list(map(brk._delete, cls.delete_keys(**kwargs)))
+        return cls.bulk_delete(**kwargs)
 
-        cls.filter_data_type(kwargs)
+    @classmethod
+    @timed('table.bulk_delete')
+    def bulk_delete(cls, **kwargs):
+        """
+        Delete all records matched, with slices of their fat fields
 
-        rsp = brk._query(**kwargs)
-        items = rsp.get('Items')
-        if not items:
-            return
-        items = cls.extract_key(items)
+        Keys are extracted page by page as the query or scan goes, and
+        deleted by concurrent batch writers, unprocessed ones retried
+
+        Args:
+
+        source_unique: A `string` indicates `source_unique` value
+        cond: Key condition for query
+        ind: Index name for query
+        filter_expr: ComparisonCondition object as filter expression
+        segments: Number of segments to scan in parallel if scanned, by default 1
+        chunksize: Max number of items to read for each page
+        workers: Max number of concurrent batch deletes, `BATCH_WRITE_WORKERS` by default
+        capacity_fraction: Pace reads and deletes at a fraction of table capacity
+                during the call, reference to `TableBroker.governed`
 
-        if batch:
-            return brk.batch_delete(items)
-        return list(map(brk._delete, items))
+        Reference to `delete_keys` and `Broker.batch_delete`
+
+        @return `dict` of stats, number of records matched, items deleted
+                including slices, elapsed seconds and a list of tuple
+                indicates failed keys and correspoinding error
+        """
+        brk = get_brk(cls.ID)
+        workers = kwargs.pop('workers', TableBroker.BATCH_WRITE_WORKERS)
+
+        start = time.time()
+        counts = {'matched': 0, 'keys': 0, 'failed': []}
+        with brk.governed(fraction=kwargs.pop('capacity_fraction', None)):
+            failed = brk.batch_delete(cls.delete_keys(counts=counts, **kwargs), \
+                    report=True, workers=workers) or []
+        return {
+                'matched': counts['matched'],
+                'deleted': counts['keys'] - len(failed),
+                'failed': failed + counts['failed'],
+                'elapsed': time.time() - start,
+                }
+
+    @classmethod
+    def delete_keys(cls, **kwargs):
+        """
+        Keys of records matched and their slices, page by page
+
+        Args:
+
+        counts: A `dict` to count records matched and keys yielded in,
+                as `matched` and `keys`, keys of records left unfetched
+                are listed with correspoinding error in `failed`
+
+        Reference to `bulk_delete` for other arguments
+
+        @return Generator of key `dict`
+        """
+        brk = get_brk(cls.ID)
+        counts = kwargs.pop('counts', {})
+        counts.setdefault('matched', 0)
+        counts.setdefault('keys', 0)
+        counts.setdefault('failed', [])
+        if kwargs.get('cond') is not None:
+            cls.filter_data_type(kwargs)
+
+        fields = [cls.ID.value, Table.SLICES]
+        p = plan(cls, 'delete', fields=fields, **kwargs)
+        scan = {k: kwargs[k] for k in ('segments', 'chunksize') if k in kwargs}
+        table_name = TableBroker.ITEMID_TABLETYPE[cls.ID].value
+
+        for rsp in p.pages(brk, fields=[cls.ID.value] if p.fetch else fields, **scan):
+            items = rsp['Items']
+            if p.fetch and items:
+                # The index does not project slice manifests
+                rsp = brk._batch_get(cls.extract_key(items), fields=fields) or {}
+                counts['failed'].extend(cls.unprocessed(rsp))
+                items = rsp.get('Responses', {}).get(table_name, [])
+            for item in items:
+                keys = [{cls.ID.value: item[cls.ID.value]}]
+                keys.extend(cls.slice_keys(item[cls.ID.value], item.get(Table.SLICES)))
+                counts['matched'] += 1
+                counts['keys'] += len(keys)
+                yield from keys
 
     @classmethod
     def extract_key(cls, items):
@@ -281,20 +1120,300 @@ class Table(object):
         val.update({k:getattr(self,k) for k in Table.__slots__ if hasattr(self, k)})
         return val
 
+    def to_items(self, changed=None):
+        """
+        Encode object into items to write, the object stays untouched
+
+        Fat fields are kept in the record while the whole item fits in
+        `MAX_ITEM_SIZE`, smaller ones first, others are split by
+        `MAX_SLICE_SIZE` into separate slice items, the record keeps a
+        `_slices` manifest of them
+
+        Slices of each save are written under a new version, so those of
+        the record stored stay intact until it is replaced
+
+        Args:
+        changed: Names of fields to encode, all by default
+
+        @return A `dict` of the record
+                A list of slice items
+                A list of key dicts of slices left by previous save
+        """
+        if self._partial and changed is None:
+            raise AttributeError("Partial object built from projected item can not be saved")
+
+        cls, missing = type(self), object()
+        names = [k for k in self.fields() if changed is None or k in changed]
+        item = {}
+        for k in names:
+            val = self.peek(k, missing)
+            if val is missing or (val is None and k in self.__slots__):
+                continue
+            item[k] = val
+        item['updated_ts'] = int(datetime.now().timestamp())
+        item[cls.ID.value] = iid = self.peek(cls.ID.value)
+
+        # Zip fat fields, those never accessed are written back as they are
+        encoded = {}
+        for ff in cls._fat_fields:
+            if ff not in names:
+                continue
+            val = item.pop(ff, None)
+            raw = val.raw if isinstance(val, LazyBlob) else encode(val, cls.codec_for(ff))
+            if raw:
+                encoded[ff] = raw
+
+        # Keep manifest of fat fields not encoded this time
+        slices, slice_items = {f: list(entry) for f, entry \
+                in (self._slices or {}).items() if f not in names}, []
+        room = MAX_ITEM_SIZE - cls.ITEM_HEADROOM - self.stored_size(names) if encoded else 0
+        version = uuid.uuid4().hex[:8]
+        for ff in sorted(encoded, key=lambda f: len(encoded[f])):
+            raw = encoded[ff]
+            if len(raw) <= min(room, MAX_SLICE_SIZE):
+                item[ff] = raw
+                room -= len(ff) + len(raw)
+                continue
+            slices[ff], chunks = cls.split_field(iid, ff, raw, version)
+            slice_items.extend(chunks)
+
+        if slices and (changed is None or set(names) & set(cls._fat_fields)):
+            item[Table.SLICES] = slices
+
+        # Slices of previous save, replaced by this one
+        stale = cls.slice_keys(iid, self._slices, [ff for ff in cls._fat_fields if ff in names])
+        return item, slice_items, stale
+
+    def stored_size(self, names=()):
+        """
+        Estimated size of the record as stored, except fat fields in `names`
+        and those sliced, fat fields are sized as recorded when built or saved
+        """
+        cls, size = type(self), 0
+        sizes = self._sizes or {}
+        for k in self.fields():
+            val = self.peek(k)
+            if val is None or (k in cls._fat_fields and (k in names or k in (self._slices or {}))):
+                continue
+            if k in sizes:
+                size += len(k) + sizes[k]
+                continue
+            if k in cls._fat_fields:
+                val = val.raw if isinstance(val, LazyBlob) else encode(val, cls.codec_for(k))
+            if isinstance(val, Binary):
+                val = val.value
+            size += len(k) + (len(val) if isinstance(val, (str, bytes, bytearray)) else len(str(val)))
+        return size
+
+    @timed('table.save')
     def save(self, **kwargs):
         """
         Save global object
         To force split field, add field names to `Table._fat_fields`
+
+        Objects rebuilt from table only write fields modified since built
+        or last saved, through `TableBroker._update` on condition the record
+        still exists, nothing is written if none modified, new objects are
+        put as a whole
+
+        Fields are modified if set, deleted or their mutable values changed
+        in place, see `changed_in_place`
+
+        Args:
+        in_place: If `True`, keep encoded values in the object as written
+        full: If `True`, put the whole object regardless of modified fields
+
+        Reference to `to_items`
         """
         in_place = kwargs.pop('in_place', False)
-        obj = self if in_place else deepcopy(self)
-        # Zip fat fields
-        list(map(lambda ff: setattr(obj, ff, json_zip(\
-                getattr(self, ff, None))), type(self)._fat_fields))
-        obj.updated_ts = int(datetime.now().timestamp())
+        full = kwargs.pop('full', False)
+        brk = get_brk(type(self).ID)
+
+        if self._dirty is None or full:
+            changed = None
+            item, slice_items, stale = self.to_items()
+        else:
+            changed = set(self._dirty) | self.changed_in_place()
+            if not changed:
+                return
+            item, slice_items, stale = self.to_items(changed)
+
+        # Slices replaced are deleted once the record no longer refers to
+        # them in table, a buffered put would land after the delete
+        direct = bool(stale) and brk.buffer is not None
+        if direct:
+            brk.buffer.flush([{type(self).ID.value: item[type(self).ID.value]}])
+
         # Put all slices for one item
-        _ = [delattr(obj, f) for f in obj.__slots__ if None == getattr(obj, f, None)]
-        get_brk(type(self).ID).put(obj())
+        if slice_items:
+            brk.batch_put(slice_items)
+
+        fat_changed = changed is None or changed & set(type(self)._fat_fields)
+        try:
+            if changed is None:
+                brk.put(item, direct=direct)
+            else:
+                key = {type(self).ID.value: item.pop(type(self).ID.value)}
+                remove = [k for k in changed if k not in item and k not in key]
+                if fat_changed and Table.SLICES not in item and self._slices:
+                    remove.append(Table.SLICES)
+                brk._update(key, item, remove=remove, return_values='NONE', \
+                        cond=Attr(type(self).ID.value).exists())
+                item.update(key)
+        except Exception:
+            # Slices of this save are referred by no record
+            if slice_items:
+                brk.batch_delete(type(self).extract_key(slice_items), report=True)
+            raise
+
+        # Slices of the record replaced
+        if stale:
+            brk.batch_delete(stale)
+
+        if fat_changed:
+            self._slices = item.get(Table.SLICES)
+            self.record_sizes(item, changed)
+        if in_place:
+            self.apply_item(item, changed)
+        self.take_snapshot()
+        self._dirty = set()
+
+    def apply_item(self, item, names=None):
+        """
+        Set attributes as in `item`, those missing in `item` are removed
+
+        Args:
+        item: A `dict` of the record
+        names: Names of fields to apply, all by default
+        """
+        for k in self.fields():
+            if names is not None and k not in names:
+                continue
+            if k in item:
+                object.__setattr__(self, k, item[k])
+            elif k in self.__slots__ and self.peek(k) is not None:
+                object.__delattr__(self, k)
+
+    @classmethod
+    @timed('table.batch_save')
+    def batch_save(cls, objs, **kwargs):
+        """
+        Save objects in bulk
+
+        Objects are encoded by `ENCODE_POOL` workers chunk by chunk,
+        slices and records are written through `TableBroker.batch_put`
+        in batches, a record is only written once all its slices are
+
+        Args:
+
+        objs: Iterable of objects
+        encode_pool: `thread` or `process`, `ENCODE_POOL` by default, `None` to encode serially
+        encode_workers: Max number of encode workers, `ENCODE_WORKERS` by default
+        chunksize: Number of objects per round, `SAVE_CHUNKSIZE` by default
+        workers: Max number of concurrent write batches
+        Reference to `TableBroker._batch_write`
+
+        Of objects with the same id in a chunk, only the last one is saved,
+        others are reported as errors
+
+        @return A list of objects saved
+                A list of tuple indicates error objects and correspoinding error
+        """
+        brk = get_brk(cls.ID)
+        pool = kwargs.pop('encode_pool', cls.ENCODE_POOL)
+        workers = kwargs.pop('encode_workers', None) or cls.ENCODE_WORKERS
+        chunksize = kwargs.pop('chunksize', cls.SAVE_CHUNKSIZE)
+        kwargs['report'] = True
+        saved, err_items = [], []
+
+        for chunk in iter_chunks(objs, chunksize):
+            # Objects of the same id, the last one wins
+            last = {obj.peek(cls.ID.value): obj for obj in chunk}
+            for obj in chunk:
+                iid = obj.peek(cls.ID.value)
+                if last[iid] is not obj:
+                    err_items.append((obj, ValueError("Duplicate {} {} in batch, a later one is saved".format(\
+                            cls.ID.value, iid))))
+            chunk = list(last.values())
+
+            if pool:
+                size = -(-len(chunk) // workers)
+                parts = [chunk[i:i+size] for i in range(0, len(chunk), size)]
+                encoded = chain.from_iterable(get_executor(pool, workers).map(encode_chunk, parts))
+            else:
+                encoded = encode_chunk(chunk)
+
+            done = {}
+            for obj, (items, ex) in zip(chunk, encoded):
+                if ex:
+                    err_items.append((obj, ex))
+                else:
+                    done[items[0][cls.ID.value]] = (obj, items)
+
+            # Slices written for records failed are referred by none
+            orphans = []
+            failed = brk.batch_put([x for _, (_, slices, _) in done.values() for x in slices], **kwargs)
+            for item, ex in failed:
+                if item['slice_of'] in done:
+                    obj, (_, slices, _) = done.pop(item['slice_of'])
+                    err_items.append((obj, ex))
+                    orphans.extend(cls.extract_key(slices))
+
+            failed = brk.batch_put([item for _, (item, _, _) in done.values()], **kwargs)
+            for item, ex in failed:
+                obj, (_, slices, _) = done.pop(item[cls.ID.value])
+                err_items.append((obj, ex))
+                orphans.extend(cls.extract_key(slices))
+            if orphans:
+                brk.batch_delete(orphans, **kwargs)
+
+            stale = [x for _, (_, _, stale) in done.values() for x in stale]
+            if stale:
+                brk.batch_delete(stale, **kwargs)
+
+            for obj, (item, _, _) in done.values():
+                obj._slices = item.get(Table.SLICES)
+                obj.record_sizes(item)
+                obj.take_snapshot()
+                obj._dirty = set()
+                saved.append(obj)
+        return saved, err_items
+
+    async def asave(self, **kwargs):
+        """
+        Async counterpart of `save`
+        """
+        return await get_async_brk(type(self).ID).run(self.save, **kwargs)
+
+
+def encode_chunk(objs):
+    """
+    Encode objects into items, runs in encode workers
+
+    @return A list of tuple of `to_items` result and error for each object
+    """
+    results = []
+    for obj in objs:
+        try:
+            results.append((obj.to_items(), None))
+        except Exception as ex:
+            results.append((None, ex))
+    return results
+
+
+def build_chunk(cls, items, lazy=False, fields=None):
+    """
+    Build objects of `cls` from items, runs in decode workers
+
+    @return A list of tuple of object and error for each item
+    """
+    results = []
+    for item in items:
+        try:
+            results.append((cls.foreach_item(item, lazy, fields), None))
+        except Exception as ex:
+            results.append((None, ex))
+    return results
 
 
 class Repository(Table):
@@ -0,0 +1,92 @@
+# Fat field codec benchmark
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Report compression ratio against encode/decode time for each codec
+#
+#   python tests/bench/codec.py [--codecs gzip,zlib6,lzma] [--rounds 5] [payload.ndjson ...]
+#
+# Each line of a payload file is one fat field value in JSON,
+# synthetic payloads are used if no file given
+import argparse
+import gzip
+import random
+import string
+import time
+import ujson
+from data_model.dynamodb.common.codec import decode, encode, list_codecs
+
+
+def synthetic_payloads(count=200, seed=0):
+    rnd = random.Random(seed)
+    words = [''.join(rnd.choice(string.ascii_lowercase) for _ in range(rnd.randint(3, 10))) \
+            for _ in range(2000)]
+    return [{
+        'title': ' '.join(rnd.choice(words) for _ in range(12)),
+        'abstract': ' '.join(rnd.choice(words) for _ in range(rnd.randint(100, 2000))),
+        'authors': [{'name': rnd.choice(words), 'rank': i} for i in range(rnd.randint(1, 20))],
+        'score': rnd.random(),
+        } for _ in range(count)]
+
+
+def load_payloads(paths):
+    payloads = []
+    for path in paths:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt') as fd:
+            payloads.extend(ujson.loads(line) for line in fd if line.strip())
+    return payloads
+
+
+def bench_codec(codec, payloads, rounds=5):
+    """
+    @return `dict` of ratio, encode and decode time per payload in milliseconds
+    """
+    raw_size = sum(len(ujson.dumps(p).encode()) for p in payloads)
+    enc_time, dec_time = [], []
+
+    for _ in range(rounds):
+        start = time.perf_counter()
+        blobs = [encode(p, codec) for p in payloads]
+        enc_time.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        _ = [decode(b, (codec,)) for b in blobs]
+        dec_time.append(time.perf_counter() - start)
+
+    size = sum(map(len, blobs))
+    return {
+            'codec': codec,
+            'raw_bytes': raw_size,
+            'encoded_bytes': size,
+            'ratio': raw_size / size,
+            'encode_ms': min(enc_time) / len(payloads) * 1000,
+            'decode_ms': min(dec_time) / len(payloads) * 1000,
+            }
+
+
+def run(codecs, payloads, rounds=5):
+    return [bench_codec(c, payloads, rounds) for c in codecs]
+
+
+def start():
+    parser = argparse.ArgumentParser(description='Fat field codec benchmark')
+    parser.add_argument('payloads', nargs='*', help='NDJSON payload files')
+    parser.add_argument('--codecs', default=','.join(list_codecs()), help='Comma separated codec names')
+    parser.add_argument('--rounds', type=int, default=5, help='Rounds for each codec, best one reported')
+    parser.add_argument('--json', action='store_true', help='Output JSON')
+    args = parser.parse_args()
+
+    payloads = load_payloads(args.payloads) if args.payloads else synthetic_payloads()
+    results = run(args.codecs.split(','), payloads, args.rounds)
+
+    if args.json:
+        print(ujson.dumps(results, indent=2))
+        return
+
+    print('{:<8} {:>8} {:>12} {:>12}'.format('codec', 'ratio', 'encode(ms)', 'decode(ms)'))
+    for r in results:
+        print('{codec:<8} {ratio:>8.2f} {encode_ms:>12.3f} {decode_ms:>12.3f}'.format(**r))
+
+
+if __name__ == '__main__':
+    start()
@@ -0,0 +1,282 @@
+# Data model hot path benchmark
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Time encoding, slicing, object building and table operations against
+# the embedded local store, at several item sizes and page sizes
+#
+#   python tests/bench/hotpath.py [--sizes 1024,65536,2097152] [--pages 25,100,500]
+#           [--only iscan,batch_get] [--output result.json]
+#   python tests/bench/hotpath.py --compare baseline.json [--tolerance 0.1]
+#
+# Results are written as JSON, `--compare` exits non-zero if any case
+# is slower than the baseline by more than `--tolerance`
+import argparse
+import platform
+import random
+import string
+import sys
+import time
+import ujson
+from enum import Enum, unique
+from boto3.dynamodb.conditions import Key
+from data_model.dynamodb.common.shared import MAX_SLICE_SIZE
+from data_model.dynamodb.common.utils import json_unzip, json_zip, rebuild_chunks, split_chunks
+from data_model.dynamodb.core import broker
+from data_model.dynamodb.core.broker import TableBroker
+from data_model.dynamodb.core.local import LocalResource
+from data_model.dynamodb.core.table import Repository
+
+
+@unique
+class BenchType(Enum):
+    DOC = 'BENCH_DOC'
+
+
+class BenchDoc(Repository):
+
+    DT = BenchType.DOC
+    INDEX = 'data_type_index'
+
+    __slots__ = [
+        'title',
+        'body',
+        ]
+
+    _fat_fields = ('body',)
+
+
+def synthetic_body(size, rnd):
+    """
+    Fat field value of about `size` bytes in JSON
+    """
+    words = [''.join(rnd.choice(string.ascii_lowercase) for _ in range(rnd.randint(3, 10))) \
+            for _ in range(5000)]
+    paras, total = [], 0
+    while total < size:
+        para = ' '.join(rnd.choice(words) for _ in range(rnd.randint(20, 200)))
+        paras.append({'text': para, 'score': rnd.random()})
+        total += len(para) + 32
+    return {'paragraphs': paras, 'tags': rnd.sample(words, 10)}
+
+
+def make_docs(count, size, seed=0):
+    rnd = random.Random(seed)
+    body = synthetic_body(size, rnd)
+    docs = []
+    for i in range(count):
+        doc = BenchDoc()
+        doc.data_type = BenchDoc.DT.value
+        doc.source_unique = 'bench-{}-{}'.format(size, i)
+        doc.title = 'doc {}'.format(i)
+        doc.body = body
+        docs.append(doc)
+    return docs
+
+
+def install():
+    """
+    Point all brokers at a fresh local store
+    """
+    hash_keys = {v.value:k.value for k, v in TableBroker.ITEMID_TABLETYPE.items()}
+    broker.dydb = LocalResource(hash_keys)
+    _ = [broker.__dict__.pop(k) for k in list(broker.__dict__) \
+            if k.startswith('{}:'.format(TableBroker.name))]
+
+
+def timeit(fn, rounds):
+    """
+    @return List of elapsed seconds for each round
+    """
+    elapsed = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        elapsed.append(time.perf_counter() - start)
+    return elapsed
+
+
+class Case(object):
+    """
+    Data set of one item size, loaded into a fresh local store
+    """
+
+    def __init__(self, size, count):
+        self.size = size
+        install()
+        self.docs = make_docs(count, size)
+        _, err_items = BenchDoc.batch_save(self.docs)
+        if err_items:
+            raise err_items[0][1]
+
+        self.value = self.docs[0].body
+        self.blob = json_zip(self.value)
+        # Raw items as read back, fat fields in binary, slices not joined
+        self.items = [item for page in BenchDoc.iquery(cond=self.cond(), ind=BenchDoc.INDEX, \
+                chunksize=count, prefetch=0) for item in page]
+        self.keys = BenchDoc.extract_key(self.items)
+
+    @staticmethod
+    def cond():
+        return Key('data_type').eq(BenchDoc.DT.value)
+
+
+def bench_json_zip(case, page):
+    return len(case.docs), lambda: [json_zip(case.value) for _ in case.docs]
+
+
+def bench_json_unzip(case, page):
+    return len(case.docs), lambda: [json_unzip(case.blob) for _ in case.docs]
+
+
+def bench_split_chunks(case, page):
+    blob = case.blob * max(1, -(-2 * MAX_SLICE_SIZE // len(case.blob)))
+    return len(case.docs), lambda: [split_chunks(blob, MAX_SLICE_SIZE) for _ in case.docs]
+
+
+def bench_rebuild_chunks(case, page):
+    blob = case.blob * max(1, -(-2 * MAX_SLICE_SIZE // len(case.blob)))
+    chunks = [bytes(c) for c in split_chunks(blob, MAX_SLICE_SIZE)]
+    return len(case.docs), lambda: [rebuild_chunks(chunks) for _ in case.docs]
+
+
+def bench_foreach_item(case, page):
+    return len(case.items), lambda: [BenchDoc.foreach_item(dict(item)) for item in case.items]
+
+
+def bench_batch_build(case, page):
+    pages = [case.items[i:i+page] for i in range(0, len(case.items), page)]
+    return len(case.items), lambda: [BenchDoc.batch_build([dict(x) for x in p]) for p in pages]
+
+
+def bench_save(case, page):
+    return len(case.docs), lambda: [doc.save(full=True) for doc in case.docs]
+
+
+def bench_iscan(case, page):
+    return len(case.docs), lambda: [objs for objs, _ in BenchDoc.iscan(chunksize=page, lazy=False)]
+
+
+def bench_iquery(case, page):
+    return len(case.docs), lambda: [objs for objs, _ in BenchDoc.iquery(cond=case.cond(), \
+            ind=BenchDoc.INDEX, chunksize=page, verbose=True, lazy=False)]
+
+
+def bench_batch_get(case, page):
+    pages = [case.keys[i:i+page] for i in range(0, len(case.keys), page)]
+    return len(case.keys), lambda: [BenchDoc.batch_get(p, lazy=False) for p in pages]
+
+
+# Benchmarks and whether they vary by page size
+BENCHES = {
+    'json_zip': (bench_json_zip, False),
+    'json_unzip': (bench_json_unzip, False),
+    'split_chunks': (bench_split_chunks, False),
+    'rebuild_chunks': (bench_rebuild_chunks, False),
+    'foreach_item': (bench_foreach_item, False),
+    'batch_build': (bench_batch_build, True),
+    'save': (bench_save, False),
+    'iscan': (bench_iscan, True),
+    'iquery': (bench_iquery, True),
+    'batch_get': (bench_batch_get, True),
+    }
+
+
+def run(names, sizes, pages, rounds=3, budget=32*1024*1024, max_items=500):
+    """
+    @return A list of `dict` results, one for each name, size and page size
+    """
+    results = []
+    for size in sizes:
+        case = Case(size, max(8, min(max_items, budget // size)))
+        for name in names:
+            fn, paged = BENCHES[name]
+            for page in (pages if paged else [None]):
+                count, work = fn(case, page)
+                elapsed = timeit(work, rounds)
+                results.append({
+                    'name': name,
+                    'size': size,
+                    'page': page,
+                    'items': count,
+                    'best_s': min(elapsed),
+                    'mean_s': sum(elapsed) / len(elapsed),
+                    'ops_per_s': count / min(elapsed),
+                    })
+                print('.', end='', file=sys.stderr, flush=True)
+    print(file=sys.stderr)
+    return results
+
+
+def case_key(r):
+    return '{}/{}/{}'.format(r['name'], r['size'], r['page'] or '-')
+
+
+def compare(results, baseline, tolerance=0.1):
+    """
+    Compare throughput against `baseline` results
+
+    @return A list of `dict` of each case found in both
+    """
+    base = {case_key(r): r for r in baseline}
+    report = []
+    for r in results:
+        b = base.get(case_key(r))
+        if not b:
+            continue
+        change = r['ops_per_s'] / b['ops_per_s'] - 1
+        report.append({
+            'case': case_key(r),
+            'baseline': b['ops_per_s'],
+            'current': r['ops_per_s'],
+            'change': change,
+            'regressed': change < -tolerance,
+            })
+    return report
+
+
+def start():
+    parser = argparse.ArgumentParser(description='Data model hot path benchmark')
+    parser.add_argument('--only', default=','.join(BENCHES), help='Comma separated benchmark names')
+    parser.add_argument('--sizes', default='1024,65536,2097152', help='Comma separated fat field sizes in bytes')
+    parser.add_argument('--pages', default='25,100,500', help='Comma separated page sizes')
+    parser.add_argument('--rounds', type=int, default=3, help='Rounds for each case, best one reported')
+    parser.add_argument('--max-items', type=int, default=500, help='Max number of items for each size')
+    parser.add_argument('--output', help='Write JSON results to this path')
+    parser.add_argument('--compare', help='Baseline JSON results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Allowed throughput drop in comparison')
+    args = parser.parse_args()
+
+    results = run(args.only.split(','), [int(x) for x in args.sizes.split(',')], \
+            [int(x) for x in args.pages.split(',')], args.rounds, max_items=args.max_items)
+    doc = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'created_ts': int(time.time()),
+            'rounds': args.rounds,
+            },
+        'results': results,
+        }
+
+    if args.output:
+        with open(args.output, 'w') as fd:
+            fd.write(ujson.dumps(doc, indent=2))
+
+    if not args.compare:
+        print(ujson.dumps(doc, indent=2))
+        return
+
+    with open(args.compare) as fd:
+        baseline = ujson.load(fd)
+    report = compare(results, baseline['results'], args.tolerance)
+
+    print('{:<32} {:>12} {:>12} {:>8}'.format('case', 'baseline/s', 'current/s', 'change'))
+    for r in report:
+        print('{case:<32} {baseline:>12.1f} {current:>12.1f} {change:>+8.1%}{flag}'.format(\
+                flag=' !' if r['regressed'] else '', **r))
+    if any(r['regressed'] for r in report):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    start()
@@ -0,0 +1,137 @@
+# Startup benchmark
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Time import of `data_model.dynamodb.core.table` and the first broker
+# requests, each run in a fresh interpreter
+#
+#   python tests/bench/startup.py [--runs 10] [--endpoint http://localhost:8000] [--output result.json]
+#   python tests/bench/startup.py --compare baseline.json [--tolerance 0.2]
+#
+# Requests go to the embedded local store unless `--endpoint` given,
+# exits non-zero if boto3 is loaded by the import itself, or any case
+# is slower than the baseline by more than `--tolerance`
+import argparse
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import ujson
+
+CHILD = '''
+import sys, time, ujson
+start = time.perf_counter()
+import data_model.dynamodb.core.table
+imported = time.perf_counter()
+boto3_loaded = 'boto3' in sys.modules
+
+from data_model.dynamodb.common.shared import ItemID
+from data_model.dynamodb.core.broker import get_brk, Key
+brk = get_brk(ItemID.REPOSITORY)
+times = []
+for i in range(2):
+    t = time.perf_counter()
+    brk._query(Key(ItemID.REPOSITORY.value).eq('startup-{}'.format(i)))
+    times.append(time.perf_counter() - t)
+print(ujson.dumps({
+    'import_ms': (imported - start) * 1000,
+    'first_request_ms': times[0] * 1000,
+    'second_request_ms': times[1] * 1000,
+    'boto3_loaded': boto3_loaded,
+    }))
+'''
+
+
+def run_once(env):
+    out = subprocess.run([sys.executable, '-c', CHILD], env=env, check=True, \
+            stdout=subprocess.PIPE).stdout
+    return ujson.loads(out.decode().strip().splitlines()[-1])
+
+
+def run(runs=10, endpoint=None):
+    """
+    @return A list of `dict` results, median of each measure over `runs`
+    """
+    env = dict(os.environ)
+    if endpoint:
+        env['DYDB_ENDPOINT'] = endpoint
+        env.pop('DYDB_BACKEND', None)
+    else:
+        env['DYDB_BACKEND'] = 'local'
+
+    samples = [run_once(env) for _ in range(runs)]
+    results = [{
+        'name': name,
+        'median_ms': statistics.median(s[name] for s in samples),
+        'min_ms': min(s[name] for s in samples),
+        } for name in ('import_ms', 'first_request_ms', 'second_request_ms')]
+    return results, any(s['boto3_loaded'] for s in samples)
+
+
+def compare(results, baseline, tolerance=0.2):
+    base = {r['name']: r for r in baseline}
+    report = []
+    for r in results:
+        b = base.get(r['name'])
+        if not b:
+            continue
+        change = r['median_ms'] / b['median_ms'] - 1
+        report.append({
+            'case': r['name'],
+            'baseline': b['median_ms'],
+            'current': r['median_ms'],
+            'change': change,
+            'regressed': change > tolerance,
+            })
+    return report
+
+
+def start():
+    parser = argparse.ArgumentParser(description='Startup benchmark')
+    parser.add_argument('--runs', type=int, default=10, help='Number of fresh interpreters')
+    parser.add_argument('--endpoint', help='DynamoDB endpoint, embedded local store by default')
+    parser.add_argument('--output', help='Write JSON results to this path')
+    parser.add_argument('--compare', help='Baseline JSON results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown in comparison')
+    args = parser.parse_args()
+
+    results, boto3_loaded = run(args.runs, args.endpoint)
+    doc = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'created_ts': int(time.time()),
+            'runs': args.runs,
+            'boto3_loaded_on_import': boto3_loaded,
+            },
+        'results': results,
+        }
+
+    if args.output:
+        with open(args.output, 'w') as fd:
+            fd.write(ujson.dumps(doc, indent=2))
+
+    failed = boto3_loaded
+    if boto3_loaded:
+        print('-- [error] boto3 loaded on import', file=sys.stderr)
+
+    if not args.compare:
+        print(ujson.dumps(doc, indent=2))
+    else:
+        with open(args.compare) as fd:
+            baseline = ujson.load(fd)
+        report = compare(results, baseline['results'], args.tolerance)
+
+        print('{:<20} {:>12} {:>12} {:>8}'.format('case', 'baseline(ms)', 'current(ms)', 'change'))
+        for r in report:
+            print('{case:<20} {baseline:>12.2f} {current:>12.2f} {change:>+8.1%}{flag}'.format(\
+                    flag=' !' if r['regressed'] else '', **r))
+        failed = failed or any(r['regressed'] for r in report)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    start()
@@ -0,0 +1,78 @@
+# Core async broker selftest
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Runs against the embedded local store, reference to `fixture`
+import asyncio
+from data_model.dynamodb.common.shared import ItemID
+from data_model.dynamodb.core.aio import get_async_brk
+from data_model.dynamodb.core.broker import Attr, get_brk
+from fixture import Doc, make_docs, run
+
+
+def selftest_general():
+
+    async def main():
+        t = get_async_brk(ItemID.REPOSITORY)
+        items = [Doc()() for _ in range(10)]
+        await asyncio.gather(*[t.put(item) for item in items])
+        keys = [{'repository_id': item['repository_id']} for item in items]
+        rsp = await t._batch_get(keys)
+        assert len(rsp['Responses'][t._table_name]) == len(items)
+        await t.batch_delete(keys)
+        rsp = await t._batch_get(keys)
+        assert not rsp['Responses'][t._table_name]
+
+    asyncio.run(main())
+
+
+def selftest_iscan():
+    make_docs(30)
+
+    async def main():
+        t = get_async_brk(ItemID.REPOSITORY)
+        return [len(rsp['Items']) async for rsp in \
+                t._iscan(Attr('data_status').exists(), chunksize=7, segments=4)]
+
+    assert sum(asyncio.run(main())) == 30
+
+
+def selftest_save():
+    obj = Doc()
+    obj.data_type = Doc.DT.value
+
+    async def main():
+        await obj.asave()
+        return await Doc.arebuild(id=obj.repository_id)
+
+    objs, _ = asyncio.run(main())
+    assert [o.repository_id for o in objs] == [obj.repository_id]
+
+
+def selftest_shared_broker():
+    brk = get_brk(ItemID.REPOSITORY)
+    t = get_async_brk(ItemID.REPOSITORY)
+    assert t._brk is brk
+    assert t._brk.governor is brk.governor
+
+    # Pending puts of the write-behind buffer are seen by async reads
+    brk.enable_write_behind(max_age=60)
+    brk.put({'repository_id': 'pending', 'data_type': Doc.DT.value})
+    rsp = asyncio.run(t._get({'repository_id': 'pending'}))
+    assert rsp['Item']['repository_id'] == 'pending'
+    brk.disable_write_behind()
+
+
+def selftest_event_loops():
+    t = get_async_brk(ItemID.REPOSITORY)
+
+    async def main():
+        await asyncio.gather(*[t.put({'repository_id': 'loop-{}'.format(i)}) for i in range(20)])
+        return await t._get({'repository_id': 'loop-0'})
+
+    # Each `asyncio.run` starts a new loop
+    for _ in range(3):
+        assert asyncio.run(main())['Item']
+
+
+if __name__ == '__main__':
+    run(dict(globals()))
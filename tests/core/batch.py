@@ -0,0 +1,89 @@
+# Core batch read selftest
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Runs against the embedded local store, reference to `fixture`
+from data_model.dynamodb.core import broker
+from data_model.dynamodb.core.broker import TableBroker, get_brk
+from data_model.dynamodb.core.metrics import get_metrics
+from fixture import Doc, make_docs, run, table
+
+
+def leave_unprocessed(iid):
+    """
+    Make the local store leave key of `iid` unprocessed in every `batch_get_item`
+    """
+    client = broker.dydb.client
+    batch_get_item = client.batch_get_item
+
+    def partial(RequestItems, **kwargs):
+        left = {}
+        for name, req in RequestItems.items():
+            keys = [k for k in req['Keys'] if k.get(Doc.ID.value) == iid]
+            if keys:
+                req = dict(req, Keys=[k for k in req['Keys'] if k not in keys])
+                left[name] = {'Keys': keys}
+            RequestItems = dict(RequestItems, **{name: req})
+        rsp = batch_get_item(RequestItems, **kwargs)
+        rsp['UnprocessedKeys'] = left
+        return rsp
+    client.batch_get_item = partial
+
+
+def leave_unwritten():
+    """
+    Make the local store leave every `batch_write_item` unprocessed
+    """
+    def unwritten(RequestItems, **kwargs):
+        return {'UnprocessedItems': RequestItems}
+    broker.dydb.client.batch_write_item = unwritten
+
+
+def selftest_unprocessed():
+    # Big enough for the index query to cost less than a scan
+    docs = make_docs(5, body_size=16384)
+    iid = getattr(docs[3], Doc.ID.value)
+    leave_unprocessed(iid)
+    retries, TableBroker.MAX_RETRIES = TableBroker.MAX_RETRIES, 1
+    try:
+        objs, err_items = Doc.batch_get([{Doc.ID.value: getattr(doc, Doc.ID.value)} for doc in docs])
+        assert len(objs) == 4
+        assert [key for key, _ in err_items] == [{Doc.ID.value: iid}]
+
+        objs, err_items = Doc.rebuild(id=iid)
+        assert not objs
+        assert [key for key, _ in err_items] == [{Doc.ID.value: iid}]
+
+        # Keys from the index, records fetched for their slices
+        assert Doc.explain('delete', source_unique='doc-3').fetch
+        stats = Doc.bulk_delete(source_unique='doc-3')
+        assert stats['matched'] == 0
+        assert [key for key, _ in stats['failed']] == [{Doc.ID.value: iid}]
+        assert iid in table()._items
+    finally:
+        TableBroker.MAX_RETRIES = retries
+
+
+def selftest_retries():
+    docs = make_docs(2)
+    iid = getattr(docs[1], Doc.ID.value)
+    leave_unprocessed(iid)
+    leave_unwritten()
+    metrics = get_metrics()
+    metrics.enable()
+    metrics.reset()
+    try:
+        keys = [{Doc.ID.value: getattr(doc, Doc.ID.value)} for doc in docs]
+        get_brk(Doc.ID)._batch_get(keys, max_retries=2)
+        failed = get_brk(Doc.ID).batch_delete(keys, max_retries=3, report=True)
+        assert len(failed) == 2
+        # Unprocessed keys and items resent count as retries
+        stats = metrics.snapshot()
+        assert (stats['batch_get']['calls'], stats['batch_get']['retries']) == (3, 2), stats['batch_get']
+        assert (stats['batch_write']['calls'], stats['batch_write']['retries']) == (4, 3), stats['batch_write']
+    finally:
+        metrics.disable()
+        metrics.reset()
+
+
+if __name__ == '__main__':
+    run(dict(globals()))
@@ -0,0 +1,108 @@
+# Core write-behind selftest
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Runs against the embedded local store, reference to `fixture`
+import os
+import time
+from data_model.dynamodb.core.broker import get_brk
+from data_model.dynamodb.core.table import Table
+from fixture import Doc, make_docs, run, table
+
+
+def new_docs(count):
+    docs = []
+    for i in range(count):
+        doc = Doc()
+        doc.data_type = Doc.DT.value
+        doc.source_unique = 'buffered-{}'.format(i)
+        docs.append(doc)
+    return docs
+
+
+def stored(doc):
+    return table()._items.get(getattr(doc, Doc.ID.value))
+
+
+def selftest_coalesce():
+    buffer = Doc.enable_write_behind(max_items=100, max_age=60)
+    docs = new_docs(10)
+    for i in range(5):
+        for doc in docs:
+            doc.title = 'round {}'.format(i)
+            doc.save(full=True)
+
+    stats = buffer.stats()
+    assert stats['pending'] == 10
+    assert stats['coalesced'] == 40
+    assert not table()._items
+
+    assert not Doc.flush()
+    stats = buffer.stats()
+    assert (stats['pending'], stats['written'], stats['flushes']) == (0, 10, 1)
+    assert all(stored(doc)['title'] == 'round 4' for doc in docs)
+
+
+def selftest_flush_on_read():
+    Doc.enable_write_behind(max_items=100, max_age=60)
+    brk = get_brk(Doc.ID)
+    docs = new_docs(3)
+    for doc in docs:
+        doc.title = 'pending'
+        doc.tags = ['a']
+        doc.body = {'text': 'pending'}
+        doc.save(full=True)
+    assert not table()._items
+
+    # Reads by key see pending puts
+    iid = getattr(docs[0], Doc.ID.value)
+    obj = Doc.rebuild(id=iid)[0][0]
+    assert (obj.title, obj.body) == ('pending', {'text': 'pending'})
+    assert brk._get({Doc.ID.value: iid})['Item']['title'] == 'pending'
+    objs, _ = Doc.batch_get([{Doc.ID.value: getattr(doc, Doc.ID.value)} for doc in docs])
+    assert len(objs) == 3
+
+    # Updates apply to the pending put, deletes drop it
+    obj.title = 'updated'
+    obj.save()
+    assert brk.buffer.stats()['pending'] == 3
+    Doc.delete(id=getattr(docs[1], Doc.ID.value))
+    assert brk.buffer.stats()['pending'] == 2
+    assert not table()._items
+
+    Doc.flush()
+    assert stored(docs[0])['title'] == 'updated'
+    assert stored(docs[1]) is None
+    assert stored(docs[2])['title'] == 'pending'
+
+
+def selftest_age():
+    buffer = Doc.enable_write_behind(max_items=100, max_age=0.1)
+    docs = new_docs(4)
+    _ = [doc.save(full=True) for doc in docs]
+
+    deadline = time.time() + 5
+    while buffer.stats()['written'] < len(docs) and time.time() < deadline:
+        time.sleep(0.05)
+    assert all(stored(doc) for doc in docs)
+    assert buffer.stats()['pending'] == 0
+    assert not get_brk(Doc.ID).disable_write_behind()
+    assert get_brk(Doc.ID).buffer is None
+
+
+def selftest_replaced_slices():
+    doc = make_docs(1, body_size=900 * 1024)[0]
+    Doc.enable_write_behind(max_items=100, max_age=60)
+    obj = Doc.rebuild(id=getattr(doc, Doc.ID.value))[0][0]
+    obj.body = {'text': os.urandom(450 * 1024).hex()}
+    obj.save(full=True)
+
+    # Written through, the record never refers to slices deleted
+    pages = list(Doc.iscan(verbose=True))
+    assert sum(len(objs) for objs, _ in pages) == 1
+    assert not [err for _, errs in pages for err in errs]
+    assert stored(doc)[Table.SLICES] == obj.peek(Table.SLICES)
+    assert len([item for item in table()._items.values() if 'slice_of' in item]) == 2
+
+
+if __name__ == '__main__':
+    run(dict(globals()))
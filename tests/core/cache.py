@@ -0,0 +1,68 @@
+# Core item cache selftest
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Runs against the embedded local store, reference to `fixture`
+from data_model.dynamodb.common.codec import LazyBlob
+from data_model.dynamodb.core.broker import get_brk
+from data_model.dynamodb.core.cache import ItemCache
+from fixture import Doc, make_docs, run
+
+
+def selftest_copies():
+    Doc.enable_cache()
+    doc = make_docs(1)[0]
+    iid = getattr(doc, Doc.ID.value)
+
+    objs, _ = Doc.rebuild(id=iid)
+    objs[0].body['text'] = 'poisoned'
+    objs[0].tags.append('c')
+
+    objs, _ = Doc.rebuild(id=iid)
+    assert get_brk(Doc.ID).cache.hits == 1
+    assert type(objs[0].peek('body')) is not LazyBlob
+    assert objs[0].body == doc.body
+    assert objs[0].tags == ['a', 'b']
+
+    brk = get_brk(Doc.ID)
+    key = {Doc.ID.value: iid}
+    brk._get(key)['Item']['title'] = 'poisoned'
+    assert brk._get(key)['Item']['title'] == doc.title
+
+
+def selftest_save_invalidates():
+    Doc.enable_cache()
+    doc = make_docs(1)[0]
+    iid = getattr(doc, Doc.ID.value)
+
+    obj = Doc.rebuild(id=iid)[0][0]
+    obj.title = 'changed'
+    obj.save()
+    assert Doc.rebuild(id=iid)[0][0].title == 'changed'
+
+    Doc.batch_save([obj])
+    obj.title = 'changed again'
+    Doc.batch_save([obj])
+    assert Doc.rebuild(id=iid)[0][0].title == 'changed again'
+
+
+def selftest_stale_set():
+    cache = ItemCache()
+    token = cache.token()
+    cache.invalidate('x')
+    cache.set('item', 'x', {'v': 'stale'}, token)
+    assert cache.get('item', 'x') is None
+    assert cache.stats()['rejected'] == 1
+
+    cache.set('item', 'x', {'v': 'fresh'}, cache.token())
+    assert cache.get('item', 'x') == {'v': 'fresh'}
+    cache.set('item', 'y', {'v': 'untracked'})
+    assert cache.get('item', 'y') == {'v': 'untracked'}
+
+    token = cache.token()
+    cache.clear()
+    cache.set('item', 'z', {'v': 'stale'}, token)
+    assert cache.get('item', 'z') is None
+
+
+if __name__ == '__main__':
+    run(dict(globals()))
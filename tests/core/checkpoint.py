@@ -0,0 +1,74 @@
+# Core checkpoint selftest
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Runs against the embedded local store, reference to `fixture`
+import os
+import tempfile
+import ujson
+from data_model.dynamodb.core.broker import Attr
+from fixture import Doc, make_docs, run
+
+
+def checkpoint_path():
+    return os.path.join(tempfile.mkdtemp(), 'checkpoint.json')
+
+
+def ids(pages):
+    return [getattr(obj, Doc.ID.value) for objs, _ in pages for obj in objs]
+
+
+def selftest_resume_segments():
+    docs = make_docs(30)
+    path = checkpoint_path()
+
+    first = []
+    for objs, _ in Doc.iscan(segments=3, chunksize=4, resume_from=path, checkpoint_interval=0):
+        first.extend(getattr(obj, Doc.ID.value) for obj in objs)
+        if len(first) >= 8:
+            break
+
+    with open(path) as fd:
+        saved = ujson.load(fd)
+    assert saved['segments'] == 3
+    assert saved['plan']['path'] == 'scan'
+
+    # Segments and path are taken from the checkpoint
+    rest = ids(Doc.iscan(chunksize=4, resume_from=path))
+    assert set(first) | set(rest) == {getattr(doc, Doc.ID.value) for doc in docs}
+    assert len(first) + len(rest) < 30 + 3 * 4
+    assert not ids(Doc.iscan(resume_from=path))
+
+
+def selftest_resume_query():
+    docs = make_docs(20)
+    path = checkpoint_path()
+
+    first = []
+    for objs, _ in Doc.iscan(chunksize=5, resume_from=path, checkpoint_interval=0):
+        first.extend(getattr(obj, Doc.ID.value) for obj in objs)
+        break
+
+    with open(path) as fd:
+        assert ujson.load(fd)['plan']['path'] == 'query'
+    rest = ids(Doc.iscan(chunksize=5, resume_from=path))
+    assert set(first) | set(rest) == {getattr(doc, Doc.ID.value) for doc in docs}
+
+
+def selftest_mismatch():
+    make_docs(10)
+    path = checkpoint_path()
+    for _ in Doc.iscan(chunksize=2, filter_expr=Attr('title').eq('title 1'), \
+            resume_from=path, checkpoint_interval=0):
+        break
+
+    for kwargs in ({'filter_expr': Attr('title').eq('title 2')}, {}, {'segments': 2}):
+        try:
+            list(Doc.iscan(chunksize=2, resume_from=path, **kwargs))
+            assert False, "resumed with {}".format(kwargs)
+        except ValueError:
+            pass
+    assert ids(Doc.iscan(chunksize=2, filter_expr=Attr('title').eq('title 1'), resume_from=path))
+
+
+if __name__ == '__main__':
+    run(dict(globals()))
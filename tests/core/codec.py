@@ -0,0 +1,36 @@
+# Core codec selftest
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Runs against the embedded local store, reference to `fixture`
+from data_model.dynamodb.common.codec import decode, encode
+from fixture import Doc, make_docs, run
+
+
+class Pickled(Doc):
+
+    _field_codecs = {'body': 'pickle'}
+
+
+def selftest_unsafe():
+    blob = encode({'a': 1}, 'pickle')
+    try:
+        decode(blob)
+        assert False, "pickle decoded without allowed"
+    except ValueError:
+        pass
+    assert decode(blob, ('pickle',)) == {'a': 1}
+    assert decode(encode({'a': 1}, 'zlib3')) == {'a': 1}
+
+    doc = make_docs(1, Pickled)[0]
+    iid = getattr(doc, Doc.ID.value)
+    for lazy in (False, True):
+        objs, _ = Pickled.rebuild(id=iid, lazy=lazy)
+        assert objs[0].body == doc.body
+
+    # Pickled blobs read by a class not configured for it are refused
+    objs, errs = Doc.rebuild(id=iid)
+    assert not objs and isinstance(errs[0][1], ValueError), (objs, errs)
+
+
+if __name__ == '__main__':
+    run(dict(globals()))
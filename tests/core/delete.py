@@ -0,0 +1,73 @@
+# Core bulk delete selftest
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Runs against the embedded local store, reference to `fixture`
+from data_model.dynamodb.core.broker import Attr
+from data_model.dynamodb.core.table import Table
+from fixture import Doc, Other, make_docs, run, table
+
+
+def slices_left():
+    return [item for item in table()._items.values() if 'slice_of' in item]
+
+
+def selftest_slices():
+    small = make_docs(5)
+    # Over the item size limit, bodies are sliced
+    big = make_docs(2, body_size=900 * 1024, prefix='big')
+    slices = len(slices_left())
+    assert slices >= 4
+    assert all(doc.peek(Table.SLICES) for doc in big)
+
+    stats = Doc.bulk_delete(filter_expr=Attr('source_unique').begins_with('big'), chunksize=3, workers=2)
+    assert stats['matched'] == 2
+    assert stats['deleted'] == 2 + slices
+    assert not stats['failed']
+    assert not slices_left()
+    assert len(table()._items) == len(small)
+    assert all(Doc.rebuild(id=getattr(doc, Doc.ID.value))[0] for doc in small)
+
+
+def selftest_by_id():
+    small = make_docs(2)
+    big = make_docs(2, body_size=900 * 1024, prefix='big')
+    Doc.delete(id=getattr(big[0], Doc.ID.value))
+    assert {item.get('slice_of') for item in slices_left()} == {getattr(big[1], Doc.ID.value)}
+
+    # Slices of a pending put go with it
+    Doc.enable_write_behind(max_items=100, max_age=60)
+    obj = Doc.rebuild(id=getattr(big[1], Doc.ID.value))[0][0]
+    obj.title = 'pending'
+    obj.save(full=True)
+    Doc.delete(id=getattr(obj, Doc.ID.value))
+    Doc.delete(id=getattr(small[0], Doc.ID.value))
+    Doc.flush()
+    assert not slices_left()
+    assert list(table()._items) == [getattr(small[1], Doc.ID.value)]
+
+
+def selftest_streamed():
+    make_docs(10)
+    counts = {}
+    keys = Doc.delete_keys(counts=counts, chunksize=2)
+    # Keys come page by page as they are consumed
+    next(keys)
+    assert counts['matched'] == 1
+    assert len(list(keys)) == 9
+    assert counts == {'matched': 10, 'keys': 10, 'failed': []}
+    assert len(table()._items) == 10
+
+
+def selftest_scan_segments():
+    docs = make_docs(5)
+    make_docs(12, cls=Other, prefix='other', body_size=900 * 1024)
+    assert slices_left()
+    stats = Other.bulk_delete(segments=3, chunksize=4, capacity_fraction=0.5)
+    assert stats['matched'] == 12
+    assert not stats['failed']
+    assert not slices_left()
+    assert sorted(item['data_type'] for item in table()._items.values()) == [Doc.DT.value] * len(docs)
+
+
+if __name__ == '__main__':
+    run(dict(globals()))
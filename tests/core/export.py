@@ -0,0 +1,41 @@
+# Core export and load selftest
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Runs against the embedded local store, reference to `fixture`
+import tempfile
+from data_model.dynamodb.core.broker import get_brk
+from fixture import Doc, install, make_docs, run, table
+
+
+def value(item, name):
+    val = item.get(name)
+    return bytes(getattr(val, 'value', val)) if val is not None else None
+
+
+def selftest_raw_binary():
+    for fmt in ('ndjson', 'columnar'):
+        install()
+        docs = make_docs(3) + make_docs(1, body_size=900 * 1024, prefix='big')
+        brk = get_brk(Doc.ID)
+        iid = getattr(docs[0], Doc.ID.value)
+        item = dict(brk._get({Doc.ID.value: iid})['Item'], thumb=b'\x00\xffthumb')
+        brk.put(item)
+        before = {k: dict(v) for k, v in table()._items.items() if 'slice_of' not in v}
+
+        path = tempfile.mkdtemp()
+        manifest = Doc.export(path, raw=True, format=fmt)
+        assert (manifest['rows'], manifest['errors'], manifest['sliced']) == (4, 0, 1)
+
+        install()
+        stats = Doc.bulk_load([path], parse_pool=None)
+        assert (stats['written'], stats['failed']) == (4, 0), stats
+        item = table()._items[iid]
+        # Binary attributes other than fat fields come back binary
+        assert value(item, 'thumb') == b'\x00\xffthumb'
+        assert value(item, 'body') == value(before[iid], 'body')
+        for doc in docs:
+            assert Doc.rebuild(id=getattr(doc, Doc.ID.value))[0][0].body == doc.body
+
+
+if __name__ == '__main__':
+    run(dict(globals()))
@@ -0,0 +1,93 @@
+# Core selftest fixture
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Selftests run against the embedded local store, each one on a fresh
+# store with brokers, governors and planner statistics dropped
+#
+#   python tests/core/planner.py
+import os
+from enum import Enum, unique
+from data_model.dynamodb.core import broker, planner
+from data_model.dynamodb.core.broker import TableBroker
+from data_model.dynamodb.core.local import LocalResource
+from data_model.dynamodb.core.table import Repository
+
+
+@unique
+class DocType(Enum):
+    DOC = 'SELFTEST_DOC'
+    OTHER = 'SELFTEST_OTHER'
+
+
+class Doc(Repository):
+
+    DT = DocType.DOC
+
+    __slots__ = [
+        'title',
+        'tags',
+        'body',
+    ]
+
+    _fat_fields = ('body',)
+
+
+class Other(Doc):
+
+    DT = DocType.OTHER
+
+
+def install(indexes=None):
+    """
+    Point all brokers at a fresh local store
+
+    Args:
+    indexes: `dict` maps table names to names of indexes described,
+            reference to `LocalResource`
+
+    @return `LocalTable` of `Doc`
+    """
+    hash_keys = {v.value:k.value for k, v in TableBroker.ITEMID_TABLETYPE.items()}
+    for name, brk in list(broker.__dict__.items()):
+        if name.startswith('{}:'.format(TableBroker.name)) and brk.buffer:
+            brk.disable_write_behind()
+    broker.dydb = LocalResource(hash_keys, indexes=indexes)
+    prefixes = ('{}:'.format(TableBroker.name), 'Governor:')
+    _ = [broker.__dict__.pop(k) for k in list(broker.__dict__) if k.startswith(prefixes)]
+    _ = [planner.__dict__.pop(k) for k in list(planner.__dict__) if k.startswith('stats:')]
+    return table()
+
+
+def table():
+    return broker.dydb.Table(TableBroker.ITEMID_TABLETYPE[Doc.ID].value)
+
+
+def make_docs(count, cls=Doc, body_size=16, prefix='doc'):
+    """
+    Save `count` new objects of `cls`, bodies of `body_size` random bytes in hex
+
+    @return List of objects saved
+    """
+    docs = []
+    for i in range(count):
+        doc = cls()
+        doc.data_type = cls.DT.value
+        doc.source_unique = '{}-{}'.format(prefix, i)
+        doc.title = 'title {}'.format(i)
+        doc.tags = ['a', 'b']
+        doc.body = {'i': i, 'text': os.urandom(body_size // 2).hex()}
+        docs.append(doc)
+    saved, failed = cls.batch_save(docs)
+    assert not failed, failed
+    return docs
+
+
+def run(scope):
+    """
+    Run all `selftest_` functions in `scope`, each on a fresh store
+    """
+    for name, fn in list(scope.items()):
+        if name.startswith('selftest_') and callable(fn):
+            install()
+            fn()
+            print("++ [{}] ok".format(name))
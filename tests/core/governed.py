@@ -0,0 +1,66 @@
+# Core governed block selftest
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Runs against the embedded local store, reference to `fixture`
+import threading
+from data_model.dynamodb.core.broker import get_brk, get_io_executor
+from data_model.dynamodb.common.utils import get_thread_cache
+from fixture import Doc, make_docs, run
+
+
+def selftest_scoped():
+    brk = get_brk(Doc.ID)
+    shared = brk.governor
+    entered, leave = [threading.Event() for _ in range(2)], [threading.Event() for _ in range(2)]
+    seen = {}
+
+    def block(i):
+        with brk.governed(fraction=0.5, rcu=100, wcu=100) as gov:
+            seen[i] = (gov, brk.current_governor(), \
+                    get_io_executor(2).submit(brk.current_governor).result(), \
+                    get_thread_cache().submit(brk.current_governor).result())
+            entered[i].set()
+            leave[i].wait(5)
+
+    threads = [threading.Thread(target=block, args=(i,)) for i in range(2)]
+    _ = [t.start() for t in threads]
+    _ = [e.wait(5) for e in entered]
+    # Calls outside the blocks keep the shared governor
+    assert brk.current_governor() is shared
+
+    # Blocks exit in the order they did not enter
+    leave[1].set()
+    threads[1].join()
+    leave[0].set()
+    threads[0].join()
+
+    assert seen[0][0] is not seen[1][0]
+    assert all(len({id(g) for g in govs}) == 1 for govs in seen.values())
+    assert brk.governor is shared and brk.current_governor() is shared
+
+
+def selftest_bulk():
+    make_docs(20)
+    brk = get_brk(Doc.ID)
+    shared, new_governor, ops = brk.governor, brk.new_governor, []
+
+    def counted(**kwargs):
+        gov = new_governor(**kwargs)
+        acquire = gov.acquire
+
+        def acquired(kind, op, count=1):
+            ops.append(op)
+            return acquire(kind, op, count)
+        gov.acquire = acquired
+        return gov
+    brk.new_governor = counted
+
+    # Scanned by segment workers, deleted by batch writers, all paced by the block
+    stats = Doc.bulk_delete(segments=2, capacity_fraction=0.5)
+    assert stats['matched'] == 20 and not stats['failed']
+    assert {'scan', 'batch_write'} <= set(ops), ops
+    assert brk.current_governor() is shared
+
+
+if __name__ == '__main__':
+    run(dict(globals()))
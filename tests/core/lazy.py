@@ -0,0 +1,36 @@
+# Core lazy decode selftest
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Runs against the embedded local store, reference to `fixture`
+import pickle
+from data_model.dynamodb.common.codec import LazyBlob
+from data_model.dynamodb.core.broker import Key
+from fixture import Doc, make_docs, run
+
+
+def selftest_pages():
+    docs = {doc.source_unique: doc for doc in make_docs(5)}
+
+    # Pages are lazy by default, fat fields decoded on first access
+    objs = [obj for page, _ in Doc.iscan(chunksize=2) for obj in page]
+    assert len(objs) == 5
+    assert all(type(obj.peek('body')) is LazyBlob for obj in objs)
+    assert all(obj.body == docs[obj.source_unique].body for obj in objs)
+    # Pickled decoded, as the table class
+    obj = pickle.loads(pickle.dumps(objs[0]))
+    assert type(obj) is Doc and obj.peek('body') == objs[0].body
+
+    objs = [obj for page, _ in Doc.iquery(cond=Key('data_type').eq(Doc.DT.value), verbose=True) \
+            for obj in page]
+    assert all(type(obj.peek('body')) is LazyBlob for obj in objs)
+
+    objs = [obj for page, _ in Doc.iscan(lazy=False, decode_pool='thread') for obj in page]
+    assert all(type(obj) is Doc and type(obj.peek('body')) is dict for obj in objs)
+
+    # Reads by key are decoded
+    obj = Doc.rebuild(id=getattr(objs[0], Doc.ID.value))[0][0]
+    assert type(obj) is Doc and type(obj.peek('body')) is dict
+
+
+if __name__ == '__main__':
+    run(dict(globals()))
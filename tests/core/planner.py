@@ -0,0 +1,111 @@
+# Core query planner selftest
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Runs against the embedded local store, reference to `fixture`
+from botocore.exceptions import ClientError
+from data_model.dynamodb.common.shared import GSI
+from data_model.dynamodb.core.broker import Attr, Key, TableBroker
+from data_model.dynamodb.core.local import LocalResource, LocalTable
+from data_model.dynamodb.core.planner import table_stats
+from fixture import Doc, install, make_docs, run
+
+
+def iid(doc):
+    return getattr(doc, Doc.ID.value)
+
+
+def selftest_get():
+    doc = make_docs(3)[1]
+    p = Doc.explain('rebuild', id=iid(doc))
+    assert p.path == 'get'
+    assert p.key == {Doc.ID.value: iid(doc)}
+
+    # Filtered, a query of the key
+    p = Doc.explain('rebuild', id=iid(doc), filter_expr=Attr('title').eq('title 1'))
+    assert (p.path, p.index, p.fetch) == ('query', None, False)
+    objs, _ = Doc.rebuild(id=iid(doc), filter_expr=Attr('title').eq('title 1'))
+    assert [iid(o) for o in objs] == [iid(doc)]
+    assert not Doc.rebuild(id=iid(doc), filter_expr=Attr('title').eq('title 2'))[0]
+
+
+def selftest_source_unique():
+    # Big enough for a scan to cost more than the query and fetch
+    docs = make_docs(5, body_size=16384)
+    p = Doc.explain('rebuild', source_unique='doc-2')
+    assert (p.path, p.index) == ('query', GSI.SOURCE_UNIQUE.value)
+    assert iid(Doc.rebuild(source_unique='doc-2')[0][0]) == iid(docs[2])
+
+    p = Doc.explain('rebuild', source_unique='doc-2', filter_expr=Attr('title').eq('title 2'))
+    assert p.path == 'scan'
+    assert [iid(o) for o in Doc.rebuild(source_unique='doc-2', \
+            filter_expr=Attr('title').eq('title 2'))[0]] == [iid(docs[2])]
+    assert not Doc.rebuild(source_unique='doc-2', filter_expr=Attr('title').eq('title 3'))[0]
+
+    assert Doc.explain('iscan', segments=2).path == 'scan'
+    assert Doc.explain('iscan', path='scan').path == 'scan'
+
+
+def selftest_missing_index():
+    install(indexes={})
+    docs = make_docs(5, body_size=16384)
+    p = Doc.explain('rebuild', source_unique='doc-2')
+    assert p.path == 'scan'
+    assert 'no index on source_unique' in p.notes
+    assert iid(Doc.rebuild(source_unique='doc-2')[0][0]) == iid(docs[2])
+    assert Doc.explain('iscan').path == 'scan'
+    assert len([o for page, _ in Doc.iscan() for o in page]) == 5
+
+    try:
+        Doc.explain('iquery', cond=Key('data_type').eq(Doc.DT.value), ind=GSI.DATA_TYPE.value)
+        assert False, "planned onto a missing index"
+    except ValueError:
+        pass
+
+
+def selftest_stats():
+    make_docs(4)
+    brk = TableBroker(TableBroker.ITEMID_TABLETYPE[Doc.ID].value)
+    count, avg, names = table_stats(brk)
+    assert count == 4 and avg > 0
+    assert names == {GSI.SOURCE_UNIQUE.value, GSI.DATA_TYPE.value}
+
+    class Broker(object):
+        def __init__(self, name, error=None):
+            self._table_name = name
+            self.error = error
+
+        @property
+        def _table(self):
+            if self.error:
+                raise ClientError({'Error': {'Code': self.error, 'Message': ''}}, 'DescribeTable')
+            return LocalResource({}).Table(self._table_name)
+
+    assert table_stats(Broker('SELFTEST_MISSING')) == (None, None, set())
+    assert table_stats(Broker('SELFTEST_THROTTLED', 'ThrottlingException')) == (None, None, None)
+
+
+def selftest_denied():
+    docs = make_docs(5)
+    calls, item_count = [], LocalTable.item_count
+
+    def denied(table):
+        calls.append(table.name)
+        raise ClientError({'Error': {'Code': 'AccessDeniedException', 'Message': ''}}, 'DescribeTable')
+    LocalTable.item_count = property(denied)
+    try:
+        # Keyed reads never describe the table
+        assert iid(Doc.rebuild(id=iid(docs[1]))[0][0]) == iid(docs[1])
+        assert Doc.explain('rebuild', id=iid(docs[1]), filter_expr=Attr('title').eq('title 1')).path == 'query'
+        assert not calls
+
+        # Registered indexes are taken, the failure is not tried again at once
+        p = Doc.explain('rebuild', source_unique='doc-2')
+        assert (p.path, p.index, p.cost) == ('query', GSI.SOURCE_UNIQUE.value, None)
+        assert iid(Doc.rebuild(source_unique='doc-2')[0][0]) == iid(docs[2])
+        assert len([o for page, _ in Doc.iscan() for o in page]) == 5
+        assert len(calls) == 1
+    finally:
+        LocalTable.item_count = item_count
+
+if __name__ == '__main__':
+    run(dict(globals()))
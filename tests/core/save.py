@@ -0,0 +1,116 @@
+# Core partial save selftest
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Runs against the embedded local store, reference to `fixture`
+from data_model.dynamodb.core import table as table_module
+from data_model.dynamodb.core.broker import get_brk
+from data_model.dynamodb.core.governor import error_code
+from data_model.dynamodb.core.table import Repository
+from fixture import Doc, DocType, make_docs, run
+
+
+class Pair(Repository):
+
+    DT = DocType.OTHER
+
+    __slots__ = [
+        'body',
+        'notes',
+    ]
+
+    _fat_fields = ('body', 'notes')
+
+
+def rebuild(doc):
+    return Doc.rebuild(id=getattr(doc, Doc.ID.value))[0]
+
+
+def selftest_partial():
+    doc = make_docs(1)[0]
+    mine, theirs = rebuild(doc)[0], rebuild(doc)[0]
+
+    theirs.title = 'theirs'
+    theirs.save()
+    mine.source = 'mine'
+    mine.save()
+
+    obj = rebuild(doc)[0]
+    assert obj.title == 'theirs'
+    assert obj.source == 'mine'
+
+
+def selftest_in_place():
+    doc = make_docs(1)[0]
+    obj = rebuild(doc)[0]
+    obj.tags.append('c')
+    obj.body['text'] = 'changed'
+    assert obj.changed_in_place() == {'tags', 'body'}
+    obj.save()
+    assert not obj.changed_in_place()
+
+    obj = rebuild(doc)[0]
+    assert obj.tags == ['a', 'b', 'c']
+    assert obj.body['text'] == 'changed'
+
+    obj = [o for page, _ in Doc.iscan(lazy=True) for o in page][0]
+    obj.body['i'] = -1
+    obj.save()
+    assert rebuild(doc)[0].body['i'] == -1
+
+
+def selftest_noop():
+    doc = make_docs(1)[0]
+    obj = rebuild(doc)[0]
+    obj.body
+    Doc.delete(id=getattr(doc, Doc.ID.value))
+
+    # Nothing modified, nothing written
+    obj.save()
+    assert not rebuild(doc)
+
+
+def selftest_deleted():
+    doc = make_docs(1)[0]
+    obj = rebuild(doc)[0]
+    Doc.delete(id=getattr(doc, Doc.ID.value))
+
+    obj.title = 'zombie'
+    try:
+        obj.save()
+        assert False, "saved a deleted record"
+    except Exception as ex:
+        assert error_code(ex) == 'ConditionalCheckFailedException', ex
+    assert not rebuild(doc)
+    assert not get_brk(Doc.ID)._get({Doc.ID.value: getattr(doc, Doc.ID.value)}).get('Item')
+
+
+def selftest_sizes():
+    obj = Pair()
+    obj.data_type = Pair.DT.value
+    obj.body = {'text': 'body'}
+    obj.notes = {'text': 'notes ' * 100}
+    obj.save()
+    obj = Pair.rebuild(id=getattr(obj, Pair.ID.value))[0][0]
+
+    calls, encode = [], table_module.encode
+
+    def counted(val, *args, **kwargs):
+        calls.append(val)
+        return encode(val, *args, **kwargs)
+    table_module.encode = counted
+    try:
+        # Only the field changed is encoded, others are sized as built
+        obj.body = {'text': 'changed'}
+        obj.save()
+        assert calls == [{'text': 'changed'}]
+        obj.body = {'text': 'again'}
+        obj.save()
+        assert len(calls) == 2
+    finally:
+        table_module.encode = encode
+    obj = Pair.rebuild(id=getattr(obj, Pair.ID.value))[0][0]
+    assert (obj.body, obj.notes) == ({'text': 'again'}, {'text': 'notes ' * 100})
+
+
+if __name__ == '__main__':
+    run(dict(globals()))
@@ -0,0 +1,58 @@
+# Core thread reuse selftest
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Runs against the embedded local store, reference to `fixture`
+import threading
+import time
+from data_model.dynamodb.common.utils import ThreadCache
+from data_model.dynamodb.core.broker import Key
+from fixture import Doc, make_docs, run
+
+
+def selftest_cache():
+    cache = ThreadCache(idle=0.2)
+    idents = {cache.submit(threading.get_ident).result() for _ in range(20)}
+    assert len(idents) == 1
+
+    # Blocking tasks each take a thread of their own
+    started, release = [], threading.Event()
+
+    def blocked(i):
+        started.append(i)
+        return release.wait(5)
+    futs = [cache.submit(blocked, i) for i in range(10)]
+    deadline = time.time() + 5
+    while len(started) < 10 and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(started) == 10
+    release.set()
+    assert all(fut.result() for fut in futs)
+
+    try:
+        cache.submit(int, 'x').result()
+        assert False, "exception not raised"
+    except ValueError:
+        pass
+
+    # Idle threads exit, new tasks start new ones
+    time.sleep(0.5)
+    assert cache.submit(sum, [1, 2]).result() == 3
+
+
+def selftest_pages():
+    make_docs(40)
+    cond = Key('data_type').eq(Doc.DT.value)
+    list(Doc.iquery(cond=cond, verbose=True, chunksize=5))
+    list(Doc.iscan(segments=4, chunksize=5))
+    threads = threading.active_count()
+
+    for _ in range(10):
+        assert sum(len(objs) for objs, _ in Doc.iquery(cond=cond, verbose=True, chunksize=5)) == 40
+        assert sum(len(objs) for objs, _ in Doc.iscan(segments=4, chunksize=5)) == 40
+    # Threads of prefetch, builds and segments are reused, a few may be
+    # started while others are about to turn idle
+    assert threading.active_count() <= threads + 4
+
+
+if __name__ == '__main__':
+    run(dict(globals()))
@@ -0,0 +1,72 @@
+# Core unique insert selftest
+# Author: Zex Li <top_zlynch@yahoo.com>
+#
+# Runs against the embedded local store, reference to `fixture`
+import uuid
+from data_model.dynamodb.common.bloom import BloomFilter, KnownSet
+from data_model.dynamodb.core.broker import get_brk
+from fixture import Doc, make_docs, run, table
+
+
+def new_items(prefix, count):
+    return [{Doc.ID.value: uuid.uuid4().hex, 'data_type': Doc.DT.value, \
+            'source_unique': '{}-{}'.format(prefix, i)} for i in range(count)]
+
+
+def count_lookups(brk):
+    """
+    Count `item_exists` calls of `brk`
+    """
+    calls, item_exists = [], brk.item_exists
+
+    def counted(su):
+        calls.append(su)
+        return item_exists(su)
+    brk.item_exists = counted
+    return calls
+
+
+def selftest_bloom():
+    make_docs(50)
+    brk = get_brk(Doc.ID)
+    calls = count_lookups(brk)
+    known = BloomFilter(capacity=1000)
+    known.update('doc-{}'.format(i) for i in range(50))
+
+    # Duplicates under new ids, hits are confirmed, misses are not looked up
+    written, failed = brk.uniq_batch_put(new_items('doc', 50) + new_items('new', 50), known=known)
+    assert not failed
+    assert sorted(item['source_unique'] for item in written) == sorted('new-{}'.format(i) for i in range(50))
+    assert len(calls) == 50
+    assert len(table()._items) == 100
+    assert all('new-{}'.format(i) in known for i in range(50))
+
+
+def selftest_known_set():
+    make_docs(10)
+    brk = get_brk(Doc.ID)
+    calls = count_lookups(brk)
+    known = KnownSet('doc-{}'.format(i) for i in range(10))
+    items = new_items('doc', 10) + new_items('new', 5) + new_items('new', 5)
+
+    written, failed = brk.uniq_batch_put(items, known=known)
+    assert (len(written), failed, calls) == (5, [], [])
+    assert len(table()._items) == 15
+
+
+def selftest_incomplete():
+    make_docs(10)
+    brk = get_brk(Doc.ID)
+    calls = count_lookups(brk)
+
+    # Values of this call only, misses are checked against table
+    written, failed = brk.uniq_batch_put(new_items('doc', 10) + new_items('new', 5), \
+            known=KnownSet(), complete=False)
+    assert (len(written), failed, len(calls)) == (5, [], 15)
+    written, failed = brk.uniq_batch_put(new_items('doc', 10))
+    assert (written, failed, len(calls)) == ([], [], 25)
+    assert len(table()._items) == 15
+
+
+if __name__ == '__main__':
+    run(dict(globals()))